@@ -0,0 +1,220 @@
+import threading
+import time
+from array import array
+from typing import Callable, Optional
+
+
+OP_PRESS = 1
+OP_RELEASE = 2
+OP_BATCH_END = 4
+
+POLICY_BLOCK = "block"
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_COALESCE = "coalesce"
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_COALESCE)
+
+_RECORD_WIDTH = 4  # seq, op, key code, enqueue time (ns)
+
+KEY_NAMES: list[str] = []
+_KEY_CODES: dict[str, int] = {}
+_KEY_CODES_LOCK = threading.Lock()
+
+
+def key_code(key: str) -> int:
+    code = _KEY_CODES.get(key)
+    if code is None:
+        # Scripts are compiled on the event loop and on the playlist preload thread
+        with _KEY_CODES_LOCK:
+            code = _KEY_CODES.get(key)
+            if code is None:
+                code = len(KEY_NAMES)
+                KEY_NAMES.append(key)
+                _KEY_CODES[key] = code
+    return code
+
+
+def coalesce_actions(actions: list) -> list:
+    """Keep only the last action on each key, in the order those last actions came.
+
+    A press that is released again within the batch collapses to its
+    release, and a release followed by a re-press to the press, so the keys
+    end up in the state the full batch would leave them in with fewer
+    records. The taps that cancel out are not heard.
+    """
+    last = {}
+    for position, (_, code) in enumerate(actions):
+        last[code] = position
+    return [action for position, action in enumerate(actions) if last[action[1]] == position]
+
+
+class ActionRing:
+    """Preallocated single-producer/single-consumer ring of key actions.
+
+    Each record is four ints in one flat ``array('q')``: a sequence number,
+    the op (press/release, with ``OP_BATCH_END`` on the last record of a
+    batch), the key code and the enqueue timestamp. The producer only
+    writes ``_head`` and the consumer only writes ``_tail``, so neither
+    side takes a lock on the hot path. Records overwritten under
+    ``drop_oldest`` are detected by their sequence number and skipped.
+    """
+
+    def __init__(self, capacity: int = 4096, policy: str = POLICY_BLOCK):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}'")
+        self.capacity = capacity
+        self.policy = policy
+        self._records = array("q", bytes(8 * _RECORD_WIDTH * capacity))
+        for slot in range(capacity):
+            self._records[slot * _RECORD_WIDTH] = -1
+        self._head = 0
+        self._tail = 0
+        self._consumer_waiting = False
+        self._producer_waiting = False
+        self._not_empty = threading.Event()
+        self._not_full = threading.Event()
+
+        self.high_water = 0
+        self.overruns = 0
+        self.coalesced = 0
+        self.blocked = 0
+
+    def __len__(self) -> int:
+        return max(0, min(self._head - self._tail, self.capacity))
+
+    def push_batch(self, actions: list, enqueued_ns: Optional[int] = None,
+                   cancelled: Optional[Callable[[], bool]] = None) -> bool:
+        """Publish ``actions`` (a list of ``(op, key_code)``) as one batch.
+
+        Under the ``block`` policy the producer waits for room; it gives the
+        batch up (counted in ``overruns``) once ``cancelled()`` returns True.
+        Returns False when the batch, or any slice of one larger than the
+        ring, was given up.
+        """
+        if not actions:
+            return True
+        if enqueued_ns is None:
+            enqueued_ns = time.perf_counter_ns()
+
+        if len(actions) > self.capacity:
+            pushed = True
+            for offset in range(0, len(actions), self.capacity):
+                pushed = self.push_batch(actions[offset:offset + self.capacity], enqueued_ns, cancelled) and pushed
+            return pushed
+
+        if self.capacity - (self._head - self._tail) < len(actions):
+            actions = self._apply_backpressure(actions, cancelled)
+            if not actions:
+                return False
+
+        records = self._records
+        head = self._head
+        last = len(actions) - 1
+        for position, (op, code) in enumerate(actions):
+            base = (head % self.capacity) * _RECORD_WIDTH
+            records[base] = -1
+            records[base + 1] = op | OP_BATCH_END if position == last else op
+            records[base + 2] = code
+            records[base + 3] = enqueued_ns
+            records[base] = head
+            head += 1
+        self._head = head
+
+        depth = head - self._tail
+        if depth > self.high_water:
+            self.high_water = min(depth, self.capacity)
+        if self._consumer_waiting:
+            self._not_empty.set()
+        return True
+
+    def _apply_backpressure(self, actions: list, cancelled: Optional[Callable[[], bool]]) -> list:
+        if self.policy == POLICY_COALESCE:
+            kept = coalesce_actions(actions)
+            self.coalesced += len(actions) - len(kept)
+            actions = kept
+            if self.capacity - (self._head - self._tail) >= len(actions):
+                return actions
+        elif self.policy == POLICY_DROP_OLDEST:
+            free = self.capacity - min(self._head - self._tail, self.capacity)
+            self.overruns += len(actions) - free
+            return actions
+
+        self.blocked += 1
+        while self.capacity - (self._head - self._tail) < len(actions):
+            if cancelled is not None and cancelled():
+                self.overruns += len(actions)
+                actions = []
+                break
+            self._producer_waiting = True
+            if self.capacity - (self._head - self._tail) >= len(actions):
+                break
+            self._not_full.wait(0.01)
+            self._not_full.clear()
+        self._producer_waiting = False
+        return actions
+
+    def pop_batch(self, timeout: Optional[float] = None) -> tuple[int, list, bool]:
+        """Return ``(enqueued_ns, actions, truncated)`` for the next batch.
+
+        ``truncated`` is set when records of the batch were overwritten
+        before they could be read. Returns ``(0, [], False)`` on timeout.
+        """
+        records = self._records
+        actions = []
+        enqueued_ns = 0
+        truncated = False
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            tail = self._tail
+            head = self._head
+            if tail >= head:
+                if actions:
+                    # The rest of this batch was dropped.
+                    return enqueued_ns, actions, True
+                if deadline is not None and time.monotonic() >= deadline:
+                    return 0, actions, False
+                self._consumer_waiting = True
+                if self._head <= self._tail:
+                    self._not_empty.wait(0.05)
+                    self._not_empty.clear()
+                self._consumer_waiting = False
+                continue
+
+            if head - tail > self.capacity:
+                self._tail = head - self.capacity
+                if actions:
+                    return enqueued_ns, actions, True
+                truncated = True
+                continue
+
+            base = (tail % self.capacity) * _RECORD_WIDTH
+            seq = records[base]
+            op = records[base + 1]
+            code = records[base + 2]
+            stamp = records[base + 3]
+            self._tail = tail + 1
+            if self._producer_waiting:
+                self._not_full.set()
+
+            if seq != tail or records[base] != seq:
+                if actions:
+                    return enqueued_ns, actions, True
+                truncated = True
+                continue
+
+            if not actions:
+                enqueued_ns = stamp
+            actions.append((op & ~OP_BATCH_END, code))
+            if op & OP_BATCH_END:
+                return enqueued_ns, actions, truncated
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "policy": self.policy,
+            "depth": len(self),
+            "high_water": self.high_water,
+            "overruns": self.overruns,
+            "coalesced": self.coalesced,
+            "blocked": self.blocked,
+        }
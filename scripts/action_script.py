@@ -0,0 +1,383 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from action_ring import KEY_NAMES, OP_PRESS, OP_RELEASE, key_code
+from midi_timeline import EVENT_NOTE_ON, EVENT_NOTE_OFF, EVENT_CONTROL_CHANGE, SUSTAIN_CONTROL
+
+
+ACTION_SCRIPT_VERSION = 1
+SNAPSHOT_INTERVAL = 256
+
+MODIFIER_KEYS = ("shift", "ctrl", "alt")
+MODIFIER_CODES = frozenset(key_code(key) for key in MODIFIER_KEYS)
+
+_MAGIC = b"RACT"
+_BYTE_ORDER = 0 if sys.byteorder == "little" else 1
+# magic, version, byte order, content hash, settings digest, events, actions, key table bytes
+_HEADER = struct.Struct("=4sHBx64s64sIII")
+_OP_SHIFT = 12
+_KEY_MASK = (1 << _OP_SHIFT) - 1
+
+
+def coalesce_modifier_envelopes(actions: list) -> list:
+    """Drop modifier releases that are immediately re-pressed.
+
+    A chord of shifted keys lowers to ``press shift, tap a, release shift,
+    press shift, tap b, release shift``; this keeps one shared envelope.
+    """
+    result = []
+    for action in actions:
+        if (result and action[0] == OP_PRESS and action[1] in MODIFIER_CODES
+                and result[-1] == (OP_RELEASE, action[1])):
+            result.pop()
+            continue
+        result.append(action)
+    return result
+
+
+def chord_order(lowered: list, start: int, end: int) -> list:
+    """Order a same-timestamp batch so note-ons sharing modifiers are adjacent.
+
+    Only runs of consecutive key presses are reordered; note-offs and
+    pedal changes keep their position relative to them.
+    """
+    order = []
+    run = []
+    for index in range(start, end):
+        if lowered[index] is not None:
+            run.append(index)
+            continue
+        if run:
+            run.sort(key=lambda i: lowered[i][1])
+            order.extend(run)
+            run = []
+        order.append(index)
+    if run:
+        run.sort(key=lambda i: lowered[i][1])
+        order.extend(run)
+    return order
+
+
+def settings_digest(settings: dict) -> str:
+    payload = json.dumps({"version": ACTION_SCRIPT_VERSION, **settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def script_path(file_path: str, digest: str) -> str:
+    return f"{file_path}.{digest[:16]}.actions"
+
+
+class ActionScript:
+    """Every key action of one file under one set of mapping settings.
+
+    ``actions`` holds ``op << 12 | key`` entries, where ``key`` indexes
+    ``key_names``; the actions of timeline event ``i`` are
+    ``actions[offsets[i]:offsets[i + 1]]`` (all actions of a same-timestamp
+    batch sit on its first event). The serialized form is a fixed header,
+    the key table and the two arrays, so a stored script is used straight
+    from a memory map.
+    """
+
+    def __init__(self, key_names: list, offsets, actions, content_hash: Optional[str], digest: str):
+        self.key_names = key_names
+        self.codes = [key_code(name) for name in key_names]
+        self.offsets = offsets
+        self.actions = actions
+        self.content_hash = content_hash
+        self.digest = digest
+        self._modifier_ids = frozenset(i for i, name in enumerate(key_names) if name in MODIFIER_KEYS)
+        self._snapshots: Optional[list] = None
+        self._mapped = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def batch(self, start: int, end: int) -> list:
+        """``(op, key_code)`` actions for timeline events ``[start, end)``."""
+        codes = self.codes
+        return [(action >> _OP_SHIFT, codes[action & _KEY_MASK])
+                for action in self.actions[self.offsets[start]:self.offsets[end]]]
+
+    def held_at(self, index: int) -> list:
+        """Key codes held down just before event ``index``, modifiers first."""
+        if self._snapshots is None:
+            self._snapshots = self._build_snapshots()
+        index = max(0, min(index, len(self)))
+        snapshot_index = min(index // SNAPSHOT_INTERVAL, len(self._snapshots) - 1)
+        held = set(self._snapshots[snapshot_index])
+        self._apply(held, self.offsets[snapshot_index * SNAPSHOT_INTERVAL], self.offsets[index])
+        ordered = sorted(held, key=lambda key: (key not in self._modifier_ids, key))
+        return [self.codes[key] for key in ordered]
+
+    def _build_snapshots(self) -> list:
+        snapshots = []
+        held: set = set()
+        offsets = self.offsets
+        for index in range(0, len(self) + 1, SNAPSHOT_INTERVAL):
+            if index:
+                self._apply(held, offsets[index - SNAPSHOT_INTERVAL], offsets[index])
+            snapshots.append(frozenset(held))
+        return snapshots
+
+    def _apply(self, held: set, start: int, end: int):
+        for action in self.actions[start:end]:
+            if action >> _OP_SHIFT == OP_PRESS:
+                held.add(action & _KEY_MASK)
+            else:
+                held.discard(action & _KEY_MASK)
+
+    def to_bytes(self) -> bytes:
+        names = "\n".join(self.key_names).encode()
+        header = _HEADER.pack(
+            _MAGIC, ACTION_SCRIPT_VERSION, _BYTE_ORDER,
+            (self.content_hash or "").encode(), self.digest.encode(),
+            len(self), len(self.actions), len(names),
+        )
+        padding = b"\0" * (-(len(header) + len(names)) % 4)
+        return b"".join((header, names, padding, array("I", self.offsets).tobytes(), array("H", self.actions).tobytes()))
+
+    @classmethod
+    def from_buffer(cls, buffer, content_hash: Optional[str] = None,
+                    digest: Optional[str] = None) -> Optional["ActionScript"]:
+        """Wrap a serialized script without copying it; None if stale or invalid."""
+        view = memoryview(buffer)
+        if len(view) < _HEADER.size:
+            return None
+        magic, version, byte_order, stored_hash, stored_digest, events, actions, names_len = \
+            _HEADER.unpack_from(view)
+        stored_hash = stored_hash.rstrip(b"\0").decode()
+        stored_digest = stored_digest.decode()
+        if magic != _MAGIC or version != ACTION_SCRIPT_VERSION or byte_order != _BYTE_ORDER:
+            return None
+        if (content_hash is not None and stored_hash != content_hash) or (digest is not None and stored_digest != digest):
+            return None
+        names_start = _HEADER.size
+        offsets_start = names_start + names_len + (-(names_start + names_len) % 4)
+        actions_start = offsets_start + 4 * (events + 1)
+        if len(view) != actions_start + 2 * actions:
+            return None
+        names = bytes(view[names_start:names_start + names_len]).decode()
+        return cls(
+            names.split("\n") if names else [],
+            view[offsets_start:actions_start].cast("I"),
+            view[actions_start:].cast("H"),
+            stored_hash or None,
+            stored_digest,
+        )
+
+    @classmethod
+    def load(cls, path: str, content_hash: Optional[str] = None,
+             digest: Optional[str] = None) -> Optional["ActionScript"]:
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        script = cls.from_buffer(mapped, content_hash, digest)
+        if script is None:
+            mapped.close()
+        else:
+            script._mapped = mapped
+        return script
+
+    def close(self):
+        """Unmap a script loaded with ``load``; it cannot be used afterwards."""
+        mapped = self._mapped
+        if mapped is None:
+            return
+        self._mapped = None
+        for column in (self.offsets, self.actions):
+            if isinstance(column, memoryview):
+                column.release()
+        try:
+            mapped.close()
+        except BufferError:
+            pass
+
+
+def compile_action_script(timeline, lowered: list, settings: dict) -> ActionScript:
+    """Lower ``timeline`` to the exact key actions live playback would send.
+
+    ``lowered`` is ``MidiProcessor._lower_timeline(timeline)`` for the same
+    key mapping; ``settings`` holds ``sustain_enabled``, ``velocity_enabled``,
+    ``no_doubles`` and ``hold_keys`` (plus the mapping, for the digest).
+    Mirrors ``press_note``/``release_note``/``handle_sustain_pedal``.
+    """
+    sustain_enabled = settings["sustain_enabled"]
+    velocity_enabled = settings["velocity_enabled"]
+    no_doubles = settings["no_doubles"]
+    hold_keys = settings["hold_keys"]
+
+    key_ids: dict[int, int] = {}
+    offsets = array("I", [0])
+    actions = array("H")
+    active_notes: dict[int, tuple] = {}
+    sustain_pressed = False
+    times_us = timeline.times_us
+    types = timeline.types
+    notes = timeline.notes
+    velocities = timeline.velocities
+    batch: list = []
+
+    def press(key: str):
+        batch.append((OP_PRESS, key_code(key)))
+
+    def release(key: str):
+        batch.append((OP_RELEASE, key_code(key)))
+
+    event_count = len(times_us)
+    start = 0
+    while start < event_count:
+        end = start + 1
+        while end < event_count and times_us[end] == times_us[start]:
+            end += 1
+
+        batch.clear()
+        for index in chord_order(lowered, start, end):
+            event_type = types[index]
+            note = notes[index]
+            velocity = velocities[index]
+            if event_type == EVENT_NOTE_ON and velocity > 0:
+                action = lowered[index]
+                if action is None:
+                    continue
+                key_char, modifiers, velocity_key = action[0], action[1], action[2]
+                if no_doubles:
+                    for held_note, (held_key, held_modifiers) in list(active_notes.items()):
+                        if held_key == key_char:
+                            release(held_key)
+                            for modifier in reversed(held_modifiers):
+                                release(modifier)
+                            del active_notes[held_note]
+                for modifier in modifiers:
+                    press(modifier)
+                if velocity_enabled and velocity_key:
+                    press("alt")
+                    press(velocity_key)
+                    release(velocity_key)
+                    release("alt")
+                press(key_char)
+                if not hold_keys:
+                    release(key_char)
+                    for modifier in reversed(modifiers):
+                        release(modifier)
+                else:
+                    active_notes[note] = (key_char, modifiers)
+            elif event_type == EVENT_NOTE_OFF or event_type == EVENT_NOTE_ON:
+                if note in active_notes:
+                    key_char, modifiers = active_notes.pop(note)
+                    release(key_char)
+                    for modifier in reversed(modifiers):
+                        release(modifier)
+            elif event_type == EVENT_CONTROL_CHANGE and note == SUSTAIN_CONTROL:
+                pressed = velocity >= 64
+                if sustain_enabled and pressed != sustain_pressed:
+                    (press if pressed else release)("space")
+                    sustain_pressed = pressed
+
+        for op, code in coalesce_modifier_envelopes(batch):
+            key = key_ids.get(code)
+            if key is None:
+                key = key_ids[code] = len(key_ids)
+            actions.append(op << _OP_SHIFT | key)
+        offsets.extend([len(actions)] * (end - start))
+        start = end
+
+    key_names = [KEY_NAMES[code] for code in key_ids]
+    return ActionScript(key_names, offsets, actions, timeline.content_hash, settings_digest(settings))
+
+
+class ActionScriptCache:
+    """Compiled action scripts, in memory and as ``<file>.<digest>.actions`` sidecars.
+
+    The sidecar name carries a digest of the mapping settings, so changing
+    any of them selects (or compiles) a different script; writing a new
+    script removes the file's scripts for other settings.
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple[str, str, str], ActionScript]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.compiles = 0
+
+    def get(self, file_path: str, content_hash: Optional[str], settings: dict,
+            build: Callable[[], ActionScript]) -> ActionScript:
+        digest = settings_digest(settings)
+        key = (file_path, content_hash, digest)
+        with self._lock:
+            script = self._entries.get(key)
+            if script is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return script
+
+        script = None
+        if content_hash is not None:
+            script = ActionScript.load(script_path(file_path, digest), content_hash, digest)
+        if script is not None:
+            with self._lock:
+                self.loads += 1
+        else:
+            script = build()
+            with self._lock:
+                self.compiles += 1
+            if content_hash is not None:
+                self._write(file_path, script_path(file_path, digest), script)
+
+        with self._lock:
+            self._entries[key] = script
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return script
+
+    def _write(self, file_path: str, path: str, script: ActionScript):
+        self.invalidate(file_path)
+        for stale in glob.glob(glob.escape(file_path) + ".*.actions"):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+        try:
+            fd, temp_path = tempfile.mkstemp(prefix=".actions-", suffix=".tmp", dir=os.path.dirname(path) or ".")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(script.to_bytes())
+                os.replace(temp_path, path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError as e:
+            print(f"Could not write action script for {file_path}: {e}")
+
+    def invalidate(self, file_path: Optional[str] = None, close: bool = False):
+        """Drop cached scripts; with ``close`` also unmap them (none may be in use)."""
+        with self._lock:
+            keys = [k for k in self._entries if file_path is None or k[0] == file_path]
+            dropped = [self._entries.pop(key) for key in keys]
+        if close:
+            for script in dropped:
+                script.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "loads": self.loads,
+                "compiles": self.compiles,
+            }
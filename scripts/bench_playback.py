@@ -0,0 +1,253 @@
+"""Benchmark end-to-end playback timing.
+
+Plays synthetic files (see ``bench_utils.PATTERNS``) through ``MidiProcessor``
+with the ``keyboard`` module and the MIDI output port replaced by recorders
+that timestamp every press, release and send. Each batch of events that
+share a timestamp is matched with its recorded output and reported as:
+
+- lateness: first output of the batch minus its scheduled deadline
+- chord spread: first to last press (or note_on send) within one batch
+- events per second: timeline events over the wall time playback took
+
+::
+
+    python bench_playback.py                              # every pattern, 25-200% tempo
+    python bench_playback.py --pattern dense_chords --tempo 200 --mode midi
+    python bench_playback.py --json results.json          # machine-readable results
+    python bench_playback.py --baseline results.json      # exit 1 on regressions
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from bench_utils import PATTERNS, import_processor, pattern_file, summarize_ns
+
+
+DEFAULT_TEMPOS = (25, 50, 100, 200)
+MODES = ("keyboard", "midi")
+# Slack added to baseline numbers before a case counts as regressed
+REGRESSION_SLACK_MS = 1.0
+
+
+class RecordingKeyboard:
+    """Stands in for the ``keyboard`` module; records instead of typing."""
+
+    def __init__(self):
+        self.records = []
+
+    def press(self, key):
+        self.records.append((time.perf_counter_ns(), True, key))
+
+    def release(self, key):
+        self.records.append((time.perf_counter_ns(), False, key))
+
+
+class RecordingPort:
+    """Stands in for a mido output port."""
+
+    def __init__(self):
+        self.records = []
+
+    def send(self, msg):
+        self.records.append((time.perf_counter_ns(), msg.type == "note_on" and msg.velocity > 0, msg))
+
+    def close(self):
+        pass
+
+
+def group_bounds(times_us) -> list:
+    bounds = []
+    start = 0
+    count = len(times_us)
+    while start < count:
+        end = start + 1
+        while end < count and times_us[end] == times_us[start]:
+            end += 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def expected_outputs(processor, path: str, timeline, groups: list, mode: str) -> list:
+    """Number of recorded outputs each timestamp group should produce."""
+    if mode == "keyboard":
+        script = processor.load_action_script(path, timeline)
+        return [len(script.batch(start, end)) for start, end in groups]
+
+    from midi_timeline import EVENT_NOTE_ON, EVENT_NOTE_OFF, EVENT_CONTROL_CHANGE, SUSTAIN_CONTROL
+    sizes = []
+    for start, end in groups:
+        size = 0
+        for index in range(start, end):
+            event_type = timeline.types[index]
+            if event_type == EVENT_NOTE_ON or event_type == EVENT_NOTE_OFF or (
+                    event_type == EVENT_CONTROL_CHANGE and timeline.notes[index] == SUSTAIN_CONTROL):
+                size += 1
+        sizes.append(size)
+    return sizes
+
+
+def run_case(processor, keyboard: RecordingKeyboard, path: str, pattern: str, mode: str, tempo: float) -> dict:
+    timeline = processor.load_timeline(path)
+    groups = group_bounds(timeline.times_us)
+    port = RecordingPort()
+    processor.use_midi_output = mode == "midi"
+    processor.midi_out = port if mode == "midi" else None
+    sizes = expected_outputs(processor, path, timeline, groups, mode)
+    recorder = port if mode == "midi" else keyboard
+
+    keyboard.records.clear()
+    processor.scheduler.lateness.reset()
+    processor.batch_latency.reset()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        finished = asyncio.run(processor.play_midi_file(path, tempo))
+    expected_total = sum(sizes)
+    drain_deadline = time.perf_counter() + 5.0
+    while len(recorder.records) < expected_total and time.perf_counter() < drain_deadline:
+        time.sleep(0.005)
+
+    records = list(recorder.records)
+    started_ns = processor.scheduler.started_ns
+    scale = 1000 * 100.0 / tempo
+    lateness = []
+    spread = []
+    cursor = 0
+    missing = 0
+    for (start, _), size in zip(groups, sizes):
+        if size == 0:
+            continue
+        batch = records[cursor:cursor + size]
+        cursor += size
+        if len(batch) < size:
+            missing += size - len(batch)
+            if not batch:
+                continue
+        lateness.append(batch[0][0] - (started_ns + int(timeline.times_us[start] * scale)))
+        presses = [stamp for stamp, pressed, _ in batch if pressed]
+        if len(presses) > 1:
+            spread.append(presses[-1] - presses[0])
+
+    wall_seconds = (records[-1][0] - started_ns) / 1e9 if records else 0.0
+    nominal_seconds = timeline.duration * 100.0 / tempo
+    return {
+        "pattern": pattern,
+        "mode": mode,
+        "tempo": tempo,
+        "finished": finished,
+        "events": len(timeline),
+        "batches": sum(1 for size in sizes if size),
+        "outputs": len(records),
+        "missing_outputs": missing,
+        "lateness": summarize_ns(lateness),
+        "chord_spread": summarize_ns(spread),
+        "wall_seconds": wall_seconds,
+        "nominal_seconds": nominal_seconds,
+        "events_per_second": len(timeline) / wall_seconds if wall_seconds else 0.0,
+        "nominal_events_per_second": len(timeline) / nominal_seconds if nominal_seconds else 0.0,
+        "scheduler_lateness": processor.scheduler.lateness.snapshot(),
+        "queue_latency": processor.batch_latency.snapshot() if mode == "keyboard" else None,
+    }
+
+
+def case_key(result: dict) -> tuple:
+    return result["pattern"], result["mode"], float(result["tempo"])
+
+
+def find_regressions(results: list, baseline: dict, tolerance: float) -> list:
+    previous = {case_key(result): result for result in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        before = previous.get(case_key(result))
+        if before is None:
+            continue
+        if result["missing_outputs"] > before["missing_outputs"]:
+            regressions.append(f"{'/'.join(map(str, case_key(result)))}: missing outputs "
+                               f"{before['missing_outputs']} -> {result['missing_outputs']}")
+        for metric in ("lateness", "chord_spread"):
+            old = before[metric]["p99_ms"]
+            new = result[metric]["p99_ms"]
+            if new > old * tolerance + REGRESSION_SLACK_MS:
+                regressions.append(f"{'/'.join(map(str, case_key(result)))}: {metric} p99 "
+                                   f"{old:.2f} ms -> {new:.2f} ms")
+    return regressions
+
+
+def print_result(result: dict):
+    lateness = result["lateness"]
+    spread = result["chord_spread"]
+    status = "" if result["finished"] and not result["missing_outputs"] else \
+        f"  INCOMPLETE ({result['missing_outputs']} missing)"
+    print(f"  {result['pattern']:<14}{result['mode']:<9}{result['tempo']:>5g}%"
+          f"  late p50 {lateness['p50_ms']:6.2f}  p99 {lateness['p99_ms']:6.2f}  max {lateness['max_ms']:6.2f} ms"
+          f"  spread p99 {spread['p99_ms']:6.3f} ms"
+          f"  {result['events_per_second']:7.0f} ev/s{status}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ROBE playback latency and jitter")
+    parser.add_argument("--pattern", action="append", choices=PATTERNS,
+                        help="Pattern to play (repeatable; default: all)")
+    parser.add_argument("--tempo", action="append", type=float,
+                        help="Tempo percentage (repeatable; default: 25, 50, 100, 200)")
+    parser.add_argument("--mode", action="append", choices=MODES, help="Output path (repeatable; default: both)")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Length of each pattern at 100%% tempo")
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON ('-' for stdout)")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare with an earlier --json file")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="Allowed p99 growth factor over the baseline (default: 1.5)")
+    args = parser.parse_args(argv)
+
+    midi_processor = import_processor()
+    keyboard = RecordingKeyboard()
+    midi_processor.kb = keyboard
+    processor = midi_processor.MidiProcessor()
+
+    patterns = args.pattern or PATTERNS
+    tempos = args.tempo or DEFAULT_TEMPOS
+    modes = args.mode or MODES
+    log = sys.stderr if args.json == "-" else sys.stdout
+    results = []
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(log):
+        for pattern in patterns:
+            path = os.path.join(directory, f"{pattern}.mid")
+            pattern_file(path, pattern, args.seconds)
+            for mode in modes:
+                for tempo in tempos:
+                    result = run_case(processor, keyboard, path, pattern, mode, tempo)
+                    print_result(result)
+                    results.append(result)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seconds": args.seconds,
+        "results": results,
+    }
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Microbenchmark the stages between a MIDI file and the keyboard queue.
+
+For generated files of increasing size, times each stage (best of N) and
+measures its peak Python heap with tracemalloc (in a separate run, so the
+tracing overhead stays out of the timings)::
+
+    python bench_stages.py                                # 1k, 10k, 100k and 1M events
+    python bench_stages.py --events 1000 --events 50000 --repeat 5
+    python bench_stages.py --skip-mido --json stages.json
+
+Stages:
+
+- mido load: ``mido.MidiFile`` (the reference parser, no longer on the playback path)
+- smf read: ``smf_reader.read_smf_file``
+- timeline build: ``CompiledTimeline.from_smf``
+- key lowering: ``MidiProcessor._lower_timeline``
+- action script: ``compile_action_script``
+- seek snapshots: first seek into a file (builds timeline and script snapshots)
+- seek: ``index_at`` + ``state_at`` + ``held_at`` at random positions
+- get_key_for_note / get_velocity_key: one lookup per timeline event
+- press_note enqueue: ``press_note`` through ``ActionRing.push_batch``
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+import types
+
+import mido
+
+from action_script import compile_action_script
+from bench_utils import best_of, import_processor, sized_file
+from midi_timeline import CompiledTimeline, EVENT_NOTE_ON
+from smf_reader import read_smf_file
+
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+SEEKS = 1000
+# press_note enqueues go through the real ring and worker; cap them per file
+MAX_ENQUEUES = 100_000
+
+
+def measure(name: str, repeat: int, func, ops: int = 1) -> dict:
+    elapsed, _ = best_of(repeat, func)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "stage": name,
+        "seconds": elapsed,
+        "ops": ops,
+        "per_op_us": elapsed / ops * 1e6,
+        "peak_bytes": peak,
+    }
+
+
+def bench_file(processor, path: str, repeat: int, skip_mido: bool) -> tuple[int, list]:
+    stages = []
+    if not skip_mido:
+        stages.append(measure("mido load", repeat, lambda: mido.MidiFile(path)))
+
+    stages.append(measure("smf read", repeat, lambda: read_smf_file(path)))
+    smf = read_smf_file(path)
+    stages.append(measure("timeline build", repeat, lambda: CompiledTimeline.from_smf(smf)))
+    timeline = CompiledTimeline.from_smf(smf)
+    events = len(timeline)
+
+    def lower():
+        processor._lowered_cache = None
+        return processor._lower_timeline(timeline)
+
+    stages.append(measure("key lowering", repeat, lower, events))
+    lowered = lower()
+    settings = processor._action_settings()
+    stages.append(measure("action script", repeat,
+                          lambda: compile_action_script(timeline, lowered, settings), events))
+    script = compile_action_script(timeline, lowered, settings)
+
+    def first_seek():
+        timeline._snapshots = None
+        script._snapshots = None
+        timeline.state_at(events)
+        script.held_at(events)
+
+    stages.append(measure("seek snapshots", repeat, first_seek))
+    rng = random.Random(1)
+    positions = [rng.uniform(0, timeline.duration) for _ in range(SEEKS)]
+
+    def seeks():
+        for position in positions:
+            index = timeline.index_at(position)
+            timeline.state_at(index)
+            script.held_at(index)
+
+    stages.append(measure("seek", repeat, seeks, SEEKS))
+
+    notes = timeline.notes
+    velocities = timeline.velocities
+
+    def note_keys():
+        get_key_for_note = processor.get_key_for_note
+        for note in notes:
+            get_key_for_note(note)
+
+    def velocity_keys():
+        get_velocity_key = processor.get_velocity_key
+        for velocity in velocities:
+            get_velocity_key(velocity)
+
+    stages.append(measure("get_key_for_note", repeat, note_keys, events))
+    processor.velocity_enabled = True
+    stages.append(measure("get_velocity_key", repeat, velocity_keys, events))
+    processor.velocity_enabled = False
+
+    presses = [(timeline.notes[index], action) for index, action in enumerate(lowered)
+               if action is not None and timeline.types[index] == EVENT_NOTE_ON][:MAX_ENQUEUES]
+
+    def enqueue():
+        for note, (key_char, modifiers, _, _, _) in presses:
+            processor._begin_batch()
+            processor.press_note(note, key_char, modifiers)
+            processor._flush_batch()
+
+    stages.append(measure("press_note enqueue", repeat, enqueue, max(1, len(presses))))
+    return events, stages
+
+
+def print_stages(path: str, events: int, stages: list):
+    total = sum(stage["seconds"] for stage in stages if stage["stage"] != "mido load")
+    print(f"{os.path.basename(path)}: {events} events")
+    for stage in stages:
+        share = "" if stage["stage"] == "mido load" else f"{stage['seconds'] / total * 100:5.1f}%"
+        per_op = f"{stage['per_op_us']:9.3f} us/op" if stage["ops"] > 1 else " " * 15
+        print(f"  {stage['stage']:<20}{stage['seconds'] * 1000:10.2f} ms {share:>6}  {per_op}"
+              f"  peak {stage['peak_bytes'] / 1024 / 1024:8.2f} MiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmark ROBE file loading and key mapping stages")
+    parser.add_argument("--events", action="append", type=int,
+                        help="File size in events (repeatable; default: 1k, 10k, 100k, 1M)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is reported")
+    parser.add_argument("--skip-mido", action="store_true", help="Leave out the mido reference parser")
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    midi_processor = import_processor()
+    midi_processor.kb = types.SimpleNamespace(press=lambda key: None, release=lambda key: None)
+    processor = midi_processor.MidiProcessor()
+
+    log = sys.stderr if args.json == "-" else sys.stdout
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for events in args.events or DEFAULT_SIZES:
+            path = os.path.join(directory, f"events-{events}.mid")
+            sized_file(path, events)
+            timeline_events, stages = bench_file(processor, path, args.repeat, args.skip_mido)
+            with contextlib.redirect_stdout(log):
+                print_stages(path, timeline_events, stages)
+            results.append({"events": timeline_events, "file_bytes": os.path.getsize(path), "stages": stages})
+
+    if args.json == "-":
+        json.dump({"results": results}, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark timeline construction.
+
+Compares mido's merged iteration (the original builder) with the column
+builders used by ``CompiledTimeline.from_midi_file``, checks that all of
+them produce identical timelines, and prints best-of-N timings::
+
+    python bench_timeline.py                       # synthetic orchestral file
+    python bench_timeline.py song.mid other.mid --repeat 5
+"""
+import argparse
+import os
+import random
+import tempfile
+
+import mido
+
+import midi_timeline
+from bench_utils import best_of
+from midi_timeline import CompiledTimeline, track_columns
+
+
+def synthetic_file(path: str, tracks: int = 16, notes_per_track: int = 6000, seed: int = 1):
+    """Write a multi-track file with tempo changes and sustain pedal traffic."""
+    rng = random.Random(seed)
+    mid = mido.MidiFile(ticks_per_beat=480)
+    for channel in range(tracks):
+        track = mido.MidiTrack()
+        mid.tracks.append(track)
+        if channel == 0:
+            for _ in range(50):
+                track.append(mido.MetaMessage("set_tempo", tempo=rng.randint(300000, 900000), time=rng.randint(0, 2000)))
+        for i in range(notes_per_track):
+            note = rng.randint(30, 90)
+            track.append(mido.Message("note_on", channel=channel % 16, note=note,
+                                      velocity=rng.randint(1, 127), time=rng.randint(0, 60)))
+            track.append(mido.Message("note_off", channel=channel % 16, note=note, time=rng.randint(0, 60)))
+            if i % 64 == 0:
+                track.append(mido.Message("control_change", channel=channel % 16, control=64,
+                                          value=127 if i % 128 == 0 else 0, time=0))
+    mid.save(path)
+
+
+def columns_of(timeline: CompiledTimeline) -> tuple:
+    return (bytes(timeline.times_us), bytes(timeline.types), bytes(timeline.channels),
+            bytes(timeline.notes), bytes(timeline.velocities), timeline.duration)
+
+
+def without_numpy(func):
+    def run():
+        saved = midi_timeline.np
+        midi_timeline.np = None
+        try:
+            return func()
+        finally:
+            midi_timeline.np = saved
+    return run
+
+
+def bench_file(path: str, repeat: int):
+    parse_time, mid = best_of(repeat, lambda: mido.MidiFile(path))
+    messages = sum(len(track) for track in mid.tracks)
+    print(f"{os.path.basename(path)}: {messages} messages, {len(mid.tracks)} tracks")
+    print(f"  {'mido parse':<28}{parse_time * 1000:10.1f} ms")
+
+    def merged_iteration():
+        # mido caches the merged track; drop it so every run pays the merge
+        del mid.merged_track
+        return CompiledTimeline.from_merged_messages(mid)
+
+    reference_time, reference = best_of(repeat, merged_iteration)
+    print(f"  {'merged iteration (original)':<28}{reference_time * 1000:10.1f} ms")
+    expected = columns_of(reference)
+
+    columns_time, _ = best_of(repeat, lambda: [track_columns(track) for track in mid.tracks])
+    print(f"  {'track columns only':<28}{columns_time * 1000:10.1f} ms")
+
+    builders = [("columns, pure Python", without_numpy(lambda: CompiledTimeline.from_midi_file(mid)))]
+    if midi_timeline.np is not None:
+        builders.append(("columns, NumPy", lambda: CompiledTimeline.from_midi_file(mid)))
+    else:
+        print("  NumPy not installed; skipping the vectorized builder")
+    for label, build in builders:
+        elapsed, timeline = best_of(repeat, build)
+        status = "identical" if columns_of(timeline) == expected else "MISMATCH"
+        print(f"  {label:<28}{elapsed * 1000:10.1f} ms  {reference_time / elapsed:5.1f}x  {status}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ROBE timeline construction")
+    parser.add_argument("files", nargs="*", help="MIDI files (default: a generated 16-track file)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is reported")
+    args = parser.parse_args(argv)
+
+    if args.files:
+        for path in args.files:
+            bench_file(path, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "synthetic.mid")
+        synthetic_file(path)
+        bench_file(path, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Helpers shared by the bench_*.py scripts and tests: timing and synthetic MIDI."""
+import random
+import struct
+import sys
+import time
+import types
+
+import mido
+
+from midi_timeline import CompiledTimeline
+
+
+PATTERNS = ("dense_chords", "fast_trills", "long_sustains", "tempo_changes")
+TICKS_PER_BEAT = 480
+
+
+def import_processor():
+    """Import midi_processor even where its window helper is unsupported.
+
+    Benchmarks replace ``midi_processor.kb`` before playing, so neither OS
+    module is ever called.
+    """
+    try:
+        import pygetwindow  # noqa: F401
+    except Exception:
+        sys.modules["pygetwindow"] = types.ModuleType("pygetwindow")
+    import midi_processor
+    return midi_processor
+
+
+def best_of(repeat: int, func):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def summarize_ns(samples) -> dict:
+    """Percentiles of nanosecond samples, in milliseconds."""
+    samples = sorted(samples)
+    count = len(samples)
+    if count == 0:
+        return {"count": 0, "p50_ms": 0.0, "p90_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0, "mean_ms": 0.0}
+
+    def at(fraction: float) -> float:
+        return samples[min(count - 1, int(count * fraction))] / 1e6
+
+    return {
+        "count": count,
+        "p50_ms": at(0.50),
+        "p90_ms": at(0.90),
+        "p99_ms": at(0.99),
+        "max_ms": samples[-1] / 1e6,
+        "mean_ms": sum(samples) / count / 1e6,
+    }
+
+
+def pattern_file(path: str, pattern: str, seconds: float = 2.0, seed: int = 1):
+    """Write about ``seconds`` of one of ``PATTERNS`` at the default 120 BPM.
+
+    dense_chords   eight-note chords on every eighth note
+    fast_trills    two interleaved trills, 64 notes per second
+    long_sustains  overlapping whole notes under a sustain pedal
+    tempo_changes  a sixteenth-note run with a new tempo on every beat
+    """
+    rng = random.Random(seed)
+    beats = max(1, round(seconds * 2))
+    end = beats * TICKS_PER_BEAT
+    events = []
+
+    def note(tick: int, length: int, pitch: int, velocity: int = 80):
+        events.append((tick, 1, mido.Message("note_on", note=pitch, velocity=velocity)))
+        events.append((tick + length, 0, mido.Message("note_off", note=pitch)))
+
+    if pattern == "dense_chords":
+        step = TICKS_PER_BEAT // 2
+        for tick in range(0, end, step):
+            for pitch in rng.sample(range(36, 97), 8):
+                note(tick, step - 40, pitch, rng.randint(30, 127))
+    elif pattern == "fast_trills":
+        step = TICKS_PER_BEAT // 16
+        for voice, (low, high) in enumerate(((60, 62), (72, 73))):
+            for i, tick in enumerate(range(voice * step // 2, end, step)):
+                note(tick, step, high if i % 2 else low)
+    elif pattern == "long_sustains":
+        for beat in range(beats):
+            tick = beat * TICKS_PER_BEAT
+            if beat % 2 == 0:
+                if beat:
+                    events.append((tick, 0, mido.Message("control_change", control=64, value=0)))
+                events.append((tick, 2, mido.Message("control_change", control=64, value=127)))
+            for pitch in rng.sample(range(40, 90), 4):
+                note(tick, 4 * TICKS_PER_BEAT, pitch)
+        events.append((end + 4 * TICKS_PER_BEAT, 0, mido.Message("control_change", control=64, value=0)))
+    elif pattern == "tempo_changes":
+        step = TICKS_PER_BEAT // 4
+        for tick in range(0, end, step):
+            if tick % TICKS_PER_BEAT == 0:
+                events.append((tick, 0, mido.MetaMessage("set_tempo", tempo=rng.randint(250000, 1000000))))
+            note(tick, step, 48 + (tick // step) % 36)
+    else:
+        raise ValueError(f"Unknown pattern: {pattern}")
+
+    track = mido.MidiTrack()
+    last = 0
+    for tick, _, msg in sorted(events, key=lambda event: (event[0], event[1])):
+        track.append(msg.copy(time=tick - last))
+        last = tick
+    mid = mido.MidiFile(ticks_per_beat=TICKS_PER_BEAT)
+    mid.tracks.append(track)
+    mid.save(path)
+
+
+def _vlq(value: int) -> bytes:
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def sized_file(path: str, events: int, tracks: int = 4, seed: int = 1):
+    """Write a file with about ``events`` channel messages spread over ``tracks``.
+
+    Bytes are written directly, so million-event files take seconds rather
+    than the minutes building them with mido would.
+    """
+    rng = random.Random(seed)
+    per_track = max(2, events // tracks) // 2
+    chunks = [struct.pack(">4sIhhh", b"MThd", 6, 1, tracks, TICKS_PER_BEAT)]
+    for channel in range(tracks):
+        body = bytearray()
+        for i in range(per_track):
+            if channel == 0 and i % 500 == 0:
+                body += b"\x00\xff\x51\x03" + rng.randint(300000, 900000).to_bytes(3, "big")
+            note = rng.randint(24, 100)
+            body += _vlq(rng.randint(0, 60)) + bytes((0x90 | channel, note, rng.randint(1, 127)))
+            body += _vlq(rng.randint(0, 60)) + bytes((0x80 | channel, note, 0))
+            if i % 64 == 0:
+                body += b"\x00" + bytes((0xB0 | channel, 64, 127 if i % 128 == 0 else 0))
+        body += b"\x00\xff\x2f\x00"
+        chunks.append(struct.pack(">4sI", b"MTrk", len(body)) + bytes(body))
+    with open(path, "wb") as f:
+        f.write(b"".join(chunks))
+
+
+def random_timeline(seed: int, events: int = 1500) -> CompiledTimeline:
+    """Chords across the whole keyboard, repeated pitches, zero-velocity note-offs and pedal changes."""
+    rng = random.Random(seed)
+    track = mido.MidiTrack()
+    for _ in range(events):
+        kind = rng.random()
+        time = rng.choice([0, 0, 0, rng.randint(1, 200)])
+        if kind < 0.06:
+            track.append(mido.Message("control_change", control=64, value=rng.choice([0, 63, 64, 127]), time=time))
+        elif kind < 0.6:
+            track.append(mido.Message("note_on", note=rng.randint(15, 115), velocity=rng.randint(1, 127), time=time))
+        elif kind < 0.8:
+            track.append(mido.Message("note_on", note=rng.randint(15, 115), velocity=0, time=time))
+        else:
+            track.append(mido.Message("note_off", note=rng.randint(15, 115), time=time))
+    mid = mido.MidiFile()
+    mid.tracks.append(track)
+    return CompiledTimeline.from_midi_file(mid)
+
+
+def groups(timeline: CompiledTimeline):
+    """``(start, end)`` of each run of events sharing a timestamp, as the scheduler dispatches them."""
+    times = timeline.times_us
+    start = 0
+    while start < len(times):
+        end = start + 1
+        while end < len(times) and times[end] == times[start]:
+            end += 1
+        yield start, end
+        start = end
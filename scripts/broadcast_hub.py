@@ -0,0 +1,190 @@
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Optional
+
+from metrics import registry
+from ws_protocol import encode_frame, encode_record
+
+
+COALESCED_TYPES = ("current_note", "position_update")
+
+# Labelled by connection kind rather than per connection, so the series stay bounded
+_SEND_SECONDS = {
+    binary: registry.histogram("robe_ws_send_seconds", "Time to send one frame to one WebSocket client",
+                               labels={"protocol": "binary" if binary else "json"})
+    for binary in (False, True)
+}
+_DROPPED = registry.counter("robe_ws_dropped_messages_total",
+                            "Messages dropped from full WebSocket client queues")
+
+
+class ClientChannel:
+    """One WebSocket client with its own bounded, drop-oldest send queue."""
+
+    def __init__(self, websocket, queue_size: int, binary: bool = False):
+        self.websocket = websocket
+        self.binary = binary
+        self.queue: deque = deque(maxlen=queue_size)
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+
+    def push(self, frame):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            # Rare, so counted even with metrics off to keep the total exact
+            _DROPPED.inc()
+        self.queue.append(frame)
+        self.ready.set()
+
+
+class BroadcastHub:
+    """Fans messages out to WebSocket clients without blocking publishers.
+
+    Each message is serialized once and appended to every client's queue;
+    a sender task per client drains it. High-rate ``current_note`` and
+    ``position_update`` messages are coalesced to the latest value and
+    flushed at most ``frame_rate`` times per second. Binary-protocol
+    clients instead get every note since the last flush packed into a
+    single frame (see ``ws_protocol``).
+    """
+
+    def __init__(self, frame_rate: float = 30.0, queue_size: int = 64, max_binary_batch: int = 256):
+        self.frame_rate = frame_rate
+        self.queue_size = queue_size
+        self.clients: dict = {}
+        self._latest: dict = {}
+        self._binary_notes: deque = deque(maxlen=max_binary_batch)
+        self._binary_clients = 0
+        self._pending: Optional[asyncio.Event] = None
+        self._frame_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.frames = 0
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def _ensure_started(self):
+        if self._frame_task is not None and not self._frame_task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._pending = asyncio.Event()
+        self._frame_task = self._loop.create_task(self._frame_loop())
+
+    def attach(self, websocket, binary: bool = False) -> ClientChannel:
+        self._ensure_started()
+        channel = ClientChannel(websocket, self.queue_size, binary)
+        channel.task = asyncio.get_running_loop().create_task(self._sender(channel))
+        self.clients[websocket] = channel
+        if binary:
+            self._binary_clients += 1
+        return channel
+
+    def detach(self, websocket):
+        channel = self.clients.pop(websocket, None)
+        if channel is None:
+            return
+        if channel.binary:
+            self._binary_clients -= 1
+        if channel.task and channel.task is not asyncio.current_task():
+            channel.task.cancel()
+
+    def send_to(self, websocket, message: dict):
+        channel = self.clients.get(websocket)
+        if channel:
+            channel.push(json.dumps(message))
+
+    def publish(self, message: dict):
+        """Queue ``message`` for every client. Must run on the event loop."""
+        self.published += 1
+        if not self.clients:
+            return
+        if message.get("type") in COALESCED_TYPES:
+            self._ensure_started()
+            self._latest[message["type"]] = message
+            if self._binary_clients and message["type"] == "current_note":
+                self._binary_notes.append(encode_record(message))
+            self._pending.set()
+            return
+
+        binary = None
+        if self._binary_clients:
+            record = encode_record(message)
+            if record is not None:
+                binary = encode_frame([record])
+        self._fan_out(json.dumps(message), binary)
+
+    def publish_threadsafe(self, message: dict):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.publish, message)
+
+    def _fan_out(self, text: str, binary: Optional[bytes] = None):
+        for channel in self.clients.values():
+            if channel.binary and binary is not None:
+                channel.push(binary)
+            else:
+                channel.push(text)
+
+    async def _frame_loop(self):
+        interval = 1.0 / self.frame_rate
+        while True:
+            await self._pending.wait()
+            self._pending.clear()
+            latest = self._latest
+            self._latest = {}
+            if self._binary_clients:
+                records = list(self._binary_notes)
+                self._binary_notes.clear()
+                if "position_update" in latest:
+                    records.append(encode_record(latest["position_update"]))
+                frame = encode_frame(records) if records else None
+                for channel in self.clients.values():
+                    if channel.binary and frame is not None:
+                        channel.push(frame)
+            if len(self.clients) > self._binary_clients:
+                for message in latest.values():
+                    text = json.dumps(message)
+                    for channel in self.clients.values():
+                        if not channel.binary:
+                            channel.push(text)
+            self.frames += 1
+            await asyncio.sleep(interval)
+
+    async def _sender(self, channel: ClientChannel):
+        websocket = channel.websocket
+        send_seconds = _SEND_SECONDS[channel.binary]
+        try:
+            while True:
+                await channel.ready.wait()
+                channel.ready.clear()
+                while channel.queue:
+                    frame = channel.queue.popleft()
+                    timed = registry.enabled
+                    if timed:
+                        started = time.perf_counter()
+                    if isinstance(frame, bytes):
+                        await websocket.send_bytes(frame)
+                    else:
+                        await websocket.send_text(frame)
+                    if timed:
+                        send_seconds.observe(time.perf_counter() - started)
+                    channel.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.detach(websocket)
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self.clients),
+            "binary_clients": self._binary_clients,
+            "frame_rate": self.frame_rate,
+            "published": self.published,
+            "frames": self.frames,
+            "sent": sum(channel.sent for channel in self.clients.values()),
+            "dropped": sum(channel.dropped for channel in self.clients.values()),
+        }
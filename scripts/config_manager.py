@@ -1,11 +1,22 @@
+import atexit
 import json
 import os
+import tempfile
+import threading
+import time
 from typing import Dict, Any
 
 class ConfigManager:
     
-    def __init__(self, config_file: str = "config.json"):
+    def __init__(self, config_file: str = "config.json", flush_delay: float = 0.5):
         self.config_file = config_file
+        self.flush_delay = flush_delay
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._last_change = 0.0
+        self._dirty_event = threading.Event()
         self.default_config = {
             "sustain_enabled": False,
             "velocity_enabled": False,
@@ -24,6 +35,10 @@ class ConfigManager:
             }
         }
         self.config = self.load_config()
+
+        self._writer = threading.Thread(target=self._writer_loop, name="config-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
     
     def load_config(self) -> Dict[str, Any]:
         try:
@@ -41,26 +56,76 @@ class ConfigManager:
             return self.default_config.copy()
     
     def save_config(self, config: Dict[str, Any] = None) -> bool:
+        """Write the config to disk now, atomically via temp file + rename."""
         try:
-            config_to_save = config if config is not None else self.config
-            with open(self.config_file, 'w') as f:
-                json.dump(config_to_save, f, indent=2)
+            with self._lock:
+                config_to_save = config if config is not None else self.config
+                payload = json.dumps(config_to_save, indent=2)
+            directory = os.path.dirname(os.path.abspath(self.config_file))
+            with self._write_lock:
+                fd, temp_path = tempfile.mkstemp(prefix=".config-", suffix=".tmp", dir=directory)
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        f.write(payload)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(temp_path, self.config_file)
+                except BaseException:
+                    os.unlink(temp_path)
+                    raise
+                self.writes += 1
             return True
         except Exception as e:
             print(f"Error saving config: {e}")
             return False
+
+    def _mark_dirty(self):
+        with self._lock:
+            self._dirty = True
+            self._last_change = time.monotonic()
+        self._dirty_event.set()
+
+    def _writer_loop(self):
+        while True:
+            self._dirty_event.wait()
+            while True:
+                with self._lock:
+                    remaining = self._last_change + self.flush_delay - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(remaining)
+            self._dirty_event.clear()
+            self.flush()
+
+    def flush(self) -> bool:
+        """Write pending changes immediately. Call on shutdown."""
+        with self._lock:
+            if not self._dirty:
+                return True
+            self._dirty = False
+        success = self.save_config()
+        if not success:
+            with self._lock:
+                self._dirty = True
+        return success
     
     def get(self, key: str, default=None):
         return self.config.get(key, default)
     
     def set(self, key: str, value: Any) -> bool:
-        self.config[key] = value
-        return self.save_config()
+        with self._lock:
+            self.config[key] = value
+        self._mark_dirty()
+        return True
     
     def update(self, updates: Dict[str, Any]) -> bool:
-        self.config.update(updates)
-        return self.save_config()
+        with self._lock:
+            self.config.update(updates)
+        self._mark_dirty()
+        return True
     
     def reset_to_defaults(self) -> bool:
-        self.config = self.default_config.copy()
-        return self.save_config()
+        with self._lock:
+            self.config = self.default_config.copy()
+        self._mark_dirty()
+        return True
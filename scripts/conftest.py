@@ -0,0 +1,14 @@
+"""Fixtures shared by the test_*.py modules."""
+import types
+
+import pytest
+
+from bench_utils import import_processor
+
+
+@pytest.fixture(scope="module")
+def midi_processor():
+    """``midi_processor`` with its keyboard module replaced, so nothing is typed."""
+    module = import_processor()
+    module.kb = types.SimpleNamespace(press=lambda key: None, release=lambda key: None)
+    return module
@@ -0,0 +1,136 @@
+import sys
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+LEVELS = {
+    "trace": 5,
+    "debug": 10,
+    "info": 20,
+    "warning": 30,
+    "error": 40,
+}
+
+
+class EventLog:
+    """Leveled, structured log that never blocks the caller on I/O.
+
+    Records are appended to a bounded deque (dropping the oldest when
+    full) and written out by a background thread. Per-note tracing is
+    gated separately by ``trace_notes`` so the playback path can skip
+    building records entirely.
+    """
+
+    def __init__(self, capacity: int = 8192, level: str = "info",
+                 file_path: Optional[str] = None, flush_interval: float = 0.1):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.trace_notes = False
+        self.dropped = 0
+        self.written = 0
+        self._records: deque = deque(maxlen=capacity)
+        self._level = LEVELS[level]
+        self._level_name = level
+        self._file_path = file_path
+        self._stream = None
+        self._stream_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._open_stream()
+
+        self._thread = threading.Thread(target=self._flush_loop, name="event-log", daemon=True)
+        self._thread.start()
+
+    def _open_stream(self):
+        if self._file_path:
+            self._stream = open(self._file_path, "a", encoding="utf-8", buffering=1024 * 64)
+        else:
+            self._stream = sys.stdout
+
+    @property
+    def level(self) -> str:
+        return self._level_name
+
+    def set_level(self, level: str):
+        if level not in LEVELS:
+            raise ValueError(f"Unknown log level '{level}'")
+        self._level = LEVELS[level]
+        self._level_name = level
+
+    def set_trace_notes(self, enabled: bool):
+        self.trace_notes = enabled
+
+    def set_output(self, file_path: Optional[str] = None):
+        with self._stream_lock:
+            self._write_pending()
+            if self._stream is not sys.stdout:
+                self._stream.close()
+            self._file_path = file_path
+            self._open_stream()
+
+    def log(self, level: str, event: str, **fields):
+        if LEVELS[level] < self._level:
+            return
+        if len(self._records) == self.capacity:
+            self.dropped += 1
+        self._records.append((time.time(), level, event, fields))
+
+    def trace(self, event: str, **fields):
+        if self.trace_notes:
+            if len(self._records) == self.capacity:
+                self.dropped += 1
+            self._records.append((time.time(), "trace", event, fields))
+
+    def debug(self, event: str, **fields):
+        self.log("debug", event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log("info", event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log("warning", event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log("error", event, **fields)
+
+    def status(self) -> dict:
+        return {
+            "level": self._level_name,
+            "trace_notes": self.trace_notes,
+            "file": self._file_path,
+            "pending": len(self._records),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+    def flush(self):
+        with self._stream_lock:
+            self._write_pending()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Event log flush error: {e}", file=sys.stderr)
+
+    def _write_pending(self):
+        records = self._records
+        if not records:
+            return
+        lines = []
+        while records:
+            try:
+                timestamp, level, event, fields = records.popleft()
+            except IndexError:
+                break
+            stamp = time.strftime("%H:%M:%S", time.localtime(timestamp))
+            millis = int((timestamp % 1) * 1000)
+            detail = " ".join(f"{key}={value}" for key, value in fields.items())
+            lines.append(f"{stamp}.{millis:03d} {level.upper():<7} {event} {detail}".rstrip() + "\n")
+        self._stream.write("".join(lines))
+        self._stream.flush()
+        self.written += len(lines)
@@ -0,0 +1,482 @@
+"""Batch analysis of a MIDI library into a persistent SQLite index.
+
+Files are analyzed in parallel with a process pool, reusing
+``midi_metadata.extract_smf_metadata``. Indexing is incremental: files whose
+size and mtime are unchanged are skipped without being read, and files
+that were touched but whose content hash is unchanged only get their
+stat info refreshed.
+
+``LibrarySearch`` answers filtered, paginated queries over the index,
+using an FTS5 table for prefix/full-text search on title and file name
+when SQLite provides it (falling back to ``LIKE`` otherwise).
+
+Usage::
+
+    python library_index.py index path/to/library [--db library.db] [--workers N]
+    python library_index.py search "moonlight" [--db library.db]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Optional
+
+from midi_metadata import extract_smf_metadata
+from midi_timeline import CompiledTimeline, file_content_hash
+from smf_reader import read_smf_file
+
+
+DEFAULT_DB = "library.db"
+DEFAULT_MAIN_START = 36
+DEFAULT_MAIN_END = 96
+MIDI_EXTENSIONS = (".mid", ".midi")
+COMMIT_EVERY = 200
+
+# Above these a file gets progressively harder to play by keyboard
+PLAYABLE_DENSITY = 12.0
+PLAYABLE_POLYPHONY = 8
+
+RANGE_FILTERS = {
+    "duration": "duration",
+    "density": "note_density",
+    "playability": "playability",
+    "tempo": "tempo_bpm",
+}
+SORT_COLUMNS = ("name", "title", "duration", "note_density", "playability", "tempo_bpm", "indexed_at")
+RESULT_COLUMNS = (
+    "rowid", "path", "name", "title", "duration", "note_count", "note_density",
+    "peak_polyphony", "outside_range_share", "tempo_bpm", "track_count", "playability",
+)
+
+SCHEMA_VERSION = 1
+
+# Only the columns searched and listed live in ``files`` so scans stay
+# cheap; full metadata and unparseable files are kept in side tables.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    title TEXT,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    content_hash TEXT,
+    duration REAL,
+    note_count INTEGER,
+    note_density REAL,
+    peak_polyphony INTEGER,
+    outside_range_share REAL,
+    tempo_bpm REAL,
+    track_count INTEGER,
+    playability REAL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_metadata (
+    path TEXT PRIMARY KEY,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS failures (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    content_hash TEXT,
+    error TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_hash ON files (content_hash);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE INDEX IF NOT EXISTS files_duration ON files (duration);
+CREATE INDEX IF NOT EXISTS files_density ON files (note_density);
+CREATE INDEX IF NOT EXISTS files_playability ON files (playability);
+CREATE INDEX IF NOT EXISTS files_tempo ON files (tempo_bpm);
+CREATE INDEX IF NOT EXISTS files_filters ON files (duration, note_density, playability, tempo_bpm);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE files_fts USING fts5(
+    title, name, content='files', content_rowid='rowid', prefix='2 3'
+);
+CREATE TRIGGER files_fts_insert AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts (rowid, title, name) VALUES (new.rowid, new.title, new.name);
+END;
+CREATE TRIGGER files_fts_delete AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, title, name) VALUES ('delete', old.rowid, old.title, old.name);
+END;
+CREATE TRIGGER files_fts_update AFTER UPDATE OF title, name ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, title, name) VALUES ('delete', old.rowid, old.title, old.name);
+    INSERT INTO files_fts (rowid, title, name) VALUES (new.rowid, new.title, new.name);
+END;
+INSERT INTO files_fts (files_fts) VALUES ('rebuild');
+"""
+
+STAT_COLUMNS = (
+    "title", "duration", "note_count", "note_density", "peak_polyphony",
+    "outside_range_share", "tempo_bpm", "track_count", "playability",
+)
+
+
+def connect(db_path: str = DEFAULT_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _migrate(conn)
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    conn.executescript(SCHEMA)
+    if not has_fts(conn):
+        try:
+            conn.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            print(f"SQLite FTS5 unavailable ({e}); library search falls back to LIKE")
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+
+def has_fts(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'files_fts'").fetchone() is not None
+
+
+def playability_score(note_density: Optional[float], peak_polyphony: Optional[int],
+                      outside_range_share: Optional[float]) -> float:
+    """0-100: how comfortably a file plays on the mapped keyboard range."""
+    density_factor = min(1.0, PLAYABLE_DENSITY / note_density) if note_density else 1.0
+    polyphony_factor = min(1.0, PLAYABLE_POLYPHONY / peak_polyphony) if peak_polyphony else 1.0
+    return round(100.0 * (1.0 - (outside_range_share or 0.0)) * density_factor * polyphony_factor, 1)
+
+
+def analyze_file(path: str, main_start: int = DEFAULT_MAIN_START, main_end: int = DEFAULT_MAIN_END,
+                 known_hash: Optional[str] = None) -> dict:
+    """Analyze one file; runs in a worker process.
+
+    Returns ``{"unchanged": True}`` when the content hash matches
+    ``known_hash``, so the caller only refreshes stat info.
+    """
+    try:
+        content_hash = file_content_hash(path)
+    except OSError as e:
+        return {"path": path, "content_hash": None, "error": str(e)}
+    if content_hash == known_hash:
+        return {"path": path, "content_hash": content_hash, "unchanged": True}
+    try:
+        smf = read_smf_file(path)
+        metadata = extract_smf_metadata(smf, CompiledTimeline.from_smf(smf), content_hash)
+    except Exception as e:
+        return {"path": path, "content_hash": content_hash, "error": str(e) or type(e).__name__}
+
+    histogram = metadata["pitch_histogram"]
+    note_count = metadata["note_count"]
+    outside = sum(count for note, count in enumerate(histogram) if note < main_start or note > main_end)
+    named = [track["name"] for track in metadata["tracks"] if track["name"]]
+    return {
+        "path": path,
+        "content_hash": content_hash,
+        "title": named[0] if named else None,
+        "duration": metadata["length"],
+        "note_count": note_count,
+        "note_density": note_count / metadata["length"] if metadata["length"] else 0.0,
+        "peak_polyphony": metadata["peak_polyphony"],
+        "outside_range_share": outside / note_count if note_count else 0.0,
+        "tempo_bpm": metadata["tempo_map"][0]["bpm"],
+        "playability": playability_score(
+            note_count / metadata["length"] if metadata["length"] else 0.0,
+            metadata["peak_polyphony"],
+            outside / note_count if note_count else 0.0,
+        ),
+        "track_count": metadata["track_count"],
+        "metadata": metadata,
+    }
+
+
+def scan_directory(directory: str) -> dict:
+    """Map every MIDI file under ``directory`` to ``(size, mtime)``."""
+    found = {}
+    for root, _dirs, files in os.walk(directory):
+        for filename in files:
+            if filename.lower().endswith(MIDI_EXTENSIONS):
+                path = os.path.abspath(os.path.join(root, filename))
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found[path] = (stat.st_size, stat.st_mtime)
+    return found
+
+
+class LibraryIndexer:
+    """Keeps ``library.db`` in sync with one or more library directories."""
+
+    def __init__(self, db_path: str = DEFAULT_DB, workers: Optional[int] = None):
+        self.db_path = db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.progress = {"running": False}
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.progress["running"]
+
+    def index_directory(self, directory: str, main_start: int = DEFAULT_MAIN_START,
+                        main_end: int = DEFAULT_MAIN_END,
+                        on_progress: Optional[Callable[[dict], None]] = None) -> dict:
+        if not os.path.isdir(directory):
+            raise ValueError(f"Not a directory: {directory}")
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Library indexing is already running")
+        started = time.perf_counter()
+        progress = {
+            "running": True, "directory": os.path.abspath(directory), "total": 0, "pending": 0,
+            "analyzed": 0, "unchanged": 0, "refreshed": 0, "removed": 0, "errors": 0,
+        }
+        self.progress = progress
+        conn = connect(self.db_path)
+        try:
+            found = scan_directory(directory)
+            progress["total"] = len(found)
+            prefix = os.path.join(progress["directory"], "")
+            pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            known = {
+                path: (size, mtime, content_hash)
+                for path, size, mtime, content_hash in conn.execute(
+                    "SELECT path, size, mtime, content_hash FROM files WHERE path LIKE ? ESCAPE '\\'"
+                    " UNION ALL SELECT path, size, mtime, content_hash FROM failures WHERE path LIKE ? ESCAPE '\\'",
+                    (pattern, pattern),
+                )
+            }
+
+            removed = [(path,) for path in known if path not in found]
+            for table in ("files", "file_metadata", "failures"):
+                conn.executemany(f"DELETE FROM {table} WHERE path = ?", removed)
+            progress["removed"] = len(removed)
+
+            jobs = []
+            for path, (size, mtime) in found.items():
+                previous = known.get(path)
+                if previous is not None and previous[0] == size and previous[1] == mtime:
+                    progress["unchanged"] += 1
+                    continue
+                jobs.append((path, size, mtime, previous[2] if previous else None))
+            progress["pending"] = len(jobs)
+
+            if jobs:
+                self._analyze(conn, jobs, main_start, main_end, progress, on_progress)
+            conn.commit()
+        finally:
+            conn.close()
+            progress["running"] = False
+            progress["elapsed"] = round(time.perf_counter() - started, 3)
+            self._lock.release()
+        if on_progress:
+            on_progress(dict(progress))
+        return dict(progress)
+
+    def _analyze(self, conn, jobs, main_start, main_end, progress, on_progress):
+        stats = {path: (size, mtime) for path, size, mtime, _known in jobs}
+        uncommitted = 0
+        # Spawn rather than fork: the server process has live threads and locks
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)), mp_context=context) as pool:
+            futures = [
+                pool.submit(analyze_file, path, main_start, main_end, known_hash)
+                for path, _size, _mtime, known_hash in jobs
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                size, mtime = stats[result["path"]]
+                self._store(conn, result, size, mtime)
+                if result.get("unchanged"):
+                    progress["refreshed"] += 1
+                elif result.get("error"):
+                    progress["errors"] += 1
+                else:
+                    progress["analyzed"] += 1
+                progress["pending"] -= 1
+                uncommitted += 1
+                if uncommitted >= COMMIT_EVERY:
+                    conn.commit()
+                    uncommitted = 0
+                    if on_progress:
+                        on_progress(dict(progress))
+
+    @staticmethod
+    def _store(conn, result: dict, size: int, mtime: float):
+        path = result["path"]
+        now = time.time()
+        if result.get("unchanged"):
+            for table in ("files", "failures"):
+                conn.execute(
+                    f"UPDATE {table} SET size = ?, mtime = ?, indexed_at = ? WHERE path = ?",
+                    (size, mtime, now, path),
+                )
+            return
+        if result.get("error"):
+            conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            conn.execute("DELETE FROM file_metadata WHERE path = ?", (path,))
+            conn.execute(
+                "INSERT OR REPLACE INTO failures (path, size, mtime, content_hash, error, indexed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (path, size, mtime, result["content_hash"], result["error"], now),
+            )
+            return
+        conn.execute("DELETE FROM failures WHERE path = ?", (path,))
+        # Upsert rather than REPLACE so the rowid (the public file id) stays stable
+        columns = ("path", "name", "size", "mtime", "content_hash", "indexed_at") + STAT_COLUMNS
+        values = (path, os.path.basename(path), size, mtime, result["content_hash"], now)
+        values += tuple(result[column] for column in STAT_COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+        conn.execute(
+            f"INSERT INTO files ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            f" ON CONFLICT (path) DO UPDATE SET {updates}",
+            values,
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO file_metadata (path, metadata) VALUES (?, ?)",
+            (path, json.dumps(result["metadata"])),
+        )
+
+
+class LibrarySearch:
+    """Read side of the library index: search, filter, paginate, fetch."""
+
+    def __init__(self, db_path: str = DEFAULT_DB):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._fts = False
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = connect(self.db_path)
+            conn.execute("PRAGMA mmap_size = 268435456")
+            conn.execute("PRAGMA cache_size = -32768")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            self._fts = has_fts(conn)
+            self._conn = conn
+        return self._conn
+
+    def search(self, query: Optional[str] = None, ranges: Optional[dict] = None,
+               sort: Optional[str] = None, descending: bool = False,
+               limit: int = 50, offset: int = 0) -> dict:
+        """Return ``{"total", "items"}`` for files matching every condition.
+
+        ``query`` words are matched as prefixes of words in the title or
+        file name. ``ranges`` maps ``RANGE_FILTERS`` keys to ``(minimum,
+        maximum)`` pairs, either of which may be None.
+        """
+        if sort is not None and sort not in SORT_COLUMNS:
+            raise ValueError(f"Sort must be one of {', '.join(SORT_COLUMNS)}")
+        conditions = []
+        params: list = []
+        for key, (minimum, maximum) in (ranges or {}).items():
+            column = RANGE_FILTERS.get(key)
+            if column is None:
+                raise ValueError(f"Unknown filter '{key}'")
+            if minimum is not None:
+                conditions.append(f"{column} >= ?")
+                params.append(minimum)
+            if maximum is not None:
+                conditions.append(f"{column} <= ?")
+                params.append(maximum)
+
+        tokens = re.findall(r"\w+", query or "")
+        with self._lock:
+            conn = self._connection()
+            total = None
+            if tokens and self._fts:
+                match = " ".join(f'"{token}"*' for token in tokens)
+                matches = conn.execute("SELECT COUNT(*) FROM files_fts WHERE files_fts MATCH ?", (match,)).fetchone()[0]
+                probe = "rowid"
+                if not conditions:
+                    total = matches
+                    # SQLite has no statistics for FTS results: for broad matches,
+                    # walking the sort index and probing the match set beats
+                    # fetching and sorting every match ("+" disables the rowid lookup).
+                    if matches * 8 > conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]:
+                        probe = "+rowid"
+                conditions.append(f"{probe} IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)")
+                params.append(match)
+            else:
+                for token in tokens:
+                    conditions.append("(title LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\')")
+                    pattern = "%" + token.replace("_", "\\_") + "%"
+                    params.extend((pattern, pattern))
+
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            order = f"{sort or 'name'} {'DESC' if descending else 'ASC'}, rowid"
+            if total is None:
+                total = conn.execute(f"SELECT COUNT(*) FROM files {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT {', '.join(RESULT_COLUMNS)} FROM files {where} ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        items = [dict(zip(("id",) + RESULT_COLUMNS[1:], row)) for row in rows]
+        return {"total": total, "offset": offset, "limit": limit, "items": items}
+
+    def get(self, file_id: int) -> Optional[dict]:
+        """One indexed file by id, including its stored metadata."""
+        columns = ", ".join(f"files.{column}" for column in RESULT_COLUMNS)
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT {columns}, file_metadata.metadata FROM files"
+                " LEFT JOIN file_metadata ON file_metadata.path = files.path WHERE files.rowid = ?",
+                (file_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        item = dict(zip(("id",) + RESULT_COLUMNS[1:], row[:-1]))
+        item["metadata"] = json.loads(row[-1]) if row[-1] else None
+        return item
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index a MIDI library for ROBE")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    index_parser = subparsers.add_parser("index", help="Analyze every MIDI file under a directory")
+    index_parser.add_argument("directory")
+    index_parser.add_argument("--db", default=DEFAULT_DB, help="SQLite index file (default: library.db)")
+    index_parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    index_parser.add_argument("--main-start", type=int, default=DEFAULT_MAIN_START)
+    index_parser.add_argument("--main-end", type=int, default=DEFAULT_MAIN_END)
+    search_parser = subparsers.add_parser("search", help="Search the index by title or file name")
+    search_parser.add_argument("query", nargs="?", default=None)
+    search_parser.add_argument("--db", default=DEFAULT_DB, help="SQLite index file (default: library.db)")
+    search_parser.add_argument("--sort", choices=SORT_COLUMNS, default=None)
+    search_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == "search":
+        started = time.perf_counter()
+        result = LibrarySearch(args.db).search(args.query, sort=args.sort, limit=args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        for item in result["items"]:
+            print(
+                f"{item['id']:>6}  {item['playability']:>5.1f}  {item['duration']:>7.1f}s  "
+                f"{item['title'] or ''} ({item['path']})"
+            )
+        print(f"{result['total']} matches in {elapsed:.1f}ms")
+        return
+
+    indexer = LibraryIndexer(args.db, args.workers)
+
+    def report(progress):
+        done = progress["total"] - progress["pending"]
+        print(f"  {done}/{progress['total']} files", flush=True)
+
+    result = indexer.index_directory(args.directory, args.main_start, args.main_end, on_progress=report)
+    print(
+        f"Indexed {result['directory']}: {result['analyzed']} analyzed, {result['refreshed']} refreshed, "
+        f"{result['unchanged']} unchanged, {result['removed']} removed, {result['errors']} errors "
+        f"in {result['elapsed']:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
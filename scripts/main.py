@@ -3,17 +3,26 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse, Response, JSONResponse
 from pydantic import BaseModel
 import os
-import json
 import asyncio
 from typing import Optional
 import uvicorn
 from midi_processor import MidiProcessor
 from config_manager import ConfigManager
+from broadcast_hub import BroadcastHub
+from ws_protocol import wants_binary, accepted_subprotocol
+from midi_upload import receive_midi_upload, UploadRejected
+from upload_store import UploadStore
+from playlist import Playlist
+from library_index import LibraryIndexer, LibrarySearch
+from midi_metadata import METADATA_VERSION
+from metrics import registry as metrics_registry
+from sampling_profiler import SamplingProfiler, DEFAULT_THREADS as PROFILED_THREADS
 import keyboard
 import threading
 import psutil
 import mido  # Added import for MIDI devices
 import webbrowser
+import multiprocessing
 import time
 
 try:
@@ -42,14 +51,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-config_manager = ConfigManager()
+# Player state and services, built by create_services(). Nothing here is
+# constructed at import: the library indexer's spawned worker processes
+# import this file again as __mp_main__ and must not open the config,
+# purge uploads or start the keyboard and broadcast threads.
+config_manager: Optional[ConfigManager] = None
+upload_store: Optional[UploadStore] = None
+broadcast_hub: Optional[BroadcastHub] = None
+midi_processor: Optional[MidiProcessor] = None
+playlist: Optional[Playlist] = None
+library_indexer: Optional[LibraryIndexer] = None
+library_search: Optional[LibrarySearch] = None
+profiler: Optional[SamplingProfiler] = None
 
 # Global state - load from config
 current_midi_file: Optional[str] = None
 is_playing: bool = False
 is_paused: bool = False  # Added pause state tracking
-current_tempo: float = config_manager.get("tempo", 100.0)
-websocket_connections: list[WebSocket] = []
+current_tempo: float = 100.0
 keyboard_controls_enabled: bool = True
 keyboard_bindings = {
     "F1": "Play/Resume",
@@ -61,15 +80,62 @@ keyboard_bindings = {
     "F7": "Toggle Velocity"
 }
 
-midi_processor = MidiProcessor(config_manager)
+def sync_queue_playback(track: Optional[dict], playing: bool):
+    """Mirror playlist-driven playback into the global player state"""
+    global current_midi_file, is_playing, is_paused
+    if track is not None:
+        current_midi_file = track["path"]
+    is_playing = playing
+    is_paused = midi_processor.is_paused
 
-if config_manager.get("window_targeting_enabled", False):
-    target_window = config_manager.get("target_window")
-    if target_window:
-        midi_processor.set_target_window(target_window)
+def create_services():
+    """Build the config, stores, processor and the rest once, before serving"""
+    global config_manager, upload_store, broadcast_hub, midi_processor, playlist
+    global library_indexer, library_search, profiler, current_tempo
+    if config_manager is not None:
+        return
+
+    config_manager = ConfigManager()
+    upload_store = UploadStore()
+    current_tempo = config_manager.get("tempo", 100.0)
+    broadcast_hub = BroadcastHub(
+        frame_rate=config_manager.get("broadcast_frame_rate", 30.0),
+        queue_size=config_manager.get("broadcast_queue_size", 64)
+    )
+    midi_processor = MidiProcessor(config_manager)
+    playlist = Playlist(midi_processor, on_change=broadcast_hub.publish, on_playback=sync_queue_playback)
+    library_indexer = LibraryIndexer(config_manager.get("library_db", "library.db"))
+    library_search = LibrarySearch(library_indexer.db_path)
+    profiler = SamplingProfiler()
+
+    metrics_registry.enabled = config_manager.get("metrics_enabled", False)
+    metrics_registry.gauge("robe_event_queue_depth", "Key actions waiting for the keyboard worker",
+                           lambda: len(midi_processor.event_queue))
+    metrics_registry.gauge("robe_event_queue_high_water", "Deepest the key action queue has been",
+                           lambda: midi_processor.event_queue.high_water)
+    metrics_registry.counter("robe_action_overruns_total", "Key actions dropped because the queue was full",
+                             lambda: midi_processor.event_queue.overruns)
+    metrics_registry.gauge("robe_websocket_clients", "Connected WebSocket clients", lambda: len(broadcast_hub))
+    metrics_registry.counter("robe_config_writes_total", "Configuration file writes",
+                             lambda: config_manager.writes)
+    metrics_registry.gauge("robe_playing", "1 while a file is playing", lambda: int(is_playing))
+
+    if config_manager.get("window_targeting_enabled", False):
+        target_window = config_manager.get("target_window")
+        if target_window:
+            midi_processor.set_target_window(target_window)
 
 class TempoRequest(BaseModel):
     tempo: float
+    ramp: float = 0.0
+
+class TempoSection(BaseModel):
+    start: float
+    end: float
+    tempo: float
+
+class TempoSectionsRequest(BaseModel):
+    sections: list[TempoSection]
 
 class SustainRequest(BaseModel):
     enabled: bool
@@ -91,6 +157,36 @@ class MidiOutputRequest(BaseModel):
 class KeyBindingsRequest(BaseModel):
     bindings: dict
 
+class QueueAddRequest(BaseModel):
+    names: list[str]
+
+class QueuePlayRequest(BaseModel):
+    index: Optional[int] = None
+
+class QueueModeRequest(BaseModel):
+    shuffle: Optional[bool] = None
+    repeat: Optional[str] = None
+
+class LibraryIndexRequest(BaseModel):
+    directory: Optional[str] = None
+
+class LibrarySelectRequest(BaseModel):
+    id: int
+
+class MetricsSettingsRequest(BaseModel):
+    enabled: Optional[bool] = None
+    interval: Optional[float] = None
+    reset: bool = False
+
+class ProfilerStartRequest(BaseModel):
+    interval: float = 0.01
+    all_threads: bool = False
+
+class LogSettingsRequest(BaseModel):
+    level: Optional[str] = None
+    trace_notes: Optional[bool] = None
+    file: Optional[str] = None
+
 def setup_keyboard_controls():
     """Set up global keyboard hotkeys for playback control"""
     global keyboard_controls_enabled, keyboard_hook
@@ -203,7 +299,7 @@ async def play_midi_async():
     
     is_playing = True
     is_paused = False
-    midi_processor.set_note_callback(broadcast_to_websockets)
+    midi_processor.set_note_callback(broadcast_hub.publish)
     asyncio.create_task(midi_processor.play_midi_file(current_midi_file, current_tempo))
 
 async def pause_midi_async():
@@ -220,15 +316,25 @@ async def resume_midi_async():
     if is_paused and current_midi_file:
         is_playing = True
         is_paused = False
-        midi_processor.resume_playback(current_midi_file)
+        resume_current_file()
         await broadcast_to_websockets({"type": "playback_resumed"})
 
+def resume_current_file():
+    """Resume the paused file, through the queue if the queue was playing it"""
+    midi_processor.set_note_callback(broadcast_hub.publish)
+    if playlist.engaged:
+        playlist.resume()
+    else:
+        midi_processor.resume_playback(current_midi_file)
+
 async def stop_midi_async():
     """Async wrapper for stop functionality"""
     global is_playing, is_paused
     is_playing = False
     is_paused = False
     midi_processor.stop_playback()
+    if playlist.engaged or playlist.playing:
+        playlist.stop()
     await broadcast_to_websockets({"type": "current_note", "note": ""})
 
 async def broadcast_tempo_change():
@@ -252,6 +358,24 @@ async def broadcast_velocity_change(enabled: bool):
         "enabled": enabled
     })
 
+async def publish_metrics():
+    """Send a metrics snapshot to WebSocket clients every metrics_interval seconds"""
+    while True:
+        await asyncio.sleep(config_manager.get("metrics_interval", 1.0))
+        if metrics_registry.enabled and len(broadcast_hub):
+            broadcast_hub.publish({"type": "metrics", "metrics": metrics_registry.snapshot()})
+
+@app.on_event("startup")
+async def start_services():
+    """Build the player services (when not started from __main__) and the metrics message"""
+    create_services()
+    asyncio.create_task(publish_metrics())
+
+@app.on_event("shutdown")
+async def flush_config_on_shutdown():
+    """Write any pending configuration changes before exiting"""
+    config_manager.flush()
+
 @app.get("/", response_class=HTMLResponse)
 async def serve_frontend_root():
     """Serve the main frontend page"""
@@ -296,55 +420,6 @@ async def serve_frontend_root():
     else:
         return JSONResponse(content={"message": "ROBE MIDI Player API is running - please access the frontend at http://localhost:3000"})
 
-@app.get("/{file_path:path}")
-async def serve_embedded_files(file_path: str):
-    """Serve embedded frontend files"""
-    if not EMBEDDED_MODE:
-        raise HTTPException(status_code=404, detail="File not found - not in embedded mode")
-    
-    # Try to get the file content
-    content = get_file_content(file_path)
-    if content is None:
-        # Try with different path variations
-        variations = [
-            f"static/{file_path}",
-            f"server/{file_path}",
-            f"pages/{file_path}",
-            f"_next/{file_path}"
-        ]
-        
-        for variation in variations:
-            content = get_file_content(variation)
-            if content is not None:
-                break
-    
-    if content is None:
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    # Determine content type
-    content_type = "text/plain"
-    if file_path.endswith('.html'):
-        content_type = "text/html"
-    elif file_path.endswith('.css'):
-        content_type = "text/css"
-    elif file_path.endswith('.js'):
-        content_type = "application/javascript"
-    elif file_path.endswith('.json'):
-        content_type = "application/json"
-    elif file_path.endswith('.png'):
-        content_type = "image/png"
-    elif file_path.endswith('.jpg') or file_path.endswith('.jpeg'):
-        content_type = "image/jpeg"
-    elif file_path.endswith('.svg'):
-        content_type = "image/svg+xml"
-    elif file_path.endswith('.ico'):
-        content_type = "image/x-icon"
-    
-    if isinstance(content, str):
-        return Response(content=content, media_type=content_type)
-    else:
-        return Response(content=content, media_type=content_type)
-
 @app.get("/api")
 async def root():
     return {
@@ -357,10 +432,12 @@ async def root():
             "play": "POST /api/play - Start playback",
             "pause": "POST /api/pause - Pause playback",
             "stop": "POST /api/stop - Stop playback", 
-            "tempo": "POST /api/tempo - Change tempo",
+            "tempo": "POST /api/tempo - Change tempo, optionally ramping over 'ramp' seconds",
+            "tempo_sections": "GET /api/tempo/sections - Get the current file's section tempo presets",
+            "update_tempo_sections": "POST /api/tempo/sections - Set the current file's section tempo presets",
             "seek": "POST /api/seek - Seek to position",
             "info": "GET /api/info - Get current status",
-            "websocket": "WS /ws - Real-time updates",
+            "websocket": "WS /ws - Real-time updates (add ?protocol=binary for compact binary telemetry)",
             "sustain": "POST /api/sustain - Toggle sustain pedal support",
             "velocity": "POST /api/velocity - Toggle velocity mapping support",
             "config": "GET /api/config - Get current configuration",
@@ -371,7 +448,27 @@ async def root():
             "midi_output": "POST /api/midi-output - Toggle direct MIDI output mode",
             "midi_devices": "GET /api/midi-devices - Get list of available MIDI devices",
             "keyboard_bindings": "GET /api/keyboard-bindings - Get current keyboard bindings",
-            "update_keyboard_bindings": "POST /api/keyboard-bindings - Update keyboard bindings"
+            "update_keyboard_bindings": "POST /api/keyboard-bindings - Update keyboard bindings",
+            "log": "GET /api/log - Get event log settings",
+            "update_log": "POST /api/log - Change log level, per-note tracing or log file",
+            "uploads": "GET /api/uploads - List uploaded files",
+            "queue": "GET /api/queue - Get play queue state",
+            "queue_add": "POST /api/queue - Add uploaded files to the queue by name",
+            "queue_remove": "DELETE /api/queue/{index} - Remove a track from the queue",
+            "queue_clear": "DELETE /api/queue - Clear the queue",
+            "queue_play": "POST /api/queue/play - Play the queue, optionally from a given track",
+            "queue_next": "POST /api/queue/next - Skip to the next track",
+            "queue_previous": "POST /api/queue/previous - Go back to the previous track",
+            "queue_mode": "POST /api/queue/mode - Set shuffle and repeat (off, one, all)",
+            "library_index": "POST /api/library/index - Analyze a MIDI library directory in the background",
+            "library_index_status": "GET /api/library/index - Get library indexing progress",
+            "library": "GET /api/library - Search and filter the indexed library",
+            "library_select": "POST /api/library/select - Load an indexed file for playback",
+            "metrics": "GET /api/metrics - Player metrics in Prometheus text format",
+            "metrics_settings": "POST /api/metrics - Enable, disable or reset metrics and set the WebSocket interval",
+            "profiler": "GET /api/profiler - Sampling profiler status",
+            "profiler_start": "POST /api/profiler/start - Start the built-in sampling profiler",
+            "profiler_stop": "POST /api/profiler/stop - Stop the profiler and download collapsed stacks (?format=json for JSON)"
         }
     }
 
@@ -383,39 +480,37 @@ async def upload_midi_file(file: UploadFile = File(...)):
     if not file.filename.endswith(('.mid', '.midi')):
         raise HTTPException(status_code=400, detail="File must be a MIDI file (.mid or .midi)")
     
-    # Validate file size (max 10MB)
-    file_content = await file.read()
-    if len(file_content) > 10 * 1024 * 1024:  # 10MB
-        raise HTTPException(status_code=400, detail="File too large. Maximum size is 10MB.")
-    
-    # Create uploads directory if it doesn't exist
-    os.makedirs("uploads", exist_ok=True)
-    
-    # Save the uploaded file with a safe filename
     safe_filename = "".join(c for c in file.filename if c.isalnum() or c in "._-")
-    file_path = f"uploads/{safe_filename}"
-    
-    # Handle duplicate filenames
-    counter = 1
-    original_path = file_path
-    while os.path.exists(file_path):
-        name, ext = os.path.splitext(original_path)
-        file_path = f"{name}_{counter}{ext}"
-        counter += 1
     
-    with open(file_path, "wb") as buffer:
-        buffer.write(file_content)
+    # Stream to disk, enforcing the size cap and SMF structure as bytes arrive
+    try:
+        temp_path, file_size, content_hash = await receive_midi_upload(file, upload_store.root)
+    except UploadRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    current_midi_file = file_path
+    # Identical content is stored once; a duplicate reuses its blob and cached analysis
+    file_path, duplicate = upload_store.ingest(temp_path, content_hash)
     
     # Get MIDI file information
-    midi_info = midi_processor.get_midi_info(file_path)
+    try:
+        midi_info = await asyncio.get_running_loop().run_in_executor(
+            None, midi_processor.get_midi_info, file_path, content_hash
+        )
+    except Exception as e:
+        if not duplicate:
+            upload_store.discard_blob(content_hash)
+        raise HTTPException(status_code=400, detail=f"Invalid MIDI file: {str(e) or type(e).__name__}")
+    
+    display_name = upload_store.add_name(safe_filename, content_hash, file_size)
+    current_midi_file = file_path
     
     return {
         "message": "File uploaded successfully",
-        "filename": safe_filename,
+        "filename": display_name,
         "path": file_path,
-        "size": len(file_content),
+        "size": file_size,
+        "content_hash": content_hash,
+        "duplicate": duplicate,
         "info": midi_info
     }
 
@@ -437,13 +532,13 @@ async def play_midi():
         # Resume from pause
         is_playing = True
         is_paused = False
-        midi_processor.resume_playback(current_midi_file)
+        resume_current_file()
         return {"message": "Playback resumed", "file": current_midi_file, "tempo": current_tempo}
     else:
         # Start from beginning
         is_playing = True
         is_paused = False
-        midi_processor.set_note_callback(broadcast_to_websockets)
+        midi_processor.set_note_callback(broadcast_hub.publish)
         asyncio.create_task(midi_processor.play_midi_file(current_midi_file, current_tempo))
         return {"message": "Playback started", "file": current_midi_file, "tempo": current_tempo}
 
@@ -471,6 +566,8 @@ async def stop_midi():
     is_playing = False
     is_paused = False
     midi_processor.stop_playback()
+    if playlist.engaged or playlist.playing:
+        playlist.stop()
     
     # Notify all connected clients that playback stopped
     await broadcast_to_websockets({
@@ -482,30 +579,59 @@ async def stop_midi():
 
 @app.post("/api/tempo")
 async def set_tempo(request: TempoRequest):
-    """Change the playback tempo"""
+    """Change the playback tempo, at once or as a linear ramp over request.ramp seconds"""
     global current_tempo
     
     if request.tempo < 25 or request.tempo > 200:
         raise HTTPException(status_code=400, detail="Tempo must be between 25 and 200")
+    if request.ramp < 0:
+        raise HTTPException(status_code=400, detail="Ramp duration cannot be negative")
     
     current_tempo = request.tempo
     config_manager.set("tempo", current_tempo)
     
     if is_playing:
-        midi_processor.update_tempo(current_tempo)
+        midi_processor.update_tempo(current_tempo, request.ramp)
     
+    if request.ramp > 0 and is_playing:
+        return {"message": f"Tempo ramping to {current_tempo}% over {request.ramp:g}s"}
     return {"message": f"Tempo set to {current_tempo}%"}
 
+def _sections_payload(sections: list) -> list:
+    return [{"start": start, "end": end, "tempo": tempo} for start, end, tempo in sections]
+
+@app.get("/api/tempo/sections")
+async def get_tempo_sections():
+    """Get the section tempo presets of the current file"""
+    if not current_midi_file:
+        raise HTTPException(status_code=400, detail="No MIDI file loaded")
+    return {"file": current_midi_file, "sections": _sections_payload(midi_processor.tempo_presets.get(current_midi_file))}
+
+@app.post("/api/tempo/sections")
+async def set_tempo_sections(request: TempoSectionsRequest):
+    """Set the section tempo presets of the current file (applied on top of the main tempo)"""
+    if not current_midi_file:
+        raise HTTPException(status_code=400, detail="No MIDI file loaded")
+    try:
+        sections = midi_processor.set_tempo_sections(
+            current_midi_file, [(section.start, section.end, section.tempo) for section in request.sections])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"file": current_midi_file, "sections": _sections_payload(sections)}
+
 @app.post("/api/seek")
 async def seek_position(request: SeekRequest):
     """Seek to a specific position in the MIDI file"""
     if not current_midi_file:
         raise HTTPException(status_code=400, detail="No MIDI file loaded")
     
-    if not is_playing:
+    if not is_playing and not is_paused:
         raise HTTPException(status_code=400, detail="Not currently playing")
     
-    midi_processor.seek_position(request.position)
+    if request.position < 0:
+        raise HTTPException(status_code=400, detail="Position must be non-negative")
+    
+    midi_processor.seek(request.position)
     
     return {"message": f"Seeking to position {request.position:.2f}s"}
 
@@ -531,7 +657,7 @@ async def get_current_info():
         "is_paused": is_paused,
         "current_tempo": current_tempo,
         "current_file": current_midi_file,
-        "websocket_connections": len(websocket_connections),
+        "websocket_connections": len(broadcast_hub),
         "sustain_enabled": midi_processor.sustain_enabled,
         "velocity_enabled": midi_processor.velocity_enabled,
         "keyboard_controls_enabled": keyboard_controls_enabled,
@@ -539,19 +665,19 @@ async def get_current_info():
         "window_targeting_enabled": midi_processor.window_targeting_enabled,
         "target_window": midi_processor.target_window,
         "use_midi_output": midi_processor.use_midi_output,
-        "midi_device": midi_processor.midi_device
+        "midi_device": midi_processor.midi_device,
+        "scheduler": midi_processor.get_scheduler_stats(),
+        "keyboard": midi_processor.get_keyboard_stats(),
+        "action_scripts": midi_processor.action_scripts.stats(),
+        "broadcast": broadcast_hub.stats(),
+        "uploads": upload_store.stats(),
+        "queue": playlist.state()
     }
     
-    if current_midi_file and os.path.exists(current_midi_file):
-        try:
-            mid = mido.MidiFile(current_midi_file)
-            info["midi_info"] = {
-                "length": mid.length,
-                "ticks_per_beat": mid.ticks_per_beat,
-                "type": mid.type
-            }
-        except Exception as e:
-            info["midi_info"] = {"error": str(e)}
+    if current_midi_file:
+        midi_info = midi_processor.get_cached_midi_info(current_midi_file)
+        if midi_info is not None:
+            info["midi_info"] = midi_info
     
     return info
 
@@ -564,62 +690,215 @@ async def clear_uploads():
         raise HTTPException(status_code=400, detail="Cannot clear files while playing or paused")
     
     try:
-        uploads_dir = "uploads"
-        if os.path.exists(uploads_dir):
-            for filename in os.listdir(uploads_dir):
-                file_path = os.path.join(uploads_dir, filename)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-        
+        preload = playlist.cancel_preload()
+        playlist.clear()
+        if preload is not None:
+            await asyncio.wait([asyncio.wrap_future(preload)])
+        midi_processor.release_files()
+        upload_store.clear()
+
         current_midi_file = None
+        midi_processor.metadata_cache.forget()
+        midi_processor.tempo_presets.forget()
         return {"message": "All uploaded files cleared"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to clear files: {str(e)}")
 
+@app.get("/api/uploads")
+async def list_uploads():
+    """List uploaded files by display name"""
+    return {"files": upload_store.list()}
+
+@app.get("/api/queue")
+async def get_queue():
+    """Get the play queue"""
+    return playlist.state()
+
+@app.post("/api/queue")
+async def add_to_queue(request: QueueAddRequest):
+    """Append uploaded files to the play queue"""
+    entries = []
+    for name in request.names:
+        entry = upload_store.lookup(name)
+        if entry is None:
+            raise HTTPException(status_code=400, detail=f"No uploaded file named '{name}'")
+        entries.append(entry)
+    for entry in entries:
+        playlist.add(entry["name"], entry["path"], entry["hash"])
+    return playlist.state()
+
+@app.delete("/api/queue/{index}")
+async def remove_from_queue(index: int):
+    """Remove a track from the play queue"""
+    try:
+        playlist.remove(index)
+    except (IndexError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return playlist.state()
+
+@app.delete("/api/queue")
+async def clear_queue():
+    """Remove every track from the play queue"""
+    try:
+        playlist.clear()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return playlist.state()
+
+@app.post("/api/queue/play")
+async def play_queue(request: QueuePlayRequest):
+    """Play the queue from the given track, or from the current one"""
+    midi_processor.set_note_callback(broadcast_hub.publish)
+    try:
+        playlist.play(request.index, current_tempo)
+    except (IndexError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return playlist.state()
+
+@app.post("/api/queue/next")
+async def next_track():
+    """Skip to the next track in the queue"""
+    try:
+        playlist.next()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return playlist.state()
+
+@app.post("/api/queue/previous")
+async def previous_track():
+    """Go back to the previous track in the queue"""
+    try:
+        playlist.previous()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return playlist.state()
+
+@app.post("/api/queue/mode")
+async def set_queue_mode(request: QueueModeRequest):
+    """Set shuffle and repeat mode"""
+    try:
+        playlist.set_mode(request.shuffle, request.repeat)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return playlist.state()
+
+@app.post("/api/library/index")
+async def index_library(request: LibraryIndexRequest):
+    """Start (re)indexing a MIDI library directory in the background"""
+    directory = request.directory or config_manager.get("library_dir")
+    if not directory:
+        raise HTTPException(status_code=400, detail="No library directory given or configured")
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=400, detail=f"Not a directory: {directory}")
+    if library_indexer.running:
+        raise HTTPException(status_code=400, detail="Library indexing is already running")
+    
+    config_manager.set("library_dir", directory)
+    
+    def report(progress: dict):
+        broadcast_hub.publish_threadsafe({"type": "library_index", **progress})
+    
+    def run():
+        try:
+            library_indexer.index_directory(
+                directory, midi_processor.main_start_note, midi_processor.main_end_note, on_progress=report
+            )
+        except Exception as e:
+            print(f"Library indexing failed: {e}")
+    
+    asyncio.get_running_loop().run_in_executor(None, run)
+    return {"message": f"Indexing {directory}", "directory": directory}
+
+@app.get("/api/library/index")
+async def get_library_index_status():
+    """Get progress of the current or last library indexing run"""
+    return library_indexer.progress
+
+@app.get("/api/library")
+async def search_library(
+    q: Optional[str] = None,
+    min_duration: Optional[float] = None, max_duration: Optional[float] = None,
+    min_density: Optional[float] = None, max_density: Optional[float] = None,
+    min_playability: Optional[float] = None, max_playability: Optional[float] = None,
+    min_tempo: Optional[float] = None, max_tempo: Optional[float] = None,
+    sort: Optional[str] = None, order: str = "asc",
+    limit: int = 50, offset: int = 0
+):
+    """Search the library index by title/filename prefix with range filters"""
+    if limit < 1 or limit > 500 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be 1-500 and offset non-negative")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    ranges = {
+        "duration": (min_duration, max_duration),
+        "density": (min_density, max_density),
+        "playability": (min_playability, max_playability),
+        "tempo": (min_tempo, max_tempo),
+    }
+    try:
+        return library_search.search(
+            q, {key: bounds for key, bounds in ranges.items() if bounds != (None, None)},
+            sort, order == "desc", limit, offset
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/library/select")
+async def select_library_file(request: LibrarySelectRequest):
+    """Make an indexed library file the current MIDI file"""
+    global current_midi_file
+    
+    if is_playing or is_paused:
+        raise HTTPException(status_code=400, detail="Stop playback before loading another file")
+    
+    item = library_search.get(request.id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="No indexed file with that id")
+    
+    metadata = item.pop("metadata")
+    info = None
+    if metadata and metadata.get("version") == METADATA_VERSION:
+        midi_processor.metadata_cache.prime(item["path"], metadata)
+        info = midi_processor.get_cached_midi_info(item["path"])
+    current_midi_file = item["path"]
+    
+    return {"message": "File selected", "file": item, "info": info}
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time communication"""
-    await websocket.accept()
-    websocket_connections.append(websocket)
+    binary = wants_binary(websocket)
+    await websocket.accept(subprotocol=accepted_subprotocol(websocket))
+    broadcast_hub.attach(websocket, binary=binary)
     
     # Send initial status
-    await websocket.send_text(json.dumps({
+    broadcast_hub.send_to(websocket, {
         "type": "status",
+        "protocol": "binary" if binary else "json",
         "is_playing": is_playing,
         "is_paused": is_paused,
         "current_tempo": current_tempo,
-        "connections": len(websocket_connections),
+        "connections": len(broadcast_hub),
         "sustain_enabled": midi_processor.sustain_enabled,
         "velocity_enabled": midi_processor.velocity_enabled
-    }))
+    })
     
     try:
         while True:
             # Keep the connection alive and handle any incoming messages
             message = await websocket.receive_text()
             # Echo back for debugging
-            await websocket.send_text(json.dumps({
+            broadcast_hub.send_to(websocket, {
                 "type": "echo",
                 "message": f"Received: {message}"
-            }))
+            })
     except WebSocketDisconnect:
-        websocket_connections.remove(websocket)
-        print(f"WebSocket disconnected. Active connections: {len(websocket_connections)}")
+        broadcast_hub.detach(websocket)
+        print(f"WebSocket disconnected. Active connections: {len(broadcast_hub)}")
 
 async def broadcast_to_websockets(message: dict):
     """Broadcast a message to all connected WebSocket clients"""
-    if websocket_connections:
-        disconnected = []
-        for websocket in websocket_connections:
-            try:
-                await websocket.send_text(json.dumps(message))
-            except:
-                disconnected.append(websocket)
-        
-        # Remove disconnected clients
-        for ws in disconnected:
-            if ws in websocket_connections:
-                websocket_connections.remove(ws)
+    broadcast_hub.publish(message)
 
 @app.get("/api/config")
 async def get_config():
@@ -728,6 +1007,136 @@ async def get_keyboard_bindings():
     })
     return {"bindings": bindings}
 
+@app.get("/api/log")
+async def get_log_settings():
+    """Get event log settings and counters"""
+    return midi_processor.log.status()
+
+@app.post("/api/log")
+async def update_log_settings(request: LogSettingsRequest):
+    """Change log level, per-note tracing or the log output file"""
+    log = midi_processor.log
+    try:
+        if request.level is not None:
+            log.set_level(request.level)
+        if request.trace_notes is not None:
+            log.set_trace_notes(request.trace_notes)
+        if request.file is not None:
+            log.set_output(request.file or None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to open log file: {str(e)}")
+    return log.status()
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Player metrics in Prometheus text format"""
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/api/metrics")
+async def update_metrics_settings(request: MetricsSettingsRequest):
+    """Switch metrics collection on or off, reset it, or change the WebSocket interval"""
+    if request.interval is not None:
+        if request.interval <= 0:
+            raise HTTPException(status_code=400, detail="interval must be positive")
+        config_manager.set("metrics_interval", request.interval)
+    if request.enabled is not None:
+        metrics_registry.enabled = request.enabled
+        config_manager.set("metrics_enabled", request.enabled)
+    if request.reset:
+        metrics_registry.reset()
+    return {
+        "enabled": metrics_registry.enabled,
+        "interval": config_manager.get("metrics_interval", 1.0),
+    }
+
+@app.get("/api/profiler")
+async def get_profiler_status():
+    """Sampling profiler status"""
+    return profiler.status()
+
+@app.post("/api/profiler/start")
+async def start_profiler(request: ProfilerStartRequest):
+    """Start sampling the event loop, keyboard worker and playback scheduler threads"""
+    try:
+        # Endpoints run on the event loop thread, which uvicorn leaves named MainThread
+        profiler.start(
+            interval=request.interval,
+            threads=None if request.all_threads else PROFILED_THREADS,
+            aliases={threading.get_ident(): "event-loop"},
+        )
+    except (RuntimeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profiler.status()
+
+@app.post("/api/profiler/stop")
+async def stop_profiler(format: str = "collapsed"):
+    """Stop the profiler and return collapsed stacks (flamegraph.pl / speedscope input)"""
+    if format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'json'")
+    try:
+        result = profiler.stop()
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "json":
+        return result
+    filename = time.strftime("robe-profile-%Y%m%d-%H%M%S.folded")
+    return Response(
+        content=profiler.collapsed(),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/{file_path:path}")
+async def serve_embedded_files(file_path: str):
+    """Serve embedded frontend files"""
+    if not EMBEDDED_MODE:
+        raise HTTPException(status_code=404, detail="File not found - not in embedded mode")
+    
+    # Try to get the file content
+    content = get_file_content(file_path)
+    if content is None:
+        # Try with different path variations
+        variations = [
+            f"static/{file_path}",
+            f"server/{file_path}",
+            f"pages/{file_path}",
+            f"_next/{file_path}"
+        ]
+        
+        for variation in variations:
+            content = get_file_content(variation)
+            if content is not None:
+                break
+    
+    if content is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Determine content type
+    content_type = "text/plain"
+    if file_path.endswith('.html'):
+        content_type = "text/html"
+    elif file_path.endswith('.css'):
+        content_type = "text/css"
+    elif file_path.endswith('.js'):
+        content_type = "application/javascript"
+    elif file_path.endswith('.json'):
+        content_type = "application/json"
+    elif file_path.endswith('.png'):
+        content_type = "image/png"
+    elif file_path.endswith('.jpg') or file_path.endswith('.jpeg'):
+        content_type = "image/jpeg"
+    elif file_path.endswith('.svg'):
+        content_type = "image/svg+xml"
+    elif file_path.endswith('.ico'):
+        content_type = "image/x-icon"
+    
+    if isinstance(content, str):
+        return Response(content=content, media_type=content_type)
+    else:
+        return Response(content=content, media_type=content_type)
+
 def open_browser():
     """Open the web browser to the application after a short delay"""
     time.sleep(2)  # Wait for server to start
@@ -739,6 +1148,8 @@ def open_browser():
         print("📱 Please manually open http://localhost:8000 in your browser")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    create_services()
     print("🎹 Starting ROBE MIDI Player...")
     
     if EMBEDDED_MODE:
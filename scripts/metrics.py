@@ -0,0 +1,176 @@
+"""Low-overhead counters, gauges and histograms with Prometheus text output.
+
+Hot paths guard every observation with ``if registry.enabled:``, so with
+metrics switched off the cost is one attribute check. Metrics that mirror
+state the app already tracks (queue depth, config writes, ...) take a
+``func`` that is only called when the registry is rendered, and cost
+nothing on the hot path either way.
+
+Each metric is updated without a lock and is meant to have a single
+writing thread (the scheduler, the keyboard worker or the event loop).
+"""
+from bisect import bisect_left
+from typing import Callable, Optional
+
+
+# Upper bounds in seconds, from 10 µs to 1 s
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _label_text(labels: dict, **extra) -> str:
+    pairs = [*labels.items(), *extra.items()]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, func: Optional[Callable[[], float]] = None,
+                 labels: Optional[dict] = None):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.labels = dict(labels or {})
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def get(self) -> float:
+        return self.func() if self.func is not None else self.value
+
+    def reset(self):
+        self.value = 0
+
+    def samples(self) -> list:
+        return [(self.name, _label_text(self.labels), self.get())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS,
+                 labels: Optional[dict] = None):
+        self.name = name
+        self.help = help_text
+        self.labels = dict(labels or {})
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile (0 when empty)."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def get(self) -> dict:
+        # JSON has no infinity; None means "above the largest bucket"
+        p50 = self.quantile(0.5)
+        p99 = self.quantile(0.99)
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": None if p50 == float("inf") else p50,
+            "p99": None if p99 == float("inf") else p99,
+        }
+
+    def samples(self) -> list:
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            result.append((f"{self.name}_bucket", _label_text(self.labels, le=f"{bound:g}"), cumulative))
+        result.append((f"{self.name}_bucket", _label_text(self.labels, le="+Inf"), self.count))
+        result.append((f"{self.name}_sum", _label_text(self.labels), self.sum))
+        result.append((f"{self.name}_count", _label_text(self.labels), self.count))
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._metrics: dict = {}
+
+    def _register(self, metric):
+        # Metrics with the same name and different labels form one family
+        key = metric.name + _label_text(metric.labels)
+        for other in self._metrics.values():
+            if other.name == metric.name and type(other) is not type(metric):
+                raise ValueError(f"Metric '{metric.name}' is already registered as a {other.kind}")
+        existing = self._metrics.get(key)
+        if existing is not None:
+            if getattr(metric, "func", None) is not None:
+                existing.func = metric.func
+            return existing
+        self._metrics[key] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, func: Optional[Callable[[], float]] = None,
+                labels: Optional[dict] = None) -> Counter:
+        return self._register(Counter(name, help_text, func, labels))
+
+    def gauge(self, name: str, help_text: str, func: Optional[Callable[[], float]] = None,
+              labels: Optional[dict] = None) -> Gauge:
+        return self._register(Gauge(name, help_text, func, labels))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS,
+                  labels: Optional[dict] = None) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets, labels))
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        families: dict = {}
+        for metric in self._metrics.values():
+            families.setdefault(metric.name, []).append(metric)
+        lines = []
+        for name, metrics in families.items():
+            lines.append(f"# HELP {name} {metrics[0].help}")
+            lines.append(f"# TYPE {name} {metrics[0].kind}")
+            for metric in metrics:
+                for sample_name, labels, value in metric.samples():
+                    lines.append(f"{sample_name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {name: metric.get() for name, metric in self._metrics.items()}
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+from typing import Optional
+
+import mido
+
+from midi_timeline import EVENT_NOTE_ON, EVENT_CONTROL_CHANGE
+
+
+METADATA_VERSION = 2
+DEFAULT_TEMPO = 500000
+
+
+def extract_metadata(mid: mido.MidiFile, content_hash: Optional[str] = None) -> dict:
+    """Summarize a parsed MIDI file in a single pass over its tracks.
+
+    Key-mapping dependent numbers are not stored here; ``pitch_histogram``
+    lets callers derive them for whatever mapping is current.
+    """
+    pitch_histogram = [0] * 128
+    channel_notes: dict[int, int] = {}
+    tracks = []
+    for track in mid.tracks:
+        notes = 0
+        for msg in track:
+            if msg.type == "note_on" and msg.velocity > 0:
+                notes += 1
+                pitch_histogram[msg.note] += 1
+                channel_notes[msg.channel] = channel_notes.get(msg.channel, 0) + 1
+        tracks.append({"name": track.name, "events": len(track), "notes": notes})
+
+    tempo_map = []
+    tempo = DEFAULT_TEMPO
+    ticks = 0
+    seconds = 0.0
+    sounding = set()
+    peak_polyphony = 0
+    for msg in mido.merge_tracks(mid.tracks):
+        if msg.time:
+            ticks += msg.time
+            seconds += mido.tick2second(msg.time, mid.ticks_per_beat, tempo)
+        if msg.type == "note_on" and msg.velocity > 0:
+            sounding.add((msg.channel, msg.note))
+            if len(sounding) > peak_polyphony:
+                peak_polyphony = len(sounding)
+        elif msg.type == "note_off" or msg.type == "note_on":
+            sounding.discard((msg.channel, msg.note))
+        elif msg.type == "set_tempo":
+            tempo = msg.tempo
+            tempo_map.append({
+                "tick": ticks,
+                "time": seconds,
+                "bpm": round(mido.tempo2bpm(tempo), 3),
+            })
+    return _summarize(mid.type, mid.ticks_per_beat, mid.length, tracks, pitch_histogram,
+                      channel_notes, peak_polyphony, tempo_map, content_hash)
+
+
+def extract_smf_metadata(smf, timeline, content_hash: Optional[str] = None) -> dict:
+    """``extract_metadata`` for an ``smf_reader.SmfFile`` and the timeline just compiled from it.
+
+    Needs no mido objects: per-track counts come from the reader's columns,
+    polyphony and the tempo map from the merged timeline.
+    """
+    pitch_histogram = [0] * 128
+    channel_notes: dict[int, int] = {}
+    tracks = []
+    for columns, name, events in zip(smf.tracks, smf.track_names, smf.track_events):
+        notes = 0
+        for kind, channel, note, velocity in zip(*columns[1:]):
+            if kind == EVENT_NOTE_ON and velocity > 0:
+                notes += 1
+                pitch_histogram[note] += 1
+                channel_notes[channel] = channel_notes.get(channel, 0) + 1
+        tracks.append({"name": name, "events": events, "notes": notes})
+
+    sounding = set()
+    peak_polyphony = 0
+    for event_type, channel, note, velocity in zip(timeline.types, timeline.channels,
+                                                   timeline.notes, timeline.velocities):
+        if event_type == EVENT_NOTE_ON and velocity > 0:
+            sounding.add((channel, note))
+            if len(sounding) > peak_polyphony:
+                peak_polyphony = len(sounding)
+        elif event_type != EVENT_CONTROL_CHANGE:
+            sounding.discard((channel, note))
+
+    tempo_map = [
+        {"tick": tick, "time": seconds, "bpm": round(mido.tempo2bpm(tempo), 3)}
+        for tick, seconds, tempo in timeline.tempo_changes
+    ]
+    return _summarize(smf.type, smf.ticks_per_beat, timeline.duration, tracks, pitch_histogram,
+                      channel_notes, peak_polyphony, tempo_map, content_hash)
+
+
+def _summarize(file_type: int, ticks_per_beat: int, length: float, tracks: list, pitch_histogram: list,
+               channel_notes: dict, peak_polyphony: int, tempo_map: list, content_hash: Optional[str]) -> dict:
+    if not tempo_map or tempo_map[0]["tick"] > 0:
+        tempo_map.insert(0, {"tick": 0, "time": 0.0, "bpm": round(mido.tempo2bpm(DEFAULT_TEMPO), 3)})
+
+    used_pitches = [note for note, count in enumerate(pitch_histogram) if count]
+    note_count = sum(pitch_histogram)
+
+    return {
+        "version": METADATA_VERSION,
+        "content_hash": content_hash,
+        "length": length,
+        "ticks_per_beat": ticks_per_beat,
+        "type": file_type,
+        "note_count": note_count,
+        "peak_polyphony": peak_polyphony,
+        "track_count": len(tracks),
+        "tracks": tracks,
+        "channels": {str(channel): count for channel, count in sorted(channel_notes.items())},
+        "pitch_range": {
+            "min": used_pitches[0] if used_pitches else None,
+            "max": used_pitches[-1] if used_pitches else None,
+        },
+        "tempo_map": tempo_map,
+        "pitch_histogram": pitch_histogram,
+    }
+
+
+def metadata_path(file_path: str) -> str:
+    return f"{file_path}.meta.json"
+
+
+class MetadataCache:
+    """In-memory metadata keyed by content hash, persisted next to each file."""
+
+    def __init__(self):
+        self._by_hash: dict[str, dict] = {}
+        self._path_hashes: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, file_path: str, content_hash: str) -> Optional[dict]:
+        with self._lock:
+            metadata = self._by_hash.get(content_hash)
+        if metadata is None:
+            metadata = self._load(file_path, content_hash)
+        if metadata is not None:
+            with self._lock:
+                self._by_hash[content_hash] = metadata
+                self._path_hashes[file_path] = content_hash
+        return metadata
+
+    def peek(self, file_path: str) -> Optional[dict]:
+        """Return metadata for ``file_path`` only if it is already in memory."""
+        with self._lock:
+            content_hash = self._path_hashes.get(file_path)
+            return self._by_hash.get(content_hash) if content_hash else None
+
+    def prime(self, file_path: str, metadata: dict):
+        """Remember metadata computed elsewhere (e.g. the library index) without writing it."""
+        with self._lock:
+            self._by_hash[metadata["content_hash"]] = metadata
+            self._path_hashes[file_path] = metadata["content_hash"]
+
+    def put(self, file_path: str, metadata: dict):
+        content_hash = metadata["content_hash"]
+        with self._lock:
+            self._by_hash[content_hash] = metadata
+            self._path_hashes[file_path] = content_hash
+        try:
+            with open(metadata_path(file_path), "w") as f:
+                json.dump(metadata, f)
+        except OSError as e:
+            print(f"Could not write metadata for {file_path}: {e}")
+
+    def forget(self, file_path: Optional[str] = None):
+        """Drop ``file_path`` (or every path), and its metadata once no other path shares the hash."""
+        with self._lock:
+            if file_path is None:
+                self._path_hashes.clear()
+                self._by_hash.clear()
+                return
+            content_hash = self._path_hashes.pop(file_path, None)
+            if content_hash is not None and content_hash not in self._path_hashes.values():
+                self._by_hash.pop(content_hash, None)
+
+    def _load(self, file_path: str, content_hash: str) -> Optional[dict]:
+        path = metadata_path(file_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if metadata.get("version") != METADATA_VERSION or metadata.get("content_hash") != content_hash:
+            return None
+        return metadata
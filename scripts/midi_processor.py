@@ -2,10 +2,43 @@ import mido
 import asyncio
 import keyboard as kb
 import threading
-from queue import Queue
+import time
 from typing import Dict, Optional, Callable
 import inspect
 import pygetwindow as gw
+from event_log import EventLog
+from metrics import registry
+from playback_scheduler import PlaybackScheduler, LatencyStats
+from action_ring import ActionRing, KEY_NAMES, OP_PRESS, OP_RELEASE, key_code
+from action_script import (
+    ActionScript,
+    ActionScriptCache,
+    chord_order,
+    coalesce_modifier_envelopes,
+    compile_action_script,
+)
+from midi_metadata import MetadataCache, extract_smf_metadata
+from smf_reader import read_smf_file
+from time_warp import TempoPresets
+from midi_timeline import (
+    CompiledTimeline,
+    TimelineCache,
+    file_content_hash,
+    EVENT_NOTE_ON,
+    EVENT_NOTE_OFF,
+    EVENT_CONTROL_CHANGE,
+    SUSTAIN_CONTROL,
+)
+
+
+_EVENTS_DISPATCHED = registry.counter("robe_events_dispatched_total", "Timeline events dispatched by the scheduler")
+_KEYBOARD_CALL_SECONDS = registry.histogram("robe_keyboard_call_seconds", "Duration of one keyboard press or release call")
+_MIDI_SEND_SECONDS = registry.histogram("robe_midi_send_seconds", "Duration of one MIDI output send")
+
+SHIFT_MAP = {
+    '!': '1', '@': '2', '$': '4', '%': '5',
+    '^': '6', '*': '8', '(': '9', ')': '0'
+}
 
 
 class MidiProcessor:
@@ -21,7 +54,6 @@ class MidiProcessor:
         self.total_duration = 0.0
         self.seek_position = None
         self.tempo_scale = 100.0
-        self.tempo_changed = False
 
         self.use_midi_output = config_manager.get("use_midi_output", False) if config_manager else False
         self.midi_device = None
@@ -34,6 +66,8 @@ class MidiProcessor:
 
         self.main_start_note = 36
         self.main_end_note = self.main_start_note + len(self.main_sequence) - 1
+        self._mapping_version = 0
+        self._rebuild_key_tables()
 
         self.sustain_enabled = False
         self.velocity_enabled = False
@@ -44,8 +78,38 @@ class MidiProcessor:
 
         self.active_notes: Dict[int, tuple[str, list]] = {}
 
-        self.event_queue = Queue()
-        self.worker_thread = threading.Thread(target=self._keyboard_worker, daemon=True)
+        self.log = EventLog(
+            level=config_manager.get("log_level", "info") if config_manager else "info",
+            file_path=config_manager.get("log_file") if config_manager else None,
+        )
+        self.log.set_trace_notes(config_manager.get("trace_notes", False) if config_manager else False)
+
+        self.timeline_cache = TimelineCache()
+        self.tempo_presets = TempoPresets()
+        self.metadata_cache = MetadataCache()
+        self.action_scripts = ActionScriptCache()
+        self.scheduler = PlaybackScheduler()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._timeline: Optional[CompiledTimeline] = None
+        self._lowered: list = []
+        self._lowered_version = -1
+        self._script: Optional[ActionScript] = None
+        self._script_settings: Optional[tuple] = None
+        self._script_cursor = 0
+        self._last_position_update = 0.0
+        self._playing_path: Optional[str] = None
+
+        self.event_queue = ActionRing(
+            config_manager.get("action_buffer_capacity", 4096) if config_manager else 4096,
+            config_manager.get("action_buffer_policy", "block") if config_manager else "block",
+        )
+        self._batch: Optional[list] = None
+        # Keys whose release was in a batch given up while stopping
+        self._unsent_releases: set = set()
+        self.batch_latency = LatencyStats()
+        self.batches_dispatched = 0
+        self.actions_dispatched = 0
+        self.worker_thread = threading.Thread(target=self._keyboard_worker, name="keyboard-worker", daemon=True)
         self.worker_thread.start()
 
         self.target_window = None
@@ -53,21 +117,70 @@ class MidiProcessor:
 
     def _keyboard_worker(self):
         while True:
-            action, key = self.event_queue.get()
+            enqueued_ns, actions, truncated = self.event_queue.pop_batch()
             try:
                 if self.window_targeting_enabled and self.target_window:
                     pass
             except Exception as e:
-                print(f"Could not target window '{self.target_window}': {e}")
+                self.log.warning("window_target_failed", window=self.target_window, error=e)
             
+            timed = registry.enabled
+            for op, code in actions:
+                key = KEY_NAMES[code]
+                if timed:
+                    started_ns = time.perf_counter_ns()
+                try:
+                    if op == OP_PRESS:
+                        kb.press(key)
+                    elif op == OP_RELEASE:
+                        kb.release(key)
+                except Exception as e:
+                    self.log.error("keyboard_error", action="press" if op == OP_PRESS else "release", key=key, error=e)
+                if timed:
+                    _KEYBOARD_CALL_SECONDS.observe((time.perf_counter_ns() - started_ns) / 1e9)
+            if truncated:
+                self._release_stranded_keys(actions)
+            self.batch_latency.record(time.perf_counter_ns() - enqueued_ns)
+            self.batches_dispatched += 1
+            self.actions_dispatched += len(actions)
+
+    def _release_stranded_keys(self, actions: list):
+        """Release keys a truncated batch pressed but never got to release."""
+        held = []
+        for op, code in actions:
+            if op == OP_PRESS:
+                held.append(code)
+            elif code in held:
+                held.remove(code)
+        for code in reversed(held):
             try:
-                if action == "press":
-                    kb.press(key)
-                elif action == "release":
-                    kb.release(key)
+                kb.release(KEY_NAMES[code])
             except Exception as e:
-                print(f"Keyboard error on {action} {key}: {e}")
-            self.event_queue.task_done()
+                self.log.error("keyboard_error", action="release", key=KEY_NAMES[code], error=e)
+
+    def _begin_batch(self):
+        self._batch = []
+
+    def _flush_batch(self):
+        batch = self._batch
+        self._batch = None
+        if batch and not self._push_actions(coalesce_modifier_envelopes(batch)):
+            # The run is stopping; remember what this batch meant to let go of
+            self._unsent_releases.update(code for op, code in batch if op == OP_RELEASE)
+
+    def _push_actions(self, actions: list) -> bool:
+        """Publish one batch; the ring has a single producer, so check we are it."""
+        if not self.scheduler.may_produce():
+            raise RuntimeError(f"Key actions pushed from {threading.current_thread().name} while a run is live")
+        return self.event_queue.push_batch(actions, cancelled=self.scheduler.stop_requested)
+
+    def get_keyboard_stats(self) -> dict:
+        return {
+            "batches": self.batches_dispatched,
+            "actions": self.actions_dispatched,
+            "queue": self.event_queue.stats(),
+            "batch_latency": self.batch_latency.snapshot(),
+        }
 
     def set_use_midi_output(self, enabled: bool, midi_device: Optional[str] = None):
         self.use_midi_output = enabled
@@ -116,10 +229,15 @@ class MidiProcessor:
 
     def _send_midi_message(self, msg):
         if self.use_midi_output and self.midi_out:
+            timed = registry.enabled
+            if timed:
+                started_ns = time.perf_counter_ns()
             try:
                 self.midi_out.send(msg)
             except Exception as e:
-                print(f"Error sending MIDI message: {e}")
+                self.log.error("midi_send_error", error=e)
+            if timed:
+                _MIDI_SEND_SECONDS.observe((time.perf_counter_ns() - started_ns) / 1e9)
 
     def midi_note_to_name(self, note_number: int) -> str:
         note_names = ['C', 'C#', 'D', 'D#', 'E', 'F',
@@ -127,40 +245,135 @@ class MidiProcessor:
         octave = (note_number // 12) - 1
         return f"{note_names[note_number % 12]}{octave}"
 
-    def get_key_for_note(self, note_number: int) -> tuple[Optional[str], list]:
+    def _resolve_key_for_note(self, note_number: int) -> tuple[Optional[str], tuple]:
         modifiers = []
 
         if self.main_start_note <= note_number <= self.main_end_note:
             index = note_number - self.main_start_note
             key_char = self.main_sequence[index]
-            if key_char.isupper() or key_char in "!@$%^*()":
+            if key_char.isupper() or key_char in SHIFT_MAP:
                 modifiers.append("shift")
-                shift_map = {
-                    '!': '1', '@': '2', '$': '4', '%': '5',
-                    '^': '6', '*': '8', '(': '9', ')': '0'
-                }
-                key_char = shift_map.get(key_char, key_char.lower())
+                key_char = SHIFT_MAP.get(key_char, key_char.lower())
         elif note_number < self.main_start_note:
             offset = self.main_start_note - note_number - 1
             if offset < len(self.low_notes):
                 key_char = self.low_notes[offset]
                 modifiers.append("ctrl")
             else:
-                return None, []
+                return None, ()
         else:
             offset = note_number - self.main_end_note - 1
             if offset < len(self.high_notes):
                 key_char = self.high_notes[offset]
                 modifiers.append("ctrl")
             else:
-                return None, []
-        return key_char, modifiers
+                return None, ()
+        return key_char, tuple(modifiers)
+
+    def _rebuild_key_tables(self):
+        self.main_end_note = self.main_start_note + len(self.main_sequence) - 1
+        self._note_keys = [self._resolve_key_for_note(note) for note in range(128)]
+        self._velocity_keys = [None] + [
+            self.velocity_map[min(velocity // 4, len(self.velocity_map) - 1)]
+            for velocity in range(1, 128)
+        ]
+        self._mapping_version += 1
+        self._lowered_cache = None
+
+    def set_key_mapping(self, main_sequence: Optional[str] = None, low_notes: Optional[str] = None,
+                        high_notes: Optional[str] = None, velocity_map: Optional[str] = None,
+                        main_start_note: Optional[int] = None):
+        if main_sequence is not None:
+            self.main_sequence = main_sequence
+        if low_notes is not None:
+            self.low_notes = low_notes
+        if high_notes is not None:
+            self.high_notes = high_notes
+        if velocity_map is not None:
+            self.velocity_map = velocity_map
+        if main_start_note is not None:
+            self.main_start_note = main_start_note
+        self._rebuild_key_tables()
+
+    def get_key_for_note(self, note_number: int) -> tuple[Optional[str], tuple]:
+        return self._note_keys[note_number]
 
     def get_velocity_key(self, velocity: int) -> Optional[str]:
-        if not self.velocity_enabled or velocity == 0:
+        if not self.velocity_enabled:
             return None
-        velocity_index = min(velocity // 4, len(self.velocity_map) - 1)
-        return self.velocity_map[velocity_index]
+        return self._velocity_keys[velocity]
+
+    def _lower_timeline(self, timeline: CompiledTimeline) -> list:
+        """Resolve every note-on of ``timeline`` to its key action up front.
+
+        Each entry is ``None`` for events that do not press a key, otherwise
+        ``(key_char, modifiers, velocity_key, display_key, velocity_display_key)``.
+        """
+        cached = self._lowered_cache
+        if cached is not None and cached[0] is timeline and cached[1] == self._mapping_version:
+            return cached[2]
+
+        note_keys = self._note_keys
+        velocity_keys = self._velocity_keys
+        display_cache = {}
+        lowered = []
+        for event_type, note, velocity in zip(timeline.types, timeline.notes, timeline.velocities):
+            if event_type != EVENT_NOTE_ON or velocity == 0:
+                lowered.append(None)
+                continue
+            key_char, modifiers = note_keys[note]
+            if key_char is None:
+                lowered.append(None)
+                continue
+            velocity_key = velocity_keys[velocity]
+            action = display_cache.get((note, velocity_key))
+            if action is None:
+                modifier_str = ""
+                if "ctrl" in modifiers:
+                    modifier_str += "Ctrl+"
+                if "shift" in modifiers:
+                    modifier_str += "Shift+"
+                note_name = self.midi_note_to_name(note)
+                display_key = f"{note_name} → {modifier_str}{key_char.upper()}"
+                velocity_display_key = f"{note_name} → Alt+{velocity_key.upper()}+{modifier_str}{key_char.upper()}"
+                action = (key_char, modifiers, velocity_key, display_key, velocity_display_key)
+                display_cache[(note, velocity_key)] = action
+            lowered.append(action)
+
+        self._lowered_cache = (timeline, self._mapping_version, lowered)
+        return lowered
+
+    def _action_settings(self) -> dict:
+        """Everything that changes which keys a note turns into."""
+        return {
+            "sustain_enabled": self.sustain_enabled,
+            "velocity_enabled": self.velocity_enabled,
+            "no_doubles": self.no_doubles,
+            "hold_keys": self.hold_keys,
+            "main_sequence": self.main_sequence,
+            "low_notes": self.low_notes,
+            "high_notes": self.high_notes,
+            "velocity_map": self.velocity_map,
+            "main_start_note": self.main_start_note,
+        }
+
+    def _script_state(self) -> tuple:
+        # Cheap stand-in for _action_settings() while a script is playing
+        return (self.sustain_enabled, self.velocity_enabled, self.no_doubles,
+                self.hold_keys, self._mapping_version)
+
+    def load_action_script(self, file_path: str, timeline: CompiledTimeline) -> ActionScript:
+        """Compiled key actions for ``timeline`` under the current settings.
+
+        Loaded from the file's ``.actions`` sidecar when one matches,
+        otherwise compiled and stored there.
+        """
+        settings = self._action_settings()
+        lowered = self._lower_timeline(timeline)
+        return self.action_scripts.get(
+            file_path, timeline.content_hash, settings,
+            lambda: compile_action_script(timeline, lowered, settings),
+        )
 
     def set_note_callback(self, callback: Optional[Callable]):
         self.note_callback = callback
@@ -174,7 +387,7 @@ class MidiProcessor:
             else:
                 self.note_callback(payload)
         except Exception as e:
-            print(f"Note callback error: {e}")
+            self.log.error("note_callback_error", error=e)
 
     def press_note(self, note_number: int, key_char: str, modifiers: list, velocity_key: Optional[str] = None):
         if self.no_doubles:
@@ -221,148 +434,424 @@ class MidiProcessor:
                 self._enqueue_release("space")
             self.sustain_pressed = pressed
 
-    async def play_midi_file(self, file_path: str, tempo_scale: float = 100.0):
+    def _silence_state(self, timeline: CompiledTimeline, index: int):
+        if self.use_midi_output:
+            sounding, sustain = timeline.state_at(index)
+            for note, note_on_index in sounding.items():
+                self._send_midi_message(mido.Message("note_off", channel=timeline.channels[note_on_index], note=note))
+            if sustain:
+                self._send_midi_message(mido.Message("control_change", control=SUSTAIN_CONTROL, value=0))
+            return
+        for note in list(self.active_notes.keys()):
+            self.release_note(note)
+        if self.sustain_pressed:
+            self.handle_sustain_pedal(False)
+
+    def _restore_state(self, timeline: CompiledTimeline, index: int):
+        sounding, sustain = timeline.state_at(index)
+        if self.use_midi_output:
+            if sustain:
+                self._send_midi_message(mido.Message("control_change", control=SUSTAIN_CONTROL, value=127))
+            for note_on_index in sounding.values():
+                self._send_midi_message(timeline.to_message(note_on_index))
+            return
+        self.handle_sustain_pedal(sustain)
+        if self.hold_keys:
+            if self.no_doubles:
+                sounding = self._held_after_doubles(timeline, index, sounding)
+            for note, note_on_index in sounding.items():
+                key_char, modifiers = self.get_key_for_note(note)
+                if key_char:
+                    self.press_note(note, key_char, modifiers, self.get_velocity_key(timeline.velocities[note_on_index]))
+
+    def _held_after_doubles(self, timeline: CompiledTimeline, index: int, sounding: dict) -> dict:
+        """The sounding notes live dispatch still holds when ``no_doubles`` is on.
+
+        A press lets go of every other note on the same key, and that note
+        stays silent even though the timeline still has it sounding. Replays
+        the presses since the earliest sounding note-on in live chord order
+        and keeps each note only if it was the last one pressed on its key.
+        """
+        if not sounding:
+            return sounding
+        lowered = self._lower_timeline(timeline)
+        times = timeline.times_us
+        start = min(sounding.values())
+        while start > 0 and times[start - 1] == times[start]:
+            start -= 1
+        last_press = {}
+        while start < index:
+            end = start + 1
+            while end < index and times[end] == times[start]:
+                end += 1
+            for event in chord_order(lowered, start, end):
+                action = lowered[event]
+                if action is not None:
+                    last_press[action[0]] = event
+            start = end
+        return {
+            note: note_on_index for note, note_on_index in sounding.items()
+            if lowered[note_on_index] is None or last_press.get(lowered[note_on_index][0]) == note_on_index
+        }
+
+    def _release_all_keys(self):
+        """Release every key held by the action script or by live dispatch."""
+        if self._script is not None:
+            for code in reversed(self._script.held_at(self._script_cursor)):
+                self._enqueue_release(KEY_NAMES[code])
+            self._script = None
+        for note in list(self.active_notes.keys()):
+            self.release_note(note)
+        if self.sustain_pressed:
+            self.handle_sustain_pedal(False)
+        for code in self._unsent_releases:
+            self._enqueue_release(KEY_NAMES[code])
+        self._unsent_releases.clear()
+
+    def seek(self, position: float):
+        position = max(0.0, position)
+        if self.total_duration:
+            position = min(position, self.total_duration)
+        if self.is_playing and self.scheduler.running:
+            self.scheduler.seek(round(position * 1_000_000))
+        elif self.is_playing:
+            self.seek_position = position
+        elif self.is_paused:
+            self.paused_position = position
+            self.current_position = position
+        self.log.info("seek_requested", position=f"{position:.2f}s")
+
+    def load_timeline(self, file_path: str, content_hash: Optional[str] = None) -> CompiledTimeline:
+        return self.timeline_cache.get(file_path, content_hash)
+
+    def prepare_timeline(self, file_path: str, content_hash: Optional[str] = None) -> CompiledTimeline:
+        """Compile and lower ``file_path`` ahead of time so playing it starts warm.
+
+        Safe to call from a worker thread while another file is playing.
+        """
+        timeline = self.load_timeline(file_path, content_hash)
+        if self.use_midi_output:
+            self._lower_timeline(timeline)
+        else:
+            self.load_action_script(file_path, timeline)
+        return timeline
+
+    def release_files(self):
+        """Forget every compiled timeline and action script and unmap their files.
+
+        Only call while nothing is playing or being prepared; Windows will
+        not move or delete the upload folder while its files are mapped.
+        """
+        held = [self._timeline, self._script]
+        if self._lowered_cache is not None:
+            held.append(self._lowered_cache[0])
+        self._timeline = None
+        self._script = None
+        self._lowered_cache = None
+        self._lowered = []
+        self._lowered_version = -1
+        self.timeline_cache.invalidate(close=True)
+        self.action_scripts.invalidate(close=True)
+        for item in held:
+            if item is not None:
+                item.close()
+
+    def _with_mapping_stats(self, metadata: dict) -> dict:
+        histogram = metadata["pitch_histogram"]
+        unmapped = sum(count for note, count in enumerate(histogram) if self._note_keys[note][0] is None)
+        outside_main = sum(
+            count for note, count in enumerate(histogram)
+            if note < self.main_start_note or note > self.main_end_note
+        )
+        info = {key: value for key, value in metadata.items() if key != "pitch_histogram"}
+        info["unmapped_notes"] = unmapped
+        info["outside_main_range_notes"] = outside_main
+        return info
+
+    def get_midi_info(self, file_path: str, content_hash: Optional[str] = None) -> dict:
+        """Analyze ``file_path`` once per content hash and return its metadata.
+
+        Parsing also primes the timeline cache so the first play starts warm.
+        """
+        if content_hash is None:
+            content_hash = file_content_hash(file_path)
+        metadata = self.metadata_cache.get(file_path, content_hash)
+        if metadata is None:
+            smf = read_smf_file(file_path)
+            timeline = CompiledTimeline.from_smf(smf, content_hash)
+            metadata = extract_smf_metadata(smf, timeline, content_hash)
+            self.metadata_cache.put(file_path, metadata)
+            self.timeline_cache.put(file_path, timeline, persist=True)
+        return self._with_mapping_stats(metadata)
+
+    def get_cached_midi_info(self, file_path: str) -> Optional[dict]:
+        """Metadata for ``file_path`` if it has already been analyzed; no I/O."""
+        metadata = self.metadata_cache.peek(file_path)
+        return self._with_mapping_stats(metadata) if metadata else None
+
+    def _emit(self, payload: dict):
+        """Hand a callback payload from the scheduler thread to the event loop."""
+        if not self.note_callback or self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._deliver_callback, payload)
+        except RuntimeError:
+            pass
+
+    def _deliver_callback(self, payload: dict):
         try:
-            mid = mido.MidiFile(file_path)
+            if inspect.iscoroutinefunction(self.note_callback):
+                asyncio.ensure_future(self.note_callback(payload))
+            elif self.note_callback:
+                self.note_callback(payload)
+        except Exception as e:
+            self.log.error("note_callback_error", error=e)
+
+    def _dispatch_events(self, start: int, end: int):
+        timeline = self._timeline
+        if registry.enabled:
+            _EVENTS_DISPATCHED.inc(end - start)
+        if self._lowered_version != self._mapping_version:
+            self._lowered = self._lower_timeline(timeline)
+            self._lowered_version = self._mapping_version
+
+        self.current_position = timeline.times_us[start] / 1_000_000
+        if self.current_position - self._last_position_update >= 0.1:
+            self._emit({
+                "type": "position_update",
+                "position": self.current_position,
+                "duration": self.total_duration
+            })
+            self._last_position_update = self.current_position
+
+        if self._script is not None:
+            if self._script_settings == self._script_state():
+                batch = self._script.batch(start, end)
+                # A batch given up while stopping leaves the keys as they were at ``start``
+                if not batch or self._push_actions(batch):
+                    self._script_cursor = end
+                self._announce_events(timeline, start, end)
+                return
+            # Settings changed mid-song: hand the held keys over to live dispatch
+            self._begin_batch()
+            self._release_all_keys()
+            self._flush_batch()
+
+        self._begin_batch()
+        for index in self._chord_order(start, end):
+            self._dispatch_event(timeline, index)
+        self._flush_batch()
+
+    def _chord_order(self, start: int, end: int) -> list:
+        return chord_order(self._lowered, start, end)
+
+    def _announce_events(self, timeline: CompiledTimeline, start: int, end: int):
+        """Note display and tracing for a batch whose keys came from the action script."""
+        lowered = self._lowered
+        trace = self.log.trace_notes
+        for index in range(start, end):
+            action = lowered[index]
+            note = timeline.notes[index]
+            if action is not None:
+                key_char, modifiers, _, display_key, velocity_display_key = action
+                if self.velocity_enabled:
+                    display_key = velocity_display_key
+                    modifiers = modifiers + ("alt",)
+                self._emit({
+                    "type": "current_note",
+                    "note": display_key,
+                    "midi_note": note,
+                    "velocity": timeline.velocities[index],
+                    "key": key_char,
+                    "modifiers": modifiers,
+                    "time": self.current_position
+                })
+                if trace:
+                    self.log.trace("note_on", note=note, velocity=timeline.velocities[index], key=display_key)
+            elif trace:
+                event_type = timeline.types[index]
+                if event_type == EVENT_NOTE_OFF or (event_type == EVENT_NOTE_ON and timeline.velocities[index] == 0):
+                    self.log.trace("note_off", note=note, name=self.midi_note_to_name(note))
+                elif event_type == EVENT_CONTROL_CHANGE and note == SUSTAIN_CONTROL:
+                    self.log.trace("sustain", pressed=timeline.velocities[index] >= 64)
+
+    def _dispatch_event(self, timeline: CompiledTimeline, index: int):
+        event_type = timeline.types[index]
+        note = timeline.notes[index]
+        velocity = timeline.velocities[index]
+
+        if event_type == EVENT_NOTE_ON and velocity > 0:
+            if self.use_midi_output:
+                self._send_midi_message(timeline.to_message(index))
+                
+                self._emit({
+                    "type": "current_note",
+                    "note": f"{self.midi_note_to_name(note)} → MIDI Out",
+                    "midi_note": note,
+                    "velocity": velocity,
+                    "time": self.current_position
+                })
+                if self.log.trace_notes:
+                    self.log.trace("midi_note_on", note=note, name=self.midi_note_to_name(note), velocity=velocity)
+            else:
+                action = self._lowered[index]
+                if action is not None:
+                    key_char, modifiers, velocity_key, display_key, velocity_display_key = action
+                    if self.velocity_enabled:
+                        self.press_note(note, key_char, modifiers, velocity_key)
+                        display_key = velocity_display_key
+                        modifiers = modifiers + ("alt",)
+                    else:
+                        self.press_note(note, key_char, modifiers)
+
+                    self._emit({
+                        "type": "current_note",
+                        "note": display_key,
+                        "midi_note": note,
+                        "velocity": velocity,
+                        "key": key_char,
+                        "modifiers": modifiers,
+                        "time": self.current_position
+                    })
+
+                    if self.log.trace_notes:
+                        self.log.trace("note_on", note=note, velocity=velocity, key=display_key)
+
+        elif event_type == EVENT_NOTE_OFF or event_type == EVENT_NOTE_ON:
+            if self.use_midi_output:
+                self._send_midi_message(timeline.to_message(index))
+                if self.log.trace_notes:
+                    self.log.trace("midi_note_off", note=note, name=self.midi_note_to_name(note))
+            else:
+                self.release_note(note)
+                if self.log.trace_notes:
+                    self.log.trace("note_off", note=note, name=self.midi_note_to_name(note))
+
+        elif event_type == EVENT_CONTROL_CHANGE and note == SUSTAIN_CONTROL:
+            if self.use_midi_output:
+                self._send_midi_message(timeline.to_message(index))
+                sustain_pressed = velocity >= 64
+                if self.log.trace_notes:
+                    self.log.trace("midi_sustain", pressed=sustain_pressed)
+            else:
+                sustain_pressed = velocity >= 64
+                self.handle_sustain_pedal(sustain_pressed)
+                if self.log.trace_notes:
+                    self.log.trace("sustain", pressed=sustain_pressed)
+
+    def _seek_from_scheduler(self, current_index: int, target_us: int) -> int:
+        timeline = self._timeline
+        seek_target = target_us / 1_000_000
+        self.log.info("seek", position=f"{seek_target:.2f}s")
+        index = timeline.index_at(seek_target)
+        self._begin_batch()
+        if self._script is not None:
+            for code in reversed(self._script.held_at(current_index)):
+                self._enqueue_release(KEY_NAMES[code])
+            for code in self._script.held_at(index):
+                self._enqueue_press(KEY_NAMES[code])
+            self._script_cursor = index
+        else:
+            self._silence_state(timeline, current_index)
+            self._restore_state(timeline, index)
+        self._flush_batch()
+        self.current_position = seek_target
+        self._last_position_update = seek_target
+        self._emit({
+            "type": "position_update",
+            "position": seek_target,
+            "duration": self.total_duration
+        })
+        return index
+
+    def get_scheduler_stats(self) -> dict:
+        return {
+            "running": self.scheduler.running,
+            "tempo": self.scheduler.tempo,
+            "current_tempo": self.scheduler.current_tempo(round(self.current_position * 1_000_000)),
+            "lateness": self.scheduler.lateness.snapshot(),
+        }
+
+    async def play_midi_file(self, file_path: str, tempo_scale: float = 100.0,
+                             content_hash: Optional[str] = None, keep_output_open: bool = False) -> bool:
+        """Play ``file_path`` and return True if it reached the end.
+
+        With ``keep_output_open`` the MIDI port stays open after a natural
+        finish so a following track can start without reopening it.
+        """
+        try:
+            timeline = self.load_timeline(file_path, content_hash)
+            was_paused = self.is_paused
+            # Let a run that is still winding down finish before its state is replaced
+            await asyncio.wait([asyncio.wrap_future(self.scheduler.stop())])
             self.is_playing = True
             self.is_paused = False
             self.active_notes.clear()
             self.sustain_pressed = False
+            self._script = None
             self.tempo_scale = tempo_scale
+            self._loop = asyncio.get_running_loop()
             
             if self.use_midi_output:
                 if not self._open_midi_output():
-                    print("Failed to open MIDI output, falling back to keyboard mode")
+                    self.log.warning("midi_output_unavailable", fallback="keyboard simulation")
                     self.use_midi_output = False
             
-            self.total_duration = mid.length
+            self.total_duration = timeline.duration
             
             if self.seek_position is not None:
-                self.current_position = max(0.0, min(self.seek_position, self.total_duration))
-                seek_target = self.current_position
+                seek_target = max(0.0, min(self.seek_position, self.total_duration))
                 self.seek_position = None
-                print(f"Seeking to {seek_target:.2f}s")
-            elif self.is_paused and self.paused_position > 0:
-                self.current_position = self.paused_position
+                self.log.info("seek", position=f"{seek_target:.2f}s")
+            elif was_paused and self.paused_position > 0:
                 seek_target = self.paused_position
                 self.paused_position = 0.0
-                print(f"Resuming from {seek_target:.2f}s")
+                self.log.info("playback_resumed", position=f"{seek_target:.2f}s")
             else:
-                self.current_position = 0.0
                 seek_target = 0.0
+            self.current_position = seek_target
 
             mode_str = "MIDI output" if self.use_midi_output else "keyboard simulation"
-            print(f"Playing {file_path} at {tempo_scale}% speed from {seek_target:.2f}s using {mode_str}")
-
-            timed_events = []
-            current_time = 0.0
-            
-            for msg in mid:
-                current_time += msg.time
-                if msg.type in ["note_on", "note_off", "control_change"]:
-                    timed_events.append((current_time, msg))
-
-            filtered_events = [(t, msg) for t, msg in timed_events if t >= seek_target]
-            
-            loop_start_time = asyncio.get_event_loop().time()
-            playback_start_time = seek_target
-            last_position_update = seek_target
-            current_tempo = tempo_scale
-            
-            for event_time, msg in filtered_events:
-                if not self.is_playing:
-                    break
-                
-                if self.seek_position is not None:
-                    print(f"Seeking during playback to {self.seek_position:.2f}s")
-                    for note in list(self.active_notes.keys()):
-                        self.release_note(note)
-                    if self.sustain_pressed:
-                        self.handle_sustain_pedal(False)
-                    await self.play_midi_file(file_path, self.tempo_scale)
-                    return
-                
-                if self.tempo_changed:
-                    current_real_time = asyncio.get_event_loop().time()
-                    elapsed_real_time = current_real_time - loop_start_time
-                    elapsed_playback_time = elapsed_real_time * (current_tempo / 100.0)
-                    
-                    loop_start_time = current_real_time
-                    playback_start_time = playback_start_time + elapsed_playback_time
-                    current_tempo = self.tempo_scale
-                    self.tempo_changed = False
-                    print(f"Applied tempo change to {current_tempo}% at position {self.current_position:.2f}s")
-
-                target_playback_time = event_time - playback_start_time
-                target_real_time = loop_start_time + (target_playback_time * (100.0 / current_tempo))
-                current_real_time = asyncio.get_event_loop().time()
-                
-                if target_real_time > current_real_time:
-                    await asyncio.sleep(target_real_time - current_real_time)
-                
-                self.current_position = event_time
-                
-                if self.current_position - last_position_update >= 0.1:
-                    await self._maybe_call_note_callback({
-                        "type": "position_update",
-                        "position": self.current_position,
-                        "duration": self.total_duration
-                    })
-                    last_position_update = self.current_position
-
-                if msg.type == "note_on" and getattr(msg, "velocity", 0) > 0:
-                    if self.use_midi_output:
-                        self._send_midi_message(msg)
-                        
-                        await self._maybe_call_note_callback({
-                            "type": "current_note",
-                            "note": f"{self.midi_note_to_name(msg.note)} → MIDI Out"
-                        })
-                        print(f"MIDI OUT: {self.midi_note_to_name(msg.note)} ({msg.note}, vel={msg.velocity})")
-                    else:
-                        key_char, modifiers = self.get_key_for_note(msg.note)
-                        if key_char:
-                            velocity_key = self.get_velocity_key(getattr(msg, "velocity", 0))
-                            self.press_note(msg.note, key_char, modifiers, velocity_key)
-
-                            modifier_str = ""
-                            if "ctrl" in modifiers:
-                                modifier_str += "Ctrl+"
-                            if "shift" in modifiers:
-                                modifier_str += "Shift+"
-                            if velocity_key and self.velocity_enabled:
-                                modifier_str = f"Alt+{velocity_key.upper()}+" + modifier_str
-                            display_key = f"{modifier_str}{key_char.upper()}"
-
-                            await self._maybe_call_note_callback({
-                                "type": "current_note",
-                                "note": f"{self.midi_note_to_name(msg.note)} → {display_key}"
-                            })
-
-                            print(f"Note ON: {self.midi_note_to_name(msg.note)} ({msg.note}, vel={msg.velocity}) -> {display_key}")
-
-                elif msg.type == "note_off" or (msg.type == "note_on" and getattr(msg, "velocity", 0) == 0):
-                    if self.use_midi_output:
-                        self._send_midi_message(msg)
-                        print(f"MIDI OUT: {self.midi_note_to_name(msg.note)} ({msg.note}) OFF")
-                    else:
-                        self.release_note(msg.note)
-                        print(f"Note OFF: {self.midi_note_to_name(msg.note)} ({msg.note})")
-
-                elif msg.type == "control_change" and getattr(msg, "control", None) == 64:
-                    if self.use_midi_output:
-                        self._send_midi_message(msg)
-                        sustain_pressed = getattr(msg, "value", 0) >= 64
-                        print(f"MIDI OUT: Sustain {'ON' if sustain_pressed else 'OFF'}")
-                    else:
-                        sustain_pressed = getattr(msg, "value", 0) >= 64
-                        self.handle_sustain_pedal(sustain_pressed)
-                        print(f"Sustain {'ON' if sustain_pressed else 'OFF'}")
-
-            for note in list(self.active_notes.keys()):
-                self.release_note(note)
-            if self.sustain_pressed:
-                self.handle_sustain_pedal(False)
+            self.log.info("playback_started", file=file_path, tempo=tempo_scale, position=f"{seek_target:.2f}s", mode=mode_str)
+
+            self._timeline = timeline
+            self._playing_path = file_path
+            self._lowered = self._lower_timeline(timeline)
+            self._lowered_version = self._mapping_version
+            self._last_position_update = seek_target
+            index = timeline.index_at(seek_target)
+            if not self.use_midi_output:
+                try:
+                    self._script = self.load_action_script(file_path, timeline)
+                    self._script_settings = self._script_state()
+                    self._script_cursor = index
+                except Exception as e:
+                    self.log.warning("action_script_failed", file=file_path, error=e)
+            if index > 0:
+                self._begin_batch()
+                if self._script is not None:
+                    for code in self._script.held_at(index):
+                        self._enqueue_press(KEY_NAMES[code])
+                else:
+                    self._restore_state(timeline, index)
+                self._flush_batch()
+
+            finished = await asyncio.wrap_future(self.scheduler.start(
+                timeline.times_us,
+                self._dispatch_events,
+                index,
+                round(seek_target * 1_000_000),
+                tempo_scale,
+                self._seek_from_scheduler,
+                self.tempo_presets.get(file_path),
+            ))
+
+            if not finished:
+                return False
+
+            self._begin_batch()
+            self._release_all_keys()
+            self._flush_batch()
 
             await self._maybe_call_note_callback({"type": "current_note", "note": ""})
             await self._maybe_call_note_callback({
@@ -371,36 +860,47 @@ class MidiProcessor:
                 "duration": self.total_duration
             })
 
-            if self.use_midi_output:
+            if self.use_midi_output and not keep_output_open:
                 self._close_midi_output()
 
             self.is_playing = False
-            print("Playback finished")
+            self.log.info("playback_finished", file=file_path)
+            return True
 
         except Exception as e:
-            print(f"MIDI playback error: {e}")
+            self.log.error("playback_error", file=file_path, error=e)
             self.is_playing = False
             if self.use_midi_output:
                 self._close_midi_output()
+            return False
+
+    def _stop_scheduler(self):
+        """Stop the scheduler without waiting, then silence whatever it left held.
+
+        The release runs once the scheduler thread has dispatched its last
+        batch, so nothing is pressed after it and the action ring keeps a
+        single producer.
+        """
+        self.scheduler.stop().add_done_callback(lambda _: self._silence_after_stop())
+
+    def _silence_after_stop(self):
+        self._begin_batch()
+        self._release_all_keys()
+        self._flush_batch()
+        if self.use_midi_output:
+            self._close_midi_output()
 
     def pause_playback(self):
         if self.is_playing:
             self.is_paused = True
-            self.paused_position = self.current_position
             self.is_playing = False
-            print(f"Playback paused at {self.current_position:.2f}s")
-            
-            for note in list(self.active_notes.keys()):
-                self.release_note(note)
-            if self.sustain_pressed:
-                self.handle_sustain_pedal(False)
-            
-            if self.use_midi_output:
-                self._close_midi_output()
+            self.paused_position = self.current_position
+            self.log.info("playback_paused", position=f"{self.current_position:.2f}s")
+            self._stop_scheduler()
 
     def resume_playback(self, file_path: str):
         if self.is_paused:
-            print(f"Resuming playback from {self.paused_position:.2f}s")
+            self.log.info("resume_requested", position=f"{self.paused_position:.2f}s")
             asyncio.create_task(self.play_midi_file(file_path, self.tempo_scale))
 
     def stop_playback(self):
@@ -408,14 +908,8 @@ class MidiProcessor:
         self.is_paused = False
         self.paused_position = 0.0
         self.current_position = 0.0
-        for note in list(self.active_notes.keys()):
-            self.release_note(note)
-        if self.sustain_pressed:
-            self.handle_sustain_pedal(False)
-        
-        if self.use_midi_output:
-            self._close_midi_output()
-            
+        self._stop_scheduler()
+
         if self.note_callback:
             try:
                 if inspect.iscoroutinefunction(self.note_callback):
@@ -434,7 +928,7 @@ class MidiProcessor:
                     })
             except Exception:
                 pass
-        print("Playback stopped")
+        self.log.info("playback_stopped")
 
     def set_sustain_enabled(self, enabled: bool):
         self.sustain_enabled = enabled
@@ -468,17 +962,31 @@ class MidiProcessor:
         if window_title:
             print(f"Target window: {window_title}")
 
-    def update_tempo(self, new_tempo: float):
+    def update_tempo(self, new_tempo: float, ramp_seconds: float = 0.0):
         if self.is_playing:
             self.tempo_scale = new_tempo
-            self.tempo_changed = True
-            print(f"Tempo updated to {new_tempo}% during playback")
+            self.scheduler.set_tempo(new_tempo, ramp_seconds)
+            if ramp_seconds > 0:
+                self.log.info("tempo_ramp", tempo=new_tempo, seconds=ramp_seconds)
+            else:
+                self.log.info("tempo_changed", tempo=new_tempo)
         else:
             self.tempo_scale = new_tempo
-            print(f"Tempo set to {new_tempo}% for next playback")
+            self.log.info("tempo_changed", tempo=new_tempo, pending=True)
+
+    def set_tempo_sections(self, file_path: str, sections) -> list:
+        """Store per-section tempo presets for ``file_path``; applies at once if it is playing."""
+        sections = self.tempo_presets.put(file_path, sections)
+        if self.is_playing and self._playing_path == file_path:
+            self.scheduler.set_sections(sections)
+        return sections
 
     def _enqueue_press(self, key: str):
-        self.event_queue.put(("press", key))
+        if self._batch is None:
+            raise RuntimeError("Key actions must be enqueued between _begin_batch and _flush_batch")
+        self._batch.append((OP_PRESS, key_code(key)))
 
     def _enqueue_release(self, key: str):
-        self.event_queue.put(("release", key))
+        if self._batch is None:
+            raise RuntimeError("Key actions must be enqueued between _begin_batch and _flush_batch")
+        self._batch.append((OP_RELEASE, key_code(key)))
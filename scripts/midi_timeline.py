@@ -0,0 +1,465 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Optional
+
+import mido
+
+try:
+    import numpy as np
+except ImportError:  # optional; compiling falls back to pure Python
+    np = None
+
+
+EVENT_NOTE_ON = 0
+EVENT_NOTE_OFF = 1
+EVENT_CONTROL_CHANGE = 2
+
+SUSTAIN_CONTROL = 64
+SNAPSHOT_INTERVAL = 256
+
+TIMELINE_FILE_VERSION = 1
+_MAGIC = b"RTLN"
+_BYTE_ORDER = 0 if sys.byteorder == "little" else 1
+# magic, version, byte order, content hash, duration, event count; 88 bytes keeps times 8-aligned
+_HEADER = struct.Struct("=4sHBx64sdI4x")
+
+_MESSAGE_TYPES = {
+    "note_on": EVENT_NOTE_ON,
+    "note_off": EVENT_NOTE_OFF,
+    "control_change": EVENT_CONTROL_CHANGE,
+}
+
+# Message kinds in track columns besides the three playback event types
+KIND_TEMPO = 3
+KIND_END_OF_TRACK = 4
+KIND_OTHER = 5
+_MESSAGE_KINDS = {**_MESSAGE_TYPES, "set_tempo": KIND_TEMPO, "end_of_track": KIND_END_OF_TRACK}
+DEFAULT_TEMPO = 500000
+
+
+def timeline_path(file_path: str) -> str:
+    return f"{file_path}.timeline"
+
+
+def file_content_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CompiledTimeline:
+    """Column-oriented playback events for one MIDI file.
+
+    Times are absolute microseconds. For control changes ``notes`` holds the
+    controller number and ``velocities`` the controller value.
+    """
+
+    def __init__(self, times_us, types, channels, notes, velocities,
+                 duration: float, content_hash: Optional[str] = None):
+        self.times_us = times_us
+        self.types = types
+        self.channels = channels
+        self.notes = notes
+        self.velocities = velocities
+        self.duration = duration
+        self.content_hash = content_hash
+        # ``(tick, seconds, tempo)`` per set_tempo; only known right after compiling
+        self.tempo_changes: Optional[list] = None
+        self._snapshots: Optional[list] = None
+        self._mapped = None
+
+    def __len__(self) -> int:
+        return len(self.times_us)
+
+    @classmethod
+    def from_midi_file(cls, mid: mido.MidiFile, content_hash: Optional[str] = None) -> "CompiledTimeline":
+        if mid.type == 2:
+            raise TypeError("can't merge tracks in type 2 (asynchronous) file")
+        return cls.from_track_columns([track_columns(track) for track in mid.tracks], mid.ticks_per_beat, content_hash)
+
+    @classmethod
+    def from_track_columns(cls, tracks: list, ticks_per_beat: int,
+                           content_hash: Optional[str] = None) -> "CompiledTimeline":
+        """Merge per-track columns (see ``track_columns``) into a timeline.
+
+        Produces exactly what iterating the ``mido.MidiFile`` would: the same
+        stable merge by absolute tick, the same tempo resolution and the
+        same floating point accumulation of event times.
+        """
+        merge = _merge_columns_numpy if np is not None else _merge_columns_python
+        *columns, tempo_changes = merge(tracks, ticks_per_beat)
+        timeline = cls(*columns, content_hash)
+        timeline.tempo_changes = tempo_changes
+        return timeline
+
+    @classmethod
+    def from_smf(cls, smf, content_hash: Optional[str] = None) -> "CompiledTimeline":
+        """Build from an ``smf_reader.SmfFile``."""
+        if smf.type == 2:
+            raise TypeError("can't merge tracks in type 2 (asynchronous) file")
+        return cls.from_track_columns(smf.tracks, smf.ticks_per_beat, content_hash)
+
+    @classmethod
+    def from_merged_messages(cls, mid: mido.MidiFile, content_hash: Optional[str] = None) -> "CompiledTimeline":
+        """Reference builder walking mido's own merged iteration; slow."""
+        times_us = array("q")
+        types = array("B")
+        channels = array("B")
+        notes = array("B")
+        velocities = array("B")
+
+        current_time = 0.0
+        for msg in mid:
+            current_time += msg.time
+            event_type = _MESSAGE_TYPES.get(msg.type)
+            if event_type is None:
+                continue
+            times_us.append(round(current_time * 1_000_000))
+            types.append(event_type)
+            channels.append(msg.channel)
+            if event_type == EVENT_CONTROL_CHANGE:
+                notes.append(msg.control)
+                velocities.append(msg.value)
+            else:
+                notes.append(msg.note)
+                velocities.append(msg.velocity)
+
+        return cls(times_us, types, channels, notes, velocities, current_time, content_hash)
+
+    @classmethod
+    def from_file(cls, file_path: str, content_hash: Optional[str] = None) -> "CompiledTimeline":
+        from smf_reader import read_smf_file  # smf_reader imports this module
+        return cls.from_smf(read_smf_file(file_path), content_hash)
+
+    def to_bytes(self) -> bytes:
+        """Serialize as a header followed by the columns, times first.
+
+        Every column is fixed width (8 bytes per time, 1 per type, channel,
+        note and velocity), so a stored timeline costs 12 bytes per event
+        and its columns can be viewed in place.
+        """
+        header = _HEADER.pack(_MAGIC, TIMELINE_FILE_VERSION, _BYTE_ORDER,
+                              (self.content_hash or "").encode(), self.duration, len(self))
+        return b"".join((header, array("q", self.times_us).tobytes(),
+                         *(array("B", column).tobytes()
+                           for column in (self.types, self.channels, self.notes, self.velocities))))
+
+    @classmethod
+    def from_buffer(cls, buffer, content_hash: Optional[str] = None) -> Optional["CompiledTimeline"]:
+        """View a serialized timeline without copying it; None if stale or invalid."""
+        view = memoryview(buffer)
+        if len(view) < _HEADER.size:
+            return None
+        magic, version, byte_order, stored_hash, duration, count = _HEADER.unpack_from(view)
+        stored_hash = stored_hash.rstrip(b"\0").decode()
+        if magic != _MAGIC or version != TIMELINE_FILE_VERSION or byte_order != _BYTE_ORDER:
+            return None
+        if content_hash is not None and stored_hash != content_hash:
+            return None
+        if len(view) != _HEADER.size + 12 * count:
+            return None
+        start = _HEADER.size + 8 * count
+        columns = [view[start + i * count:start + (i + 1) * count] for i in range(4)]
+        return cls(view[_HEADER.size:start].cast("q"), *columns, duration, stored_hash or None)
+
+    @classmethod
+    def load(cls, path: str, content_hash: Optional[str] = None) -> Optional["CompiledTimeline"]:
+        """Memory-map a stored timeline; snapshots are rebuilt on first seek."""
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        timeline = cls.from_buffer(mapped, content_hash)
+        if timeline is None:
+            mapped.close()
+        else:
+            timeline._mapped = mapped
+        return timeline
+
+    def close(self):
+        """Unmap a timeline loaded with ``load``; it cannot be used afterwards.
+
+        Windows will not rename or delete a file while it is mapped.
+        """
+        mapped = self._mapped
+        if mapped is None:
+            return
+        self._mapped = None
+        for column in (self.times_us, self.types, self.channels, self.notes, self.velocities):
+            if isinstance(column, memoryview):
+                column.release()
+        try:
+            mapped.close()
+        except BufferError:
+            # Some other view is still alive; the map closes when it is collected
+            pass
+
+    def save(self, path: str):
+        fd, temp_path = tempfile.mkstemp(prefix=".timeline-", suffix=".tmp", dir=os.path.dirname(path) or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.to_bytes())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def index_at(self, position: float) -> int:
+        """Index of the first event at or after ``position`` seconds."""
+        return bisect_left(self.times_us, round(position * 1_000_000))
+
+    def _build_snapshots(self) -> list:
+        snapshots = []
+        sounding: dict[int, int] = {}
+        sustain = False
+        types = self.types
+        notes = self.notes
+        velocities = self.velocities
+        for index in range(len(self.times_us)):
+            if index % SNAPSHOT_INTERVAL == 0:
+                snapshots.append((dict(sounding), sustain))
+            sustain = self._apply_event(index, types[index], notes[index], velocities[index], sounding, sustain)
+        return snapshots
+
+    @staticmethod
+    def _apply_event(index, event_type, note, velocity, sounding, sustain) -> bool:
+        if event_type == EVENT_NOTE_ON and velocity > 0:
+            sounding[note] = index
+        elif event_type == EVENT_NOTE_OFF or event_type == EVENT_NOTE_ON:
+            sounding.pop(note, None)
+        elif note == SUSTAIN_CONTROL:
+            sustain = velocity >= 64
+        return sustain
+
+    def state_at(self, index: int) -> tuple[dict, bool]:
+        """Playback state just before event ``index``.
+
+        Returns ``(sounding, sustain)`` where ``sounding`` maps each held note
+        to the index of the note-on event that started it.
+        """
+        if self._snapshots is None:
+            self._snapshots = self._build_snapshots()
+        if not self._snapshots:
+            return {}, False
+
+        index = max(0, min(index, len(self.times_us)))
+        snapshot_index = min(index // SNAPSHOT_INTERVAL, len(self._snapshots) - 1)
+        sounding, sustain = self._snapshots[snapshot_index]
+        sounding = dict(sounding)
+        types = self.types
+        notes = self.notes
+        velocities = self.velocities
+        for i in range(snapshot_index * SNAPSHOT_INTERVAL, index):
+            sustain = self._apply_event(i, types[i], notes[i], velocities[i], sounding, sustain)
+        return sounding, sustain
+
+    def to_message(self, index: int) -> mido.Message:
+        event_type = self.types[index]
+        channel = self.channels[index]
+        if event_type == EVENT_CONTROL_CHANGE:
+            return mido.Message("control_change", channel=channel,
+                                control=self.notes[index], value=self.velocities[index])
+        msg_type = "note_on" if event_type == EVENT_NOTE_ON else "note_off"
+        return mido.Message(msg_type, channel=channel,
+                            note=self.notes[index], velocity=self.velocities[index])
+
+
+def track_columns(track) -> tuple:
+    """``(delta_ticks, kinds, channels, data1, data2)`` lists for one track.
+
+    ``data1``/``data2`` hold note and velocity, controller and value, or
+    the tempo (for ``KIND_TEMPO``) and 0.
+    """
+    ticks = []
+    kinds = []
+    channels = []
+    data1 = []
+    data2 = []
+    kind_of = _MESSAGE_KINDS.get
+    for msg in track:
+        kind = kind_of(msg.type, KIND_OTHER)
+        ticks.append(msg.time)
+        kinds.append(kind)
+        if kind <= EVENT_NOTE_OFF:
+            channels.append(msg.channel)
+            data1.append(msg.note)
+            data2.append(msg.velocity)
+        elif kind == EVENT_CONTROL_CHANGE:
+            channels.append(msg.channel)
+            data1.append(msg.control)
+            data2.append(msg.value)
+        else:
+            channels.append(0)
+            data1.append(msg.tempo if kind == KIND_TEMPO else 0)
+            data2.append(0)
+    return ticks, kinds, channels, data1, data2
+
+
+def _merge_columns_python(tracks: list, ticks_per_beat: int) -> tuple:
+    absolute = []
+    kinds = []
+    channels = []
+    data1 = []
+    data2 = []
+    for track_ticks, track_kinds, track_channels, track_data1, track_data2 in tracks:
+        now = 0
+        for delta in track_ticks:
+            now += delta
+            absolute.append(now)
+        kinds.extend(track_kinds)
+        channels.extend(track_channels)
+        data1.extend(track_data1)
+        data2.extend(track_data2)
+
+    times_us = array("q")
+    types = array("B")
+    event_channels = array("B")
+    notes = array("B")
+    velocities = array("B")
+    tempo_changes = []
+    tempo = DEFAULT_TEMPO
+    current_time = 0.0
+    previous = 0
+    order = sorted(range(len(absolute)), key=absolute.__getitem__)
+    for index in order:
+        kind = kinds[index]
+        if kind == KIND_END_OF_TRACK:
+            # mido drops these and carries their delta to the next message
+            continue
+        tick = absolute[index]
+        if tick > previous:
+            current_time += (tick - previous) * (tempo * 1e-6 / ticks_per_beat)
+            previous = tick
+        if kind <= EVENT_CONTROL_CHANGE:
+            times_us.append(round(current_time * 1_000_000))
+            types.append(kind)
+            event_channels.append(channels[index])
+            notes.append(data1[index])
+            velocities.append(data2[index])
+        elif kind == KIND_TEMPO:
+            tempo = data1[index]
+            tempo_changes.append((tick, current_time, tempo))
+    end = absolute[order[-1]] if order else 0
+    if end > previous:
+        current_time += (end - previous) * (tempo * 1e-6 / ticks_per_beat)
+    return times_us, types, event_channels, notes, velocities, current_time, tempo_changes
+
+
+def _merge_columns_numpy(tracks: list, ticks_per_beat: int) -> tuple:
+    if not any(track[0] for track in tracks):
+        return _merge_columns_python(tracks, ticks_per_beat)
+    absolute = np.concatenate([np.cumsum(np.asarray(track[0], dtype=np.int64)) for track in tracks])
+    order = np.argsort(absolute, kind="stable")
+    columns = [
+        np.concatenate([np.asarray(track[i], dtype=np.int64) for track in tracks])[order]
+        for i in range(1, 5)
+    ]
+    absolute = absolute[order]
+    end = absolute[-1]
+    kept = columns[0] != KIND_END_OF_TRACK
+    absolute = absolute[kept]
+    kinds, channels, data1, data2 = (column[kept] for column in columns)
+
+    # Delta ticks between kept messages, plus the final end_of_track's
+    ticks = np.diff(absolute, prepend=0, append=end)
+    # Tempo in effect for each message: the last set_tempo strictly before it
+    tempo_rows = np.maximum.accumulate(np.where(kinds == KIND_TEMPO, np.arange(len(kinds)), -1))
+    tempo_rows = np.concatenate(([-1], tempo_rows))
+    tempos = np.append(data1, DEFAULT_TEMPO)[tempo_rows]
+    seconds = np.cumsum(ticks * (tempos * 1e-6 / ticks_per_beat))
+
+    events = kinds <= EVENT_CONTROL_CHANGE
+    times_us = np.rint(seconds[:-1][events] * 1_000_000).astype(np.int64)
+    tempo_rows = np.flatnonzero(kinds == KIND_TEMPO)
+    return (
+        array("q", times_us.tobytes()),
+        *(array("B", column[events].astype(np.uint8).tobytes()) for column in (kinds, channels, data1, data2)),
+        float(seconds[-1]),
+        list(zip(absolute[tempo_rows].tolist(), seconds[tempo_rows].tolist(), data1[tempo_rows].tolist())),
+    )
+
+
+class TimelineCache:
+    """LRU cache of compiled timelines keyed by file path and content hash.
+
+    Compiled timelines are also written next to their file as
+    ``<file>.timeline`` and memory-mapped from there on later misses, so a
+    file is only parsed with mido once.
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple[str, str], CompiledTimeline]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.misses = 0
+
+    def get(self, file_path: str, content_hash: Optional[str] = None) -> CompiledTimeline:
+        if content_hash is None:
+            content_hash = file_content_hash(file_path)
+        key = (file_path, content_hash)
+
+        with self._lock:
+            timeline = self._entries.get(key)
+            if timeline is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return timeline
+
+        timeline = CompiledTimeline.load(timeline_path(file_path), content_hash)
+        if timeline is not None:
+            with self._lock:
+                self.loads += 1
+            self.put(file_path, timeline)
+            return timeline
+
+        timeline = CompiledTimeline.from_file(file_path, content_hash)
+        with self._lock:
+            self.misses += 1
+        self.put(file_path, timeline, persist=True)
+        return timeline
+
+    def put(self, file_path: str, timeline: CompiledTimeline, persist: bool = False):
+        """Cache ``timeline``; with ``persist`` also store it as the file's ``.timeline``."""
+        if persist:
+            try:
+                timeline.save(timeline_path(file_path))
+            except OSError as e:
+                print(f"Could not write timeline for {file_path}: {e}")
+        key = (file_path, timeline.content_hash)
+        with self._lock:
+            self._entries[key] = timeline
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, file_path: Optional[str] = None, close: bool = False):
+        """Drop cached timelines; with ``close`` also unmap them (none may be in use)."""
+        with self._lock:
+            keys = [k for k in self._entries if file_path is None or k[0] == file_path]
+            dropped = [self._entries.pop(key) for key in keys]
+        if close:
+            for timeline in dropped:
+                timeline.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "loads": self.loads,
+                "misses": self.misses,
+            }
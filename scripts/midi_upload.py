@@ -0,0 +1,118 @@
+import hashlib
+import os
+import struct
+import tempfile
+
+
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+_CHUNK_HEADER = struct.Struct(">4sI")
+_MTHD_BODY = struct.Struct(">HHH")
+
+
+class UploadRejected(Exception):
+    pass
+
+
+class SmfStreamValidator:
+    """Checks Standard MIDI File chunk framing as bytes arrive.
+
+    The ``MThd`` header is validated from the first 14 bytes; after that
+    only chunk headers are inspected and chunk bodies are skipped, so a
+    file is rejected as soon as its structure goes wrong.
+    """
+
+    def __init__(self):
+        self.track_count = 0
+        self.declared_tracks = None
+        self.format = None
+        self._pending = b""
+        self._skip = 0
+        self._seen_header = False
+
+    def feed(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            if self._skip:
+                step = min(self._skip, len(view))
+                self._skip -= step
+                view = view[step:]
+                continue
+            if self._seen_header and self.track_count >= self.declared_tracks:
+                # Like mido, ignore anything after the declared tracks.
+                return
+
+            needed = (_CHUNK_HEADER.size + _MTHD_BODY.size) if not self._seen_header else _CHUNK_HEADER.size
+            take = min(needed - len(self._pending), len(view))
+            self._pending += bytes(view[:take])
+            view = view[take:]
+            if len(self._pending) < needed:
+                return
+
+            chunk_type, length = _CHUNK_HEADER.unpack_from(self._pending)
+            if not self._seen_header:
+                self._check_header(chunk_type, length)
+            else:
+                if chunk_type == b"MTrk":
+                    self.track_count += 1
+                elif not chunk_type.isascii() or not chunk_type.isalpha():
+                    raise UploadRejected(f"Invalid chunk type {chunk_type!r}")
+                self._skip = length
+            self._pending = b""
+
+    def _check_header(self, chunk_type: bytes, length: int):
+        if chunk_type != b"MThd":
+            raise UploadRejected("Not a Standard MIDI File (missing MThd header)")
+        if length < _MTHD_BODY.size:
+            raise UploadRejected("Invalid MThd header length")
+        file_format, tracks, division = _MTHD_BODY.unpack_from(self._pending, _CHUNK_HEADER.size)
+        if file_format > 2:
+            raise UploadRejected(f"Unsupported MIDI format {file_format}")
+        if tracks == 0:
+            raise UploadRejected("MIDI file declares no tracks")
+        if division == 0:
+            raise UploadRejected("Invalid MIDI time division")
+        self.format = file_format
+        self.declared_tracks = tracks
+        self._seen_header = True
+        self._skip = length - _MTHD_BODY.size
+
+    def finish(self):
+        if not self._seen_header:
+            raise UploadRejected("File too short to be a MIDI file")
+        if self._pending or self._skip:
+            raise UploadRejected("MIDI file is truncated")
+        if self.track_count < self.declared_tracks:
+            raise UploadRejected(
+                f"MIDI file declares {self.declared_tracks} tracks but contains {self.track_count}"
+            )
+
+
+async def receive_midi_upload(upload, directory: str, max_bytes: int = MAX_UPLOAD_BYTES) -> tuple[str, int, str]:
+    """Stream ``upload`` into a temp file in ``directory``, validating as it goes.
+
+    Returns ``(temp_path, size, sha256)``; the caller moves the temp file
+    into place. Nothing is left behind if the upload is rejected.
+    """
+    validator = SmfStreamValidator()
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(f"File too large. Maximum size is {max_bytes // (1024 * 1024)}MB.")
+                validator.feed(chunk)
+                digest.update(chunk)
+                out.write(chunk)
+        validator.finish()
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return temp_path, size, digest.hexdigest()
@@ -0,0 +1,253 @@
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from metrics import registry
+from time_warp import TimeWarp
+
+
+_LATENESS = registry.histogram("robe_scheduler_lateness_seconds",
+                               "Delay between an event batch's deadline and its dispatch")
+
+
+class LatencyStats:
+    """Fixed-size window of nanosecond samples with percentile summaries."""
+
+    def __init__(self, window: int = 4096):
+        self.window = window
+        self._samples = array("q", bytes(8 * window))
+        self._count = 0
+        self._max = 0
+
+    def record(self, value_ns: int):
+        self._samples[self._count % self.window] = value_ns
+        self._count += 1
+        if value_ns > self._max:
+            self._max = value_ns
+
+    def reset(self):
+        self._count = 0
+        self._max = 0
+
+    def snapshot(self) -> dict:
+        count = self._count
+        filled = min(count, self.window)
+        if filled == 0:
+            return {"count": 0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0, "mean_ms": 0.0}
+        samples = sorted(self._samples[:filled])
+        return {
+            "count": count,
+            "p50_ms": samples[filled // 2] / 1e6,
+            "p99_ms": samples[min(filled - 1, (filled * 99) // 100)] / 1e6,
+            "max_ms": self._max / 1e6,
+            "mean_ms": sum(samples) / filled / 1e6,
+        }
+
+
+class _Run:
+    """State shared between the scheduler's callers and one run's thread.
+
+    Every run gets its own, so a thread that is still winding down after
+    ``stop()`` never sees the flags or requests of the run that replaced it.
+    """
+
+    def __init__(self, warp: TimeWarp):
+        self.warp = warp
+        self.stop = threading.Event()
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.seek_us: Optional[int] = None
+        self.tempo: Optional[tuple[float, float]] = None
+        self.sections: Optional[list] = None
+
+    def request(self, **changes):
+        with self.lock:
+            for name, value in changes.items():
+                setattr(self, name, value)
+        self.wake.set()
+
+    def take_requests(self) -> tuple:
+        """Hand over pending seek, tempo and section changes and clear them in one step."""
+        with self.lock:
+            requests = (self.seek_us, self.tempo, self.sections)
+            self.seek_us = self.tempo = self.sections = None
+        return requests
+
+    def interrupted(self) -> bool:
+        return (self.stop.is_set() or self.seek_us is not None
+                or self.tempo is not None or self.sections is not None)
+
+
+class PlaybackScheduler:
+    """Runs timeline dispatch on its own thread against absolute deadlines.
+
+    Deadlines come from ``time.perf_counter_ns``. The thread sleeps until
+    ``spin_ns`` before a deadline and then spins (yielding the GIL) for the
+    rest, so asyncio jitter does not leak into note timing. All events that
+    share a timestamp are handed to ``dispatch`` as one ``[start, end)`` batch.
+    Song time is mapped to deadlines by a ``TimeWarp``, so tempo changes,
+    ramps and section presets apply without touching the event list.
+
+    At most one run dispatches at a time: a new run waits on its own thread
+    for the previous one to finish before it dispatches anything.
+    """
+
+    def __init__(self, spin_ns: int = 1_500_000):
+        self.spin_ns = spin_ns
+        self.lateness = LatencyStats()
+        self._thread: Optional[threading.Thread] = None
+        self._run_state = _Run(TimeWarp())
+        self._future: Optional[Future] = None
+        self._local = threading.local()
+        # perf_counter_ns() the current run's deadlines are measured from
+        self.started_ns: Optional[int] = None
+
+    @property
+    def running(self) -> bool:
+        return (self._thread is not None and self._thread.is_alive()
+                and not self._run_state.stop.is_set())
+
+    @property
+    def warp(self) -> TimeWarp:
+        return self._run_state.warp
+
+    @property
+    def tempo(self) -> float:
+        return self._run_state.warp.tempo
+
+    def start(self, times_us, dispatch: Callable[[int, int], None], start_index: int,
+              position_us: int, tempo: float, on_seek: Callable[[int, int], int],
+              sections=()) -> Future:
+        """Start dispatching from ``start_index``.
+
+        ``on_seek(current_index, target_us)`` runs on the scheduler thread
+        and returns the index to continue from. ``sections`` are tempo
+        presets as accepted by ``time_warp.normalize_sections``.
+        """
+        self.stop()
+        previous = self._thread
+        run = _Run(TimeWarp(tempo, sections))
+        self._run_state = run
+
+        future: Future = Future()
+        self._future = future
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(run, previous, future, times_us, dispatch, start_index, position_us, on_seek),
+            name="playback-scheduler",
+            daemon=True,
+        )
+        self._thread.start()
+        return future
+
+    def seek(self, position_us: int):
+        self._run_state.request(seek_us=position_us)
+
+    def set_tempo(self, tempo: float, ramp_seconds: float = 0.0):
+        """Change tempo now, or linearly over ``ramp_seconds`` of playback."""
+        self._run_state.request(tempo=(tempo, ramp_seconds))
+
+    def set_sections(self, sections: list):
+        self._run_state.request(sections=sections)
+
+    def current_tempo(self, position_us: int) -> float:
+        """Effective tempo at ``position_us`` right now, ramps and section presets included."""
+        warp = self.warp
+        return warp.tempo_at(time.perf_counter_ns()) * warp.section_tempo(position_us) / 100.0
+
+    def stop(self) -> Future:
+        """Ask the current run to stop, without waiting for its thread.
+
+        Returns the run's future, which is done once the thread has
+        dispatched its last batch. Its done callbacks run on that thread,
+        so they can still produce into the action ring as its only writer.
+        """
+        run = self._run_state
+        run.stop.set()
+        run.wake.set()
+        thread = self._thread
+        if thread is not None and not thread.is_alive():
+            self._thread = None
+        if self._future is None:
+            self._future = Future()
+            self._future.set_result(False)
+        return self._future
+
+    def may_produce(self) -> bool:
+        """True when the calling thread may write to the action ring.
+
+        While a run's future is pending only its thread may; once the
+        future is done the run has dispatched its last batch and the
+        caller owns the ring.
+        """
+        future = self._future
+        if future is None or future.done():
+            return True
+        return threading.current_thread() is self._thread
+
+    def stop_requested(self) -> bool:
+        """True when called from ``dispatch`` of a run that has been asked to stop."""
+        run = getattr(self._local, "run", None)
+        return run is not None and run.stop.is_set()
+
+    def _wait_until(self, run: _Run, deadline_ns: int) -> bool:
+        spin_ns = self.spin_ns
+        while True:
+            remaining = deadline_ns - time.perf_counter_ns()
+            if remaining <= 0:
+                return True
+            if run.interrupted():
+                return False
+            if remaining > spin_ns:
+                if run.wake.wait((remaining - spin_ns) / 1e9):
+                    run.wake.clear()
+            else:
+                time.sleep(0)
+
+    def _run(self, run: _Run, previous: Optional[threading.Thread], future: Future,
+             times_us, dispatch, index: int, position_us: int, on_seek):
+        try:
+            if previous is not None:
+                previous.join()
+            self._local.run = run
+            event_count = len(times_us)
+            warp = run.warp
+            self.started_ns = time.perf_counter_ns()
+            warp.anchor(position_us, self.started_ns)
+
+            while not run.stop.is_set() and index < event_count:
+                seek_us, tempo, sections = run.take_requests()
+                if seek_us is not None:
+                    index = on_seek(index, seek_us)
+                    warp.anchor(seek_us, time.perf_counter_ns())
+                if tempo is not None:
+                    warp.set_tempo(tempo[0], time.perf_counter_ns(), tempo[1])
+                if sections is not None:
+                    warp.set_sections(sections, time.perf_counter_ns())
+                if seek_us is not None or tempo is not None or sections is not None:
+                    continue
+
+                event_us = times_us[index]
+                end = index + 1
+                while end < event_count and times_us[end] == event_us:
+                    end += 1
+
+                deadline_ns = warp.wall_at(event_us)
+                if not self._wait_until(run, deadline_ns):
+                    continue
+
+                late_ns = time.perf_counter_ns() - deadline_ns
+                self.lateness.record(late_ns)
+                if registry.enabled:
+                    _LATENESS.observe(late_ns / 1e9)
+                dispatch(index, end)
+                index = end
+
+            # Done callbacks release keys on this thread; they must not count as stopped
+            self._local.run = None
+            future.set_result(index >= event_count and not run.stop.is_set())
+        except BaseException as e:
+            self._local.run = None
+            future.set_exception(e)
@@ -0,0 +1,253 @@
+import asyncio
+import random
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+REPEAT_MODES = ("off", "one", "all")
+
+
+class Playlist:
+    """A play queue on top of ``MidiProcessor``.
+
+    While a track plays, the next one is compiled and key-lowered on a
+    background worker, and the MIDI output port is kept open between
+    tracks, so advancing does not pay the parse/compile/open cost.
+    ``on_change`` receives a ``queue_state`` message whenever the queue,
+    the current track or the play mode changes; ``on_playback(track,
+    playing)`` is called when the queue starts, advances or stops playback.
+    """
+
+    def __init__(self, processor, on_change: Optional[Callable] = None,
+                 on_playback: Optional[Callable] = None):
+        self.processor = processor
+        self.on_change = on_change
+        self.on_playback = on_playback
+        self.tracks: list[dict] = []
+        self.repeat = "off"
+        self.shuffle = False
+        self.playing = False
+        self._order: list[int] = []
+        self._cursor = -1
+        self._generation = 0
+        self._task: Optional[asyncio.Task] = None
+        self._preloader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="playlist-preload")
+        self._preload: Optional[tuple[int, Future]] = None
+        self._next_id = 1
+
+    @property
+    def current(self) -> Optional[dict]:
+        if 0 <= self._cursor < len(self._order):
+            return self.tracks[self._order[self._cursor]]
+        return None
+
+    @property
+    def engaged(self) -> bool:
+        """True while the queue owns playback (playing or paused on a track)."""
+        return self.playing or (self.processor.is_paused and self.current is not None
+                                and self._task is not None)
+
+    def add(self, name: str, path: str, content_hash: Optional[str] = None) -> dict:
+        track = {"id": self._next_id, "name": name, "path": path, "hash": content_hash}
+        self._next_id += 1
+        self.tracks.append(track)
+        if self.shuffle and self._order:
+            position = random.randint(self._cursor + 1, len(self._order))
+            self._order.insert(position, len(self.tracks) - 1)
+        else:
+            self._order.append(len(self.tracks) - 1)
+        self._changed()
+        return track
+
+    def remove(self, index: int):
+        if not 0 <= index < len(self.tracks):
+            raise IndexError(f"No track at position {index}")
+        if self.engaged and self._order[self._cursor] == index:
+            raise ValueError("Cannot remove the track that is playing")
+        current = self.current
+        del self.tracks[index]
+        self._order = [i - (i > index) for i in self._order if i != index]
+        self._cursor = self._index_in_order(current)
+        self._changed()
+
+    def clear(self):
+        if self.engaged:
+            raise ValueError("Cannot clear the queue while it is playing")
+        self.tracks = []
+        self._order = []
+        self._cursor = -1
+        self.cancel_preload()
+        self._changed()
+
+    def cancel_preload(self) -> Optional[Future]:
+        """Forget the preloaded track; returns its future if it is still running."""
+        preload = self._preload
+        self._preload = None
+        if preload is None or preload[1].cancel() or preload[1].done():
+            return None
+        return preload[1]
+
+    def set_mode(self, shuffle: Optional[bool] = None, repeat: Optional[str] = None):
+        if repeat is not None:
+            if repeat not in REPEAT_MODES:
+                raise ValueError(f"Repeat mode must be one of {', '.join(REPEAT_MODES)}")
+            self.repeat = repeat
+        if shuffle is not None and shuffle != self.shuffle:
+            self.shuffle = shuffle
+            current = self.current
+            order = list(range(len(self.tracks)))
+            if shuffle:
+                if current is not None:
+                    order.remove(self.tracks.index(current))
+                random.shuffle(order)
+                if current is not None:
+                    order.insert(0, self.tracks.index(current))
+            self._order = order
+            self._cursor = self._index_in_order(current)
+        self._changed()
+
+    def play(self, index: Optional[int] = None, tempo: Optional[float] = None):
+        """Start the queue at track ``index`` (default: current or first)."""
+        if not self.tracks:
+            raise ValueError("Queue is empty")
+        if index is not None:
+            if not 0 <= index < len(self.tracks):
+                raise IndexError(f"No track at position {index}")
+            self._cursor = self._order.index(index)
+        elif self._cursor < 0:
+            self._cursor = 0
+        if self.processor.is_playing or self.processor.is_paused:
+            self.processor.stop_playback()
+        if tempo is not None:
+            self.processor.tempo_scale = tempo
+        self._start()
+
+    def resume(self):
+        if self.current is None:
+            raise ValueError("Queue is empty")
+        self._start()
+
+    def stop(self):
+        self._generation += 1
+        self.playing = False
+        self._task = None
+        self._changed()
+        self._playback_changed()
+
+    def next(self):
+        self._skip(self._peek(1, wrap=self.repeat != "off"))
+
+    def previous(self):
+        self._skip(self._peek(-1, wrap=self.repeat != "off"))
+
+    def _skip(self, cursor: Optional[int]):
+        if cursor is None:
+            raise ValueError("No track to skip to")
+        was_playing = self.playing
+        if self.processor.is_playing or self.processor.is_paused:
+            self.processor.stop_playback()
+        self._cursor = cursor
+        if was_playing:
+            self._start()
+        else:
+            self.stop()
+
+    def _peek(self, step: int, wrap: bool) -> Optional[int]:
+        if not self._order:
+            return None
+        cursor = self._cursor + step
+        if 0 <= cursor < len(self._order):
+            return cursor
+        return cursor % len(self._order) if wrap else None
+
+    def _following(self) -> Optional[int]:
+        """Cursor of the track that plays after the current one finishes."""
+        if self.repeat == "one":
+            return self._cursor
+        return self._peek(1, wrap=self.repeat == "all")
+
+    def _index_in_order(self, track: Optional[dict]) -> int:
+        if track is None or track not in self.tracks:
+            return -1 if not self._order else min(max(self._cursor, 0), len(self._order) - 1)
+        return self._order.index(self.tracks.index(track))
+
+    def _start(self):
+        self._generation += 1
+        self.playing = True
+        self._task = asyncio.get_running_loop().create_task(self._run(self._generation))
+
+    async def _run(self, generation: int):
+        while generation == self._generation:
+            track = self.current
+            following = self._following()
+            self._preload_track(following)
+            self._changed()
+            self._playback_changed()
+            finished = await self.processor.play_midi_file(
+                track["path"],
+                self.processor.tempo_scale,
+                content_hash=track["hash"],
+                keep_output_open=following is not None,
+            )
+            if generation != self._generation:
+                return
+            if not finished:
+                # Paused, stopped or failed; a resume restarts this loop
+                self.playing = False
+                self._changed()
+                self._playback_changed()
+                return
+            if following is None:
+                self.stop()
+                return
+            self._cursor = following
+
+    def _preload_track(self, cursor: Optional[int]):
+        if cursor is None:
+            return
+        track = self.tracks[self._order[cursor]]
+        if self._preload is not None and self._preload[0] == track["id"]:
+            return
+        future = self._preloader.submit(self.processor.prepare_timeline, track["path"], track["hash"])
+        future.add_done_callback(self._preload_done)
+        self._preload = (track["id"], future)
+
+    def _preload_done(self, future: Future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.processor.log.warning("playlist_preload_failed", error=error)
+
+    def state(self) -> dict:
+        following = self._following()
+        next_track = self.tracks[self._order[following]] if following is not None else None
+        preloaded = False
+        if next_track is not None and self._preload is not None and self._preload[0] == next_track["id"]:
+            future = self._preload[1]
+            preloaded = future.done() and not future.cancelled() and future.exception() is None
+        return {
+            "type": "queue_state",
+            "tracks": [
+                {"id": track["id"], "name": track["name"], "hash": track["hash"]}
+                for track in self.tracks
+            ],
+            "order": list(self._order),
+            "current": self._order[self._cursor] if self.current is not None else None,
+            "next": self._order[following] if following is not None else None,
+            "playing": self.playing,
+            "shuffle": self.shuffle,
+            "repeat": self.repeat,
+            "preloaded": preloaded,
+        }
+
+    def _playback_changed(self):
+        if self.on_playback:
+            self.on_playback(self.current, self.playing)
+
+    def _changed(self):
+        if self.on_change:
+            try:
+                self.on_change(self.state())
+            except Exception as e:
+                print(f"Queue change callback error: {e}")
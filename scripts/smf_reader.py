@@ -0,0 +1,268 @@
+"""Standard MIDI File reader for the playback and analysis paths.
+
+``read_smf`` scans the file bytes once and emits per-track columns (see
+``midi_timeline.track_columns``) instead of building a ``mido.Message``
+per event. Only note, control change, tempo and end-of-track events are
+decoded; everything else is skipped in place, and rows for skipped events
+are dropped whenever that cannot change event timing.
+
+Parsing follows mido (running status after sysex included), with one
+deliberate difference: mido 1.3 loses the delta time of meta events it
+has no spec for, this reader keeps it. Check parity with mido::
+
+    python smf_reader.py song.mid other.mid
+"""
+import argparse
+import struct
+import sys
+import time
+from array import array
+from typing import Optional
+
+from midi_timeline import (
+    EVENT_NOTE_ON,
+    EVENT_NOTE_OFF,
+    EVENT_CONTROL_CHANGE,
+    KIND_TEMPO,
+    KIND_END_OF_TRACK,
+    KIND_OTHER,
+)
+
+
+_CHUNK_HEADER = struct.Struct(">4sI")
+_MTHD_BODY = struct.Struct(">hhh")
+
+# Total length (status byte included) of system messages, as in mido's specs
+_SYSTEM_LENGTHS = {0xF1: 2, 0xF2: 3, 0xF3: 2, 0xF6: 1, 0xF8: 1, 0xFA: 1, 0xFB: 1, 0xFC: 1, 0xFE: 1}
+# Meta types mido can decode; it drops the delta time of any other
+_MIDO_META_TYPES = frozenset((0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0x09,
+                              0x20, 0x21, 0x2F, 0x51, 0x54, 0x58, 0x59, 0x7F))
+
+
+class SmfError(Exception):
+    pass
+
+
+class SmfFile:
+    """A parsed file: header fields, per-track columns, names and message counts."""
+
+    def __init__(self, file_type: int, ticks_per_beat: int, tracks: list,
+                 track_names: list, track_events: list, unknown_meta_deltas: int = 0):
+        self.type = file_type
+        self.ticks_per_beat = ticks_per_beat
+        self.tracks = tracks
+        self.track_names = track_names
+        self.track_events = track_events
+        # Events where mido's timing differs from ours (see module docstring)
+        self.unknown_meta_deltas = unknown_meta_deltas
+
+
+def read_smf_file(path: str) -> SmfFile:
+    with open(path, "rb") as f:
+        return read_smf(f.read())
+
+
+def read_smf(data) -> SmfFile:
+    view = memoryview(data).cast("B") if not isinstance(data, bytes) else memoryview(data)
+    if len(view) < _CHUNK_HEADER.size:
+        raise SmfError("File too short to be a MIDI file")
+    chunk_type, length = _CHUNK_HEADER.unpack_from(view)
+    if chunk_type != b"MThd":
+        raise SmfError("MThd not found. Probably not a MIDI file")
+    if length < _MTHD_BODY.size or len(view) < _CHUNK_HEADER.size + length:
+        raise SmfError("Truncated MThd header")
+    file_type, track_count, ticks_per_beat = _MTHD_BODY.unpack_from(view, _CHUNK_HEADER.size)
+
+    buf = data if isinstance(data, bytes) else view
+    position = _CHUNK_HEADER.size + length
+    tracks = []
+    names = []
+    counts = []
+    unknown_meta_deltas = 0
+    for _ in range(track_count):
+        if len(view) < position + _CHUNK_HEADER.size:
+            raise SmfError("MIDI file is truncated")
+        chunk_type, length = _CHUNK_HEADER.unpack_from(view, position)
+        if chunk_type != b"MTrk":
+            raise SmfError("no MTrk header at start of track")
+        start = position + _CHUNK_HEADER.size
+        position = start + length
+        if position > len(view):
+            raise SmfError("MIDI file is truncated")
+        try:
+            columns, name, count, unknown = _read_track(buf, view, start, position)
+        except IndexError:
+            raise SmfError("Track data runs past the end of its chunk") from None
+        tracks.append(columns)
+        names.append(name)
+        counts.append(count)
+        unknown_meta_deltas += unknown
+    return SmfFile(file_type, ticks_per_beat, tracks, names, counts, unknown_meta_deltas)
+
+
+def _read_track(buf, view, position: int, end: int) -> tuple:
+    ticks = array("q")
+    kinds = array("B")
+    channels = array("B")
+    data1 = array("q")
+    data2 = array("B")
+    name: Optional[str] = None
+    count = 0
+    unknown_meta_deltas = 0
+    last_status = None
+    last_kind = KIND_OTHER
+    while position < end:
+        byte = buf[position]
+        position += 1
+        delta = byte & 0x7F
+        while byte & 0x80:
+            byte = buf[position]
+            position += 1
+            delta = (delta << 7) | (byte & 0x7F)
+
+        status = buf[position]
+        position += 1
+        peek = None
+        if status < 0x80:
+            if last_status is None:
+                raise SmfError("running status without last_status")
+            peek = status
+            status = last_status
+        elif status != 0xFF:
+            last_status = status
+        count += 1
+
+        kind = KIND_OTHER
+        channel = 0
+        first = 0
+        second = 0
+        if status < 0xF0:
+            high = status & 0xF0
+            if peek is None:
+                first = buf[position]
+                position += 1
+            else:
+                first = peek
+            if high != 0xC0 and high != 0xD0:
+                second = buf[position]
+                position += 1
+            if first > 127 or second > 127:
+                raise SmfError("data byte must be in range 0..127")
+            if high == 0x90:
+                kind = EVENT_NOTE_ON
+            elif high == 0x80:
+                kind = EVENT_NOTE_OFF
+            elif high == 0xB0:
+                kind = EVENT_CONTROL_CHANGE
+            channel = status & 0x0F
+        elif status == 0xFF:
+            meta_type = buf[position]
+            position += 1
+            length, position = _read_vlq(buf, position)
+            payload = position
+            position += length
+            if position > end:
+                raise SmfError("Meta event runs past the end of its track")
+            if meta_type == 0x51:
+                if length < 3:
+                    raise SmfError("set_tempo event is too short")
+                kind = KIND_TEMPO
+                first = (buf[payload] << 16) | (buf[payload + 1] << 8) | buf[payload + 2]
+            elif meta_type == 0x2F:
+                kind = KIND_END_OF_TRACK
+            elif meta_type == 0x03 and name is None:
+                name = bytes(view[payload:position]).decode("latin-1")
+            elif meta_type not in _MIDO_META_TYPES and delta:
+                unknown_meta_deltas += 1
+        elif status == 0xF0 or status == 0xF7:
+            # mido reads the length here even after a running-status byte
+            length, position = _read_vlq(buf, position)
+            position += length
+        else:
+            size = _SYSTEM_LENGTHS.get(status)
+            if size is None:
+                raise SmfError(f"undefined status byte 0x{status:02x}")
+            size -= 1 if peek is None else 2
+            if size < 0:
+                raise SmfError(f"running status with single-byte message 0x{status:02x}")
+            if peek is not None and peek > 127:
+                raise SmfError("data byte must be in range 0..127")
+            for offset in range(size):
+                if buf[position + offset] > 127:
+                    raise SmfError("data byte must be in range 0..127")
+            position += size
+        if position > end:
+            raise IndexError
+
+        # A skipped event with no delta cannot change timing unless it would
+        # carry the delta of a preceding end_of_track, so it is not stored.
+        if kind == KIND_OTHER and delta == 0 and last_kind != KIND_END_OF_TRACK:
+            continue
+        ticks.append(delta)
+        kinds.append(kind)
+        channels.append(channel)
+        data1.append(first)
+        data2.append(second)
+        last_kind = kind
+    return (ticks, kinds, channels, data1, data2), name or "", count, unknown_meta_deltas
+
+
+def _read_vlq(buf, position: int) -> tuple[int, int]:
+    value = 0
+    while True:
+        byte = buf[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, position
+
+
+def _check_file(path: str) -> bool:
+    import mido
+    from midi_metadata import extract_metadata, extract_smf_metadata
+    from midi_timeline import CompiledTimeline
+
+    started = time.perf_counter()
+    mid = mido.MidiFile(path)
+    expected = CompiledTimeline.from_midi_file(mid)
+    expected_metadata = extract_metadata(mid)
+    mido_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    smf = read_smf_file(path)
+    timeline = CompiledTimeline.from_smf(smf)
+    metadata = extract_smf_metadata(smf, timeline)
+    reader_time = time.perf_counter() - started
+
+    same_timeline = all(
+        bytes(getattr(timeline, column)) == bytes(getattr(expected, column))
+        for column in ("times_us", "types", "channels", "notes", "velocities")
+    ) and timeline.duration == expected.duration
+    same_metadata = metadata == expected_metadata
+    if same_timeline and same_metadata:
+        status = "identical"
+    elif smf.unknown_meta_deltas:
+        status = f"differs: mido drops the delta of {smf.unknown_meta_deltas} unknown meta event(s)"
+    else:
+        status = "MISMATCH" + ("" if same_timeline else " timeline") + ("" if same_metadata else " metadata")
+    print(f"{path}: {len(timeline)} events, mido {mido_time * 1000:.1f} ms, "
+          f"reader {reader_time * 1000:.1f} ms ({mido_time / reader_time:.1f}x), {status}")
+    return status == "identical" or bool(smf.unknown_meta_deltas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the native SMF reader with mido")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+    ok = True
+    for path in args.files:
+        try:
+            ok = _check_file(path) and ok
+        except Exception as e:
+            print(f"{path}: {type(e).__name__}: {e}")
+            ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Action-script replay against live ``press_note`` lowering.
+
+Run from this directory with ``python -m pytest test_action_script.py``.
+"""
+import itertools
+
+import pytest
+
+from action_ring import OP_PRESS
+from action_script import compile_action_script
+from bench_utils import groups, random_timeline
+from midi_timeline import CompiledTimeline
+
+
+SETTINGS = [
+    dict(zip(("sustain_enabled", "velocity_enabled", "no_doubles", "hold_keys"), values))
+    for values in itertools.product((False, True), repeat=4)
+]
+
+
+class Recorder:
+    """Stands in for the processor's action ring and keeps every batch pushed."""
+
+    def __init__(self):
+        self.batches = []
+        # Cleared to stand in for a batch given up while the run stops
+        self.accept = True
+
+    def push_batch(self, actions, enqueued_ns=None, cancelled=None):
+        if self.accept:
+            self.batches.append(list(actions))
+        return self.accept
+
+
+def playing(midi_processor, timeline: CompiledTimeline, settings: dict):
+    processor = midi_processor.MidiProcessor()
+    for name, value in settings.items():
+        setattr(processor, name, value)
+    processor.event_queue = Recorder()
+    processor._timeline = timeline
+    processor._lowered = processor._lower_timeline(timeline)
+    processor._lowered_version = processor._mapping_version
+    return processor
+
+
+@pytest.mark.parametrize("settings", SETTINGS, ids=lambda s: "-".join(k for k, v in s.items() if v) or "none")
+def test_script_replays_live_lowering(midi_processor, settings):
+    timeline = random_timeline(3)
+    live = playing(midi_processor, timeline, settings)
+    scripted = playing(midi_processor, timeline, settings)
+    script = compile_action_script(timeline, scripted._lowered, {**scripted._action_settings(), **settings})
+    scripted._script = script
+    scripted._script_settings = scripted._script_state()
+
+    held: set = set()
+    for start, end in groups(timeline):
+        live.event_queue.batches.clear()
+        scripted.event_queue.batches.clear()
+        live._dispatch_events(start, end)
+        scripted._dispatch_events(start, end)
+        assert scripted.event_queue.batches == live.event_queue.batches, start
+        for op, code in itertools.chain.from_iterable(live.event_queue.batches):
+            (held.add if op == OP_PRESS else held.discard)(code)
+        assert sorted(script.held_at(end)) == sorted(held), end
+    assert len(script) == len(timeline)
+
+
+@pytest.mark.parametrize("scripted", [False, True], ids=["live", "scripted"])
+@pytest.mark.parametrize("stop_at", [40, 41, 200, 333])
+def test_given_up_batch_leaves_no_key_held(midi_processor, scripted, stop_at):
+    """Keys pressed before the run gave up its last batch are still released on stop."""
+    settings = {"sustain_enabled": True, "velocity_enabled": False, "no_doubles": False, "hold_keys": True}
+    timeline = random_timeline(5)
+    processor = playing(midi_processor, timeline, settings)
+    if scripted:
+        processor._script = compile_action_script(timeline, processor._lowered, {**processor._action_settings(), **settings})
+        processor._script_settings = processor._script_state()
+
+    for start, end in itertools.islice(groups(timeline), stop_at):
+        processor._dispatch_events(start, end)
+    processor.event_queue.accept = False
+    processor._dispatch_events(*next(itertools.islice(groups(timeline), stop_at, None)))
+    processor.event_queue.accept = True
+    processor._begin_batch()
+    processor._release_all_keys()
+    processor._flush_batch()
+
+    held: set = set()
+    for op, code in itertools.chain.from_iterable(processor.event_queue.batches):
+        (held.add if op == OP_PRESS else held.discard)(code)
+    assert not held
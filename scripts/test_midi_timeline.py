@@ -0,0 +1,81 @@
+"""Snapshot seek against a linear replay of the timeline.
+
+Run from this directory with ``python -m pytest test_midi_timeline.py``.
+"""
+import random
+from bisect import bisect_left
+
+import pytest
+
+from bench_utils import groups, random_timeline
+from midi_timeline import CompiledTimeline, SNAPSHOT_INTERVAL
+
+
+def replay_state(timeline: CompiledTimeline, index: int) -> tuple[dict, bool]:
+    sounding: dict = {}
+    sustain = False
+    for i in range(index):
+        sustain = CompiledTimeline._apply_event(
+            i, timeline.types[i], timeline.notes[i], timeline.velocities[i], sounding, sustain)
+    return sounding, sustain
+
+
+def sample_indexes(timeline: CompiledTimeline, rng: random.Random) -> list:
+    boundaries = range(0, len(timeline) + 1, SNAPSHOT_INTERVAL)
+    around = [i + offset for i in boundaries for offset in (-1, 0, 1) if 0 <= i + offset <= len(timeline)]
+    return sorted(set(around + [rng.randint(0, len(timeline)) for _ in range(50)] + [len(timeline)]))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_state_at_matches_linear_replay(seed):
+    timeline = random_timeline(seed, events=3000)
+    rng = random.Random(seed)
+    for index in sample_indexes(timeline, rng):
+        assert timeline.state_at(index) == replay_state(timeline, index), index
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_index_at_is_first_event_at_or_after_position(seed):
+    timeline = random_timeline(seed, events=3000)
+    rng = random.Random(seed)
+    times = list(timeline.times_us)
+    positions = [rng.uniform(-1, timeline.duration + 1) for _ in range(200)]
+    positions += [time / 1_000_000 for time in times[::97]]
+    for position in positions:
+        target = round(position * 1_000_000)
+        expected = next((i for i, time in enumerate(times) if time >= target), len(times))
+        assert timeline.index_at(position) == expected == bisect_left(times, target)
+
+
+@pytest.mark.parametrize("no_doubles", [False, True])
+@pytest.mark.parametrize("hold_keys,sustain_enabled", [(True, True), (True, False), (False, True)])
+def test_restored_keys_match_live_dispatch(midi_processor, hold_keys, sustain_enabled, no_doubles):
+    """Keys held after seeking to an event equal those held after playing up to it."""
+    timeline = random_timeline(7, events=3000)
+    rng = random.Random(7)
+
+    def configure(processor):
+        processor.hold_keys = hold_keys
+        processor.sustain_enabled = sustain_enabled
+        processor.no_doubles = no_doubles
+        processor._timeline = timeline
+        processor._lowered = processor._lower_timeline(timeline)
+        processor._lowered_version = processor._mapping_version
+        return processor
+
+    # Seeks land on the first event of a timestamp, where live dispatch hands over whole chords
+    starts = [start for start, _ in groups(timeline)] + [len(timeline)]
+    targets = sorted({starts[bisect_left(starts, index)] for index in sample_indexes(timeline, rng)})
+    live = configure(midi_processor.MidiProcessor())
+    played = 0
+    for index in targets:
+        while played < index:
+            following = starts[bisect_left(starts, played + 1)]
+            live._dispatch_events(played, following)
+            played = following
+        seeked = configure(midi_processor.MidiProcessor())
+        seeked._begin_batch()
+        seeked._restore_state(timeline, index)
+        seeked._flush_batch()
+        assert seeked.active_notes == live.active_notes, index
+        assert seeked.sustain_pressed == live.sustain_pressed, index
@@ -0,0 +1,115 @@
+"""Parity of the native SMF reader with mido.
+
+Run from this directory with ``python -m pytest test_smf_reader.py``.
+"""
+import io
+import random
+import struct
+
+import mido
+import pytest
+
+import midi_timeline
+from midi_metadata import extract_metadata, extract_smf_metadata
+from midi_timeline import CompiledTimeline
+from smf_reader import SmfError, read_smf
+
+
+COLUMNS = ("times_us", "types", "channels", "notes", "velocities")
+MERGES = [pytest.param(False, id="python")]
+if midi_timeline.np is not None:
+    MERGES.append(pytest.param(True, id="numpy"))
+
+
+def random_file(seed: int) -> bytes:
+    """A type 1 file of random channel, meta and sysex events, saved with running status."""
+    rng = random.Random(seed)
+    mid = mido.MidiFile(type=1, ticks_per_beat=rng.choice([7, 96, 384, 480, 1000]))
+    for _ in range(rng.randint(0, 6)):
+        track = mido.MidiTrack()
+        mid.tracks.append(track)
+        for _ in range(rng.randint(0, 400)):
+            kind = rng.random()
+            time = rng.choice([0, 0, 1, rng.randint(0, 500), rng.randint(0, 300_000)])
+            channel = rng.choice([0, 0, rng.randint(0, 15)])
+            if kind < 0.05:
+                track.append(mido.MetaMessage("set_tempo", tempo=rng.randint(1, 2_000_000), time=time))
+            elif kind < 0.08:
+                track.append(mido.MetaMessage("end_of_track", time=time))
+            elif kind < 0.12:
+                track.append(mido.Message("control_change", channel=channel, control=rng.choice([7, 64]),
+                                          value=rng.randint(0, 127), time=time))
+            elif kind < 0.14:
+                track.append(mido.Message("program_change", channel=channel, program=3, time=time))
+            elif kind < 0.15:
+                track.append(mido.Message("pitchwheel", channel=channel, pitch=rng.randint(-8192, 8191), time=time))
+            elif kind < 0.16:
+                track.append(mido.Message("sysex", data=[rng.randint(0, 127) for _ in range(rng.randint(0, 20))],
+                                          time=time))
+            elif kind < 0.17:
+                track.append(mido.MetaMessage("text", text="x", time=time))
+            elif kind < 0.18:
+                track.append(mido.MetaMessage("track_name", name=rng.choice(["Piano", "Strings é"]), time=time))
+            elif kind < 0.19:
+                track.append(mido.Message("aftertouch", channel=channel, value=5, time=time))
+            else:
+                track.append(mido.Message(rng.choice(["note_on", "note_off"]), channel=channel,
+                                          note=rng.randint(0, 127), velocity=rng.randint(0, 127), time=time))
+    out = io.BytesIO()
+    mid.save(file=out)
+    return out.getvalue()
+
+
+def running_status_file() -> bytes:
+    """Hand-written track where every note after the first omits its status byte."""
+    body = bytearray(b"\x00\xff\x51\x03\x07\xa1\x20")  # 500000 us per beat
+    body += b"\x00\x90\x3c\x40"
+    for note in range(0x3d, 0x48):
+        body += bytes((0x20, note, 0x40, 0x10, note - 1, 0x00))
+    body += b"\x00\xb0\x40\x7f\x60\x40\x00"  # sustain on, then off by running status
+    body += b"\x00\xff\x2f\x00"
+    return (struct.pack(">4sIhhh", b"MThd", 6, 0, 1, 480)
+            + struct.pack(">4sI", b"MTrk", len(body)) + bytes(body))
+
+
+def assert_matches_mido(data: bytes, use_numpy: bool, monkeypatch):
+    mid = mido.MidiFile(file=io.BytesIO(data))
+    expected = CompiledTimeline.from_merged_messages(mid, "hash")
+    expected_metadata = extract_metadata(mid, "hash")
+
+    if not use_numpy:
+        monkeypatch.setattr(midi_timeline, "np", None)
+    smf = read_smf(data)
+    timeline = CompiledTimeline.from_smf(smf, "hash")
+
+    for column in COLUMNS:
+        assert list(getattr(timeline, column)) == list(getattr(expected, column)), column
+    assert timeline.duration == expected.duration
+    assert extract_smf_metadata(smf, timeline, "hash") == expected_metadata
+    return timeline
+
+
+@pytest.mark.parametrize("use_numpy", MERGES)
+@pytest.mark.parametrize("seed", range(300))
+def test_random_files_match_mido(seed, use_numpy, monkeypatch):
+    assert_matches_mido(random_file(seed), use_numpy, monkeypatch)
+
+
+@pytest.mark.parametrize("use_numpy", MERGES)
+def test_running_status_matches_mido(use_numpy, monkeypatch):
+    timeline = assert_matches_mido(running_status_file(), use_numpy, monkeypatch)
+    assert len(timeline) == 25
+
+
+@pytest.mark.parametrize("mangle", [
+    lambda data: b"",
+    lambda data: data[:4],
+    lambda data: data[:20],
+    lambda data: data[:-3],
+    lambda data: b"RIFF" + data[4:],
+    lambda data: data[:14] + b"XTrk" + data[18:],
+], ids=["empty", "magic-only", "truncated-header", "truncated-track", "not-midi", "bad-track-chunk"])
+def test_malformed_files_raise_smf_error(mangle):
+    data = random_file(1)
+    with pytest.raises(SmfError):
+        read_smf(mangle(data))
@@ -0,0 +1,124 @@
+"""Time-warp ramps and sections against numeric integration of playback speed.
+
+Run from this directory with ``python -m pytest test_time_warp.py``.
+"""
+from bisect import bisect_right
+
+import pytest
+
+from time_warp import TimeWarp, normalize_sections
+
+
+SECTIONS = [(1.0, 2.5, 50.0), (2.5, 4.0, 200.0), (6.0, 9.0, 80.0)]
+# (wall ns, what changes, arguments), applied in order as the scheduler would
+CHANGES = [
+    (2e9, "tempo", (150.0, 3.0)),
+    (5.5e9, "sections", [(0.5, 3.0, 120.0), (7.0, 8.0, 40.0)]),
+    (7e9, "tempo", (60.0, 1.5)),
+    (8e9, "tempo", (120.0, 0.0)),  # lands halfway through the previous ramp
+    (9e9, "tempo", (90.0, 2.0)),
+]
+END_NS = 12e9
+STEP_NS = 2e4
+# Each step can overshoot a section boundary by up to one step (40 song us at the fastest speed)
+SONG_TOLERANCE_US = 100
+
+
+def section_tempo(sections: list, song_us: float) -> float:
+    for start, end, tempo in sections:
+        if start * 1e6 <= song_us < end * 1e6:
+            return tempo
+    return 100.0
+
+
+def integrate(tempo: float, sections: list, changes: list) -> tuple[list, list]:
+    """Wall and song position on a fine grid, stepping song speed from its definition."""
+    ramp = (tempo, tempo, 0.0, 0.0)  # from, to, start, end
+
+    def main_tempo(wall_ns):
+        ramp_from, ramp_to, start, end = ramp
+        if wall_ns >= end:
+            return ramp_to
+        return ramp_from + (ramp_to - ramp_from) * (wall_ns - start) / (end - start)
+
+    walls, songs = [0.0], [0.0]
+    pending = list(changes)
+    wall = song = 0.0
+    while wall < END_NS:
+        while pending and pending[0][0] <= wall:
+            at, kind, args = pending.pop(0)
+            if kind == "tempo":
+                target, seconds = args
+                ramp = (main_tempo(at), target, at, at + seconds * 1e9)
+            else:
+                sections = args
+        middle = wall + STEP_NS / 2
+        song += main_tempo(middle) * section_tempo(sections, song) * 1e-7 * STEP_NS
+        wall += STEP_NS
+        walls.append(wall)
+        songs.append(song)
+    return walls, songs
+
+
+def interpolate(xs: list, ys: list, x: float) -> float:
+    index = min(max(bisect_right(xs, x) - 1, 0), len(xs) - 2)
+    x0, x1 = xs[index], xs[index + 1]
+    return ys[index] + (ys[index + 1] - ys[index]) * (x - x0) / (x1 - x0)
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return integrate(100.0, SECTIONS, CHANGES)
+
+
+def test_ramps_and_sections_match_integration(reference):
+    walls, songs = reference
+    warp = TimeWarp(100.0, SECTIONS)
+    bounds = [0.0] + [at for at, _, _ in CHANGES] + [END_NS]
+    for (at, kind, args), (begin, end) in zip([(0.0, None, None)] + CHANGES, zip(bounds, bounds[1:])):
+        if kind == "tempo":
+            warp.set_tempo(args[0], int(at), args[1])
+        elif kind == "sections":
+            warp.set_sections(args, int(at))
+        # The warp only answers for times after its latest change
+        for step in range(40):
+            wall = begin + (end - begin) * step / 40
+            assert warp.song_at(wall) == pytest.approx(interpolate(walls, songs, wall), abs=SONG_TOLERANCE_US)
+        first, last = warp.song_at(begin), warp.song_at(end)
+        for step in range(40):
+            song = first + (last - first) * step / 40
+            wall = warp.wall_at(song)
+            assert interpolate(walls, songs, wall) == pytest.approx(song, abs=SONG_TOLERANCE_US)
+            assert warp.song_at(wall) == pytest.approx(song, abs=0.01)
+
+
+def test_without_changes_song_time_is_wall_time():
+    warp = TimeWarp()
+    warp.anchor(2_000_000, 5_000)
+    for song_us in (2_000_000, 2_000_001, 3_500_000, 60_000_000):
+        assert warp.wall_at(song_us) == 5_000 + (song_us - 2_000_000) * 1000
+        assert warp.song_at(5_000 + (song_us - 2_000_000) * 1000) == song_us
+
+
+def test_positions_asked_out_of_order():
+    warp = TimeWarp(100.0, SECTIONS)
+    ordered = [warp.wall_at(song) for song in range(0, 10_000_000, 250_000)]
+    backwards = TimeWarp(100.0, SECTIONS)
+    assert [backwards.wall_at(song) for song in reversed(range(0, 10_000_000, 250_000))] == ordered[::-1]
+
+
+@pytest.mark.parametrize("sections", [
+    [(1, 3, 100), (2, 4, 100)],
+    [(2, 1, 100)],
+    [(-1, 1, 100)],
+    [(0, 1, 10)],
+    [(0, 1, 250)],
+])
+def test_invalid_sections_are_rejected(sections):
+    with pytest.raises(ValueError):
+        normalize_sections(sections)
+
+
+def test_sections_are_sorted_and_may_touch():
+    sections = normalize_sections([{"start": 2, "end": 3, "tempo": 25}, (0, 2, "200")])
+    assert sections == [(0.0, 2.0, 200.0), (2.0, 3.0, 25.0)]
@@ -0,0 +1,214 @@
+"""Song time to wall time mapping for the playback scheduler.
+
+Playback speed is the main tempo, which may be ramping linearly in wall
+time, multiplied by the tempo preset of the song section being played.
+Between change points (a ramp ending or a section boundary) speed is
+linear in wall time, so song position is quadratic in it and both
+directions of the mapping have closed forms. The scheduler asks for
+positions in increasing order, so moving on to the next segment is
+amortized O(1) per event.
+"""
+import json
+import math
+import os
+import threading
+from bisect import bisect_right
+from typing import Optional
+
+
+MIN_SECTION_TEMPO = 25.0
+MAX_SECTION_TEMPO = 200.0
+_INF = math.inf
+
+
+def normalize_sections(sections) -> list:
+    """Validate ``sections`` and return them as sorted ``(start, end, tempo)`` tuples.
+
+    Each section is a ``{"start", "end", "tempo"}`` dict or a 3-tuple, with
+    start and end in song seconds and tempo a percentage applied on top of
+    the main tempo. Sections may touch but not overlap.
+    """
+    result = []
+    for section in sections:
+        if isinstance(section, dict):
+            start, end, tempo = section["start"], section["end"], section["tempo"]
+        else:
+            start, end, tempo = section
+        start, end, tempo = float(start), float(end), float(tempo)
+        if not 0 <= start < end:
+            raise ValueError(f"Section {start}-{end}s must start at or after 0 and end after it starts")
+        if not MIN_SECTION_TEMPO <= tempo <= MAX_SECTION_TEMPO:
+            raise ValueError(f"Section tempo must be between {MIN_SECTION_TEMPO:g} and {MAX_SECTION_TEMPO:g}")
+        result.append((start, end, tempo))
+    result.sort()
+    for previous, section in zip(result, result[1:]):
+        if section[0] < previous[1]:
+            raise ValueError(f"Sections {previous[0]}-{previous[1]}s and {section[0]}-{section[1]}s overlap")
+    return result
+
+
+class TimeWarp:
+    """Maps song microseconds to ``perf_counter_ns`` deadlines.
+
+    Not thread-safe: the scheduler thread owns it once playback starts.
+    """
+
+    def __init__(self, tempo: float = 100.0, sections=()):
+        self.tempo = tempo
+        # (from_tempo, start_ns, end_ns); replaced whole like the section table
+        self._ramp = (tempo, 0, 0)
+        self._set_sections(sections)
+        self.anchor(0, 0)
+
+    def _set_sections(self, sections):
+        sections = normalize_sections(sections)
+        starts = [round(start * 1_000_000) for start, _, _ in sections]
+        ends = [round(end * 1_000_000) for _, end, _ in sections]
+        self.sections = sections
+        # One assignment, so section_tempo() is safe to call from other threads
+        self._table = (starts, ends, [tempo for _, _, tempo in sections])
+        self._boundaries = sorted(set(starts) | set(ends))
+
+    def anchor(self, song_us: float, wall_ns: float):
+        """Restart the mapping with ``song_us`` playing at ``wall_ns`` (start, seek)."""
+        self._anchor = (song_us, wall_ns)
+        self._begin_segment(song_us, wall_ns)
+
+    def set_tempo(self, tempo: float, wall_ns: int, ramp_seconds: float = 0.0):
+        """Move the main tempo to ``tempo`` at ``wall_ns``, linearly over ``ramp_seconds``."""
+        song_us = self.song_at(wall_ns)
+        current = self.tempo_at(wall_ns)
+        end_ns = wall_ns + int(ramp_seconds * 1e9) if ramp_seconds > 0 and current != tempo else wall_ns
+        self._ramp = (current, wall_ns, end_ns)
+        self.tempo = tempo
+        self.anchor(song_us, wall_ns)
+
+    def set_sections(self, sections, wall_ns: int):
+        song_us = self.song_at(wall_ns)
+        self._set_sections(sections)
+        self.anchor(song_us, wall_ns)
+
+    def tempo_at(self, wall_ns: float) -> float:
+        """Main tempo (section presets not applied) at ``wall_ns``."""
+        ramp_from, start_ns, end_ns = self._ramp
+        if wall_ns >= end_ns:
+            return self.tempo
+        if wall_ns <= start_ns:
+            return ramp_from
+        return ramp_from + (self.tempo - ramp_from) * (wall_ns - start_ns) / (end_ns - start_ns)
+
+    def section_tempo(self, song_us: float) -> float:
+        """Tempo preset (percent) of the section containing ``song_us``."""
+        starts, ends, tempos = self._table
+        index = bisect_right(starts, song_us) - 1
+        if index >= 0 and song_us < ends[index]:
+            return tempos[index]
+        return 100.0
+
+    def wall_at(self, song_us: float) -> int:
+        """Wall time (ns) at which ``song_us`` plays."""
+        if song_us < self._s0:
+            self._begin_segment(*self._anchor)
+        while song_us >= self._end_s:
+            self._begin_segment(self._end_s, self._end_w)
+        return round(self._wall_in_segment(song_us))
+
+    def song_at(self, wall_ns: float) -> float:
+        """Song position (us) playing at ``wall_ns``."""
+        if wall_ns < self._w0:
+            self._begin_segment(*self._anchor)
+        while wall_ns >= self._end_w:
+            self._begin_segment(self._end_s, self._end_w)
+        return self._song_in_segment(wall_ns)
+
+    def _begin_segment(self, song_us: float, wall_ns: float):
+        # Speed in song us per wall ns is v0 + acc * (wall - w0) until the segment ends;
+        # at 100% main and section tempo it is 1e-3
+        scale = self.section_tempo(song_us) * 1e-7
+        self._s0 = song_us
+        self._w0 = wall_ns
+        self._v0 = self.tempo_at(wall_ns) * scale
+        ramp_from, ramp_start_ns, ramp_end_ns = self._ramp
+        if wall_ns < ramp_end_ns:
+            self._acc = (self.tempo - ramp_from) / (ramp_end_ns - ramp_start_ns) * scale
+            end_w = ramp_end_ns
+            end_s = self._song_in_segment(end_w)
+        else:
+            self._acc = 0.0
+            end_w = end_s = _INF
+
+        index = bisect_right(self._boundaries, song_us)
+        if index < len(self._boundaries) and self._boundaries[index] < end_s:
+            end_s = self._boundaries[index]
+            end_w = self._wall_in_segment(end_s)
+        self._end_s = end_s
+        self._end_w = end_w
+
+    def _song_in_segment(self, wall_ns: float) -> float:
+        elapsed = wall_ns - self._w0
+        if elapsed <= 0:
+            return self._s0
+        return self._s0 + self._v0 * elapsed + 0.5 * self._acc * elapsed * elapsed
+
+    def _wall_in_segment(self, song_us: float) -> float:
+        distance = song_us - self._s0
+        if distance <= 0:
+            return self._w0
+        if self._acc == 0.0:
+            return self._w0 + distance / self._v0
+        # Root of acc/2 * t^2 + v0 * t = distance, in a form that stays exact as acc -> 0
+        return self._w0 + 2 * distance / (self._v0 + math.sqrt(self._v0 * self._v0 + 2 * self._acc * distance))
+
+
+def sections_path(file_path: str) -> str:
+    return f"{file_path}.tempo.json"
+
+
+class TempoPresets:
+    """Per-file section tempo presets, kept in memory and next to each file."""
+
+    def __init__(self):
+        self._sections: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def get(self, file_path: str) -> list:
+        with self._lock:
+            sections = self._sections.get(file_path)
+        if sections is None:
+            sections = self._load(file_path)
+            with self._lock:
+                self._sections[file_path] = sections
+        return sections
+
+    def put(self, file_path: str, sections) -> list:
+        sections = normalize_sections(sections)
+        with self._lock:
+            self._sections[file_path] = sections
+        path = sections_path(file_path)
+        try:
+            if sections:
+                with open(path, "w") as f:
+                    json.dump([{"start": start, "end": end, "tempo": tempo} for start, end, tempo in sections], f)
+            elif os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            print(f"Could not write tempo sections for {file_path}: {e}")
+        return sections
+
+    def forget(self, file_path: Optional[str] = None):
+        with self._lock:
+            if file_path is None:
+                self._sections.clear()
+            else:
+                self._sections.pop(file_path, None)
+
+    def _load(self, file_path: str) -> list:
+        path = sections_path(file_path)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path) as f:
+                return normalize_sections(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring tempo sections for {file_path}: {e}")
+            return []
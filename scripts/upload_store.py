@@ -0,0 +1,161 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+
+
+INDEX_VERSION = 1
+
+
+class UploadStore:
+    """Content-addressed storage for uploaded MIDI files.
+
+    Each distinct file is stored once as ``<root>/blobs/<sha256>.mid``;
+    ``index.json`` maps display names to content hashes. Because a blob's
+    path only depends on its content, metadata and compiled timelines
+    cached for that path stay valid across re-uploads.
+    """
+
+    def __init__(self, root: str = "uploads"):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.index_file = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._names: dict[str, dict] = self._load_index()
+        self._purge_trash()
+
+    def blob_path(self, content_hash: str) -> str:
+        return os.path.join(self.blob_dir, f"{content_hash}.mid")
+
+    def ingest(self, temp_path: str, content_hash: str) -> tuple[str, bool]:
+        """Move a fully received upload into the store.
+
+        Returns ``(blob_path, duplicate)``. When a blob with the same hash
+        already exists the temp file is simply discarded.
+        """
+        path = self.blob_path(content_hash)
+        os.makedirs(self.blob_dir, exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(temp_path)
+            return path, True
+        os.replace(temp_path, path)
+        return path, False
+
+    def discard_blob(self, content_hash: str):
+        """Remove a blob (and its sidecar files) that no name refers to."""
+        with self._lock:
+            if any(entry["hash"] == content_hash for entry in self._names.values()):
+                return
+        path = self.blob_path(content_hash)
+        for candidate in [path] + glob.glob(glob.escape(path) + ".*"):
+            try:
+                os.remove(candidate)
+            except FileNotFoundError:
+                pass
+
+    def add_name(self, name: str, content_hash: str, size: int) -> str:
+        """Record ``name`` for a blob and return the display name used.
+
+        Re-uploading the same content under the same name reuses the entry;
+        a different file with a taken name gets a ``_1``, ``_2``... suffix.
+        """
+        with self._lock:
+            base, ext = os.path.splitext(name)
+            display_name = name
+            counter = 1
+            while display_name in self._names and self._names[display_name]["hash"] != content_hash:
+                display_name = f"{base}_{counter}{ext}"
+                counter += 1
+            self._names[display_name] = {
+                "hash": content_hash,
+                "size": size,
+                "uploaded": time.time(),
+            }
+            self._save_index()
+        return display_name
+
+    def lookup(self, name: str) -> Optional[dict]:
+        """Return ``{"name", "path", "hash", "size"}`` for a display name."""
+        with self._lock:
+            entry = self._names.get(name)
+        if entry is None:
+            return None
+        return {"name": name, "path": self.blob_path(entry["hash"]), "hash": entry["hash"], "size": entry["size"]}
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            return [{"name": name, **entry} for name, entry in self._names.items()]
+
+    def clear(self):
+        """Forget every upload; the old files are deleted in the background."""
+        with self._lock:
+            self._names = {}
+            self._save_index()
+            if os.path.isdir(self.blob_dir):
+                trash = f"{self.blob_dir}.trash-{time.time_ns()}"
+                try:
+                    os.rename(self.blob_dir, trash)
+                except OSError as e:
+                    # On Windows a file that is open or mapped blocks the rename
+                    print(f"Could not move {self.blob_dir} aside ({e}); deleting files one by one")
+                    self._remove_blobs()
+                else:
+                    threading.Thread(target=shutil.rmtree, args=(trash, True), daemon=True).start()
+            os.makedirs(self.blob_dir, exist_ok=True)
+
+    def _remove_blobs(self):
+        for entry in os.listdir(self.blob_dir):
+            path = os.path.join(self.blob_dir, entry)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                print(f"Could not delete {path}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hashes = {entry["hash"] for entry in self._names.values()}
+            return {"names": len(self._names), "blobs": len(hashes)}
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Error loading upload index: {e}. Starting empty.")
+            return {}
+        if index.get("version") != INDEX_VERSION:
+            return {}
+        return {
+            name: entry for name, entry in index.get("files", {}).items()
+            if os.path.exists(self.blob_path(entry["hash"]))
+        }
+
+    def _save_index(self):
+        payload = json.dumps({"version": INDEX_VERSION, "files": self._names}, indent=2)
+        fd, temp_path = tempfile.mkstemp(prefix=".index-", suffix=".tmp", dir=self.root)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(payload)
+            os.replace(temp_path, self.index_file)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _purge_trash(self):
+        prefix = os.path.basename(self.blob_dir) + ".trash-"
+        stale = [
+            os.path.join(self.root, entry) for entry in os.listdir(self.root)
+            if entry.startswith(prefix)
+        ]
+        for path in stale:
+            threading.Thread(target=shutil.rmtree, args=(path, True), daemon=True).start()
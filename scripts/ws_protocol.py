@@ -0,0 +1,155 @@
+"""Compact binary framing for real-time WebSocket telemetry.
+
+Clients opt in at connect time with ``/ws?protocol=binary`` or the
+``robe.binary.v1`` subprotocol; JSON stays the default. A binary frame is
+a 6-byte header (``b"RB"``, version, record count) followed by fixed
+16-byte records::
+
+    kind u8 | note u8 | velocity u8 | key u8 | value u32 | time_us i64
+
+A note record with note ``NOTE_NONE`` (outside the MIDI range) clears the
+current note, the binary form of ``{"type": "current_note", "note": ""}``.
+``decode_record`` turns records back into the JSON message shapes.
+
+Messages without a binary form (status snapshots, echoes, ...) are still
+sent to binary clients as JSON text frames.
+"""
+import struct
+from typing import Optional
+
+
+SUBPROTOCOL = "robe.binary.v1"
+VERSION = 1
+
+HEADER = struct.Struct("<2sBHx")
+RECORD = struct.Struct("<BBBBIq")
+
+KIND_NOTE = 1
+KIND_POSITION = 2
+KIND_STATE = 3
+
+NOTE_NONE = 0xFF
+
+MOD_SHIFT = 1
+MOD_CTRL = 2
+MOD_ALT = 4
+
+STATE_PAUSED = 1
+STATE_RESUMED = 2
+STATE_TEMPO = 3
+STATE_SUSTAIN = 4
+STATE_VELOCITY = 5
+
+_MODIFIER_BITS = {"shift": MOD_SHIFT, "ctrl": MOD_CTRL, "alt": MOD_ALT}
+_STATE_TYPES = {
+    STATE_PAUSED: "playback_paused",
+    STATE_RESUMED: "playback_resumed",
+    STATE_TEMPO: "tempo_change",
+    STATE_SUSTAIN: "sustain_change",
+    STATE_VELOCITY: "velocity_change",
+}
+
+
+def wants_binary(websocket) -> bool:
+    if websocket.query_params.get("protocol") == "binary":
+        return True
+    return SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+
+
+def accepted_subprotocol(websocket) -> Optional[str]:
+    if SUBPROTOCOL in websocket.scope.get("subprotocols", []):
+        return SUBPROTOCOL
+    return None
+
+
+def encode_frame(records: list) -> bytes:
+    return HEADER.pack(b"RB", VERSION, len(records)) + b"".join(records)
+
+
+def decode_frame(frame: bytes) -> list:
+    magic, version, count = HEADER.unpack_from(frame)
+    if magic != b"RB" or version != VERSION:
+        raise ValueError("Not a ROBE binary telemetry frame")
+    return [RECORD.unpack_from(frame, HEADER.size + i * RECORD.size) for i in range(count)]
+
+
+def _time_us(seconds) -> int:
+    return int(round((seconds or 0.0) * 1_000_000))
+
+
+def encode_record(message: dict) -> Optional[bytes]:
+    """Pack one telemetry message, or return None if it has no binary form."""
+    message_type = message.get("type")
+
+    if message_type == "current_note":
+        if "midi_note" not in message and not message.get("note"):
+            return RECORD.pack(KIND_NOTE, NOTE_NONE, 0, 0, 0, _time_us(message.get("time")))
+        modifiers = 0
+        for modifier in message.get("modifiers", ()):
+            modifiers |= _MODIFIER_BITS.get(modifier, 0)
+        key = message.get("key") or ""
+        return RECORD.pack(
+            KIND_NOTE,
+            message.get("midi_note", 0) & 0x7F,
+            message.get("velocity", 0) & 0x7F,
+            ord(key[0]) & 0xFF if key else 0,
+            modifiers,
+            _time_us(message.get("time")),
+        )
+
+    if message_type == "position_update":
+        return RECORD.pack(
+            KIND_POSITION, 0, 0, 0,
+            _time_us(message.get("duration")) // 1000 & 0xFFFFFFFF,
+            _time_us(message.get("position")),
+        )
+
+    state = None
+    value = 0
+    if message_type == "playback_paused":
+        state = STATE_PAUSED
+    elif message_type == "playback_resumed":
+        state = STATE_RESUMED
+    elif message_type == "tempo_change":
+        state = STATE_TEMPO
+        value = int(round(message.get("tempo", 0) * 100))
+    elif message_type == "sustain_change":
+        state = STATE_SUSTAIN
+        value = 1 if message.get("enabled") else 0
+    elif message_type == "velocity_change":
+        state = STATE_VELOCITY
+        value = 1 if message.get("enabled") else 0
+    if state is None:
+        return None
+    return RECORD.pack(KIND_STATE, state, 0, 0, value, 0)
+
+
+def decode_record(record: tuple) -> dict:
+    """Rebuild the message a ``decode_frame`` record was packed from.
+
+    Note records carry only the first character of the key, so ``note``
+    (the display label) is not restored; a ``NOTE_NONE`` record decodes to
+    the empty note that clears the display.
+    """
+    kind, note, velocity, key, value, time_us = record
+    if kind == KIND_NOTE:
+        if note == NOTE_NONE:
+            return {"type": "current_note", "note": ""}
+        return {
+            "type": "current_note",
+            "midi_note": note,
+            "velocity": velocity,
+            "key": chr(key) if key else "",
+            "modifiers": [name for name, bit in _MODIFIER_BITS.items() if value & bit],
+            "time": time_us / 1_000_000,
+        }
+    if kind == KIND_POSITION:
+        return {"type": "position_update", "position": time_us / 1_000_000, "duration": value / 1000}
+    if kind == KIND_STATE:
+        message = {"type": _STATE_TYPES[note]}
+        if note == STATE_TEMPO:
+            message["tempo"] = value / 100
+        elif note in (STATE_SUSTAIN, STATE_VELOCITY):
+            message["enabled"] = bool(value)
+        return message
+    raise ValueError(f"Unknown telemetry record kind {kind}")